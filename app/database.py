@@ -1,7 +1,13 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
 from app.logger_config import logger
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
 
 # Ottieni DATABASE_URL da environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./helpy.db")
@@ -10,22 +16,261 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./helpy.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Configurazione engine
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, "true" if default else "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+# ========== CONFIGURAZIONE ENGINE (da environment) ==========
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Log di tutte le query SQL: solo per debug
+DB_ECHO = _env_flag("DB_ECHO", False)
+
+# Pool di connessioni (ignorato per SQLite in memoria)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Secondi, prima dei timeout lato server/proxy
+# Verifica la connessione prima di usarla (utile con PostgreSQL remoto, inutile con SQLite)
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", not IS_SQLITE)
+
+# PRAGMA applicati a ogni nuova connessione SQLite
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # Letture concorrenti alle scritture
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # Sicuro con WAL, molte meno fsync
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Attende il lock invece di "database is locked"
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
 connect_args = {}
-if "sqlite" in DATABASE_URL:
+engine_options = {"pool_pre_ping": DB_POOL_PRE_PING}
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
+if not IS_SQLITE or make_url(DATABASE_URL).database not in (None, "", ":memory:"):
+    engine_options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
 engine = create_engine(
     DATABASE_URL,
-    echo=True,  # Log SQL queries (metti False in produzione)
-    connect_args=connect_args
+    echo=DB_ECHO,
+    connect_args=connect_args,
+    **engine_options
+)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+
+# ========== ENGINE ASINCRONO ==========
+# Per le route async più frequenti (chat, notifiche, prenotazioni, community):
+# le query non bloccano l'event loop. Stesso database, driver asincrono
+# (aiosqlite / asyncpg) e stesse impostazioni del pool.
+
+def _async_database_url(url: str):
+    """URL con driver asincrono e connect_args relativi (sslmode → ssl per asyncpg)"""
+    async_url = make_url(url)
+    async_connect_args = {}
+    if async_url.drivername.startswith("sqlite"):
+        async_url = async_url.set(drivername="sqlite+aiosqlite")
+    elif async_url.drivername.startswith("postgresql"):
+        async_url = async_url.set(drivername="postgresql+asyncpg")
+        sslmode = async_url.query.get("sslmode")
+        if sslmode:
+            async_url = async_url.difference_update_query(["sslmode"])
+            if sslmode != "disable":
+                async_connect_args["ssl"] = "require" if sslmode in ("allow", "prefer") else sslmode
+    return async_url, async_connect_args
+
+
+ASYNC_DATABASE_URL, async_connect_args = _async_database_url(os.getenv("ASYNC_DATABASE_URL", DATABASE_URL))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=DB_ECHO,
+    connect_args=async_connect_args,
+    **engine_options
 )
 
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+
+@asynccontextmanager
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """
+    Sessione asincrona (async with get_async_session() as session).
+
+    expire_on_commit=False: dopo il commit gli oggetti restano leggibili senza
+    nuove query implicite, che in async non sono permesse. Le funzioni sync
+    esistenti si riusano con await session.run_sync(funzione, ...).
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Dipendenza FastAPI: session: AsyncSession = Depends(get_async_db)"""
+    async with get_async_session() as session:
+        yield session
+
+# ========== SESSIONE PER RICHIESTA ==========
+# Durante una richiesta HTTP RequestSessionMiddleware imposta qui un contenitore:
+# la prima get_session() crea la sessione e quelle annidate (verify_token,
+# notifiche, helper chiamati dentro il blocco della route) usano la stessa
+# connessione, così ogni richiesta occupa al massimo una connessione del pool
+# alla volta. All'uscita dal blocco più esterno la sessione viene chiusa come
+# prima e la connessione torna al pool: tenerla fino a fine richiesta
+# bloccherebbe l'event loop quando il pool è esaurito (le route async attendono
+# il checkout nel thread del loop).
+#
+# Solo il blocco più esterno chiude la transazione. Un blocco annidato riceve
+# una sessione propria sulla stessa connessione, dentro un SAVEPOINT:
+# - un'eccezione annulla solo il savepoint, non le scritture della route;
+# - commit() rilascia il savepoint senza confermare il lavoro ancora in corso
+#   della route; le scritture dell'helper diventano definitive con il commit
+#   della route o, se la route non ne fa, all'uscita senza errori dal blocco
+#   più esterno, ma solo se la route non ha scritture proprie non confermate:
+#   quelle vengono scartate come sempre, e con loro (stessa transazione) anche
+#   le scritture dell'helper.
+# Fuori dalle richieste (scheduler, script) ogni get_session() apre e chiude la
+# propria sessione come prima.
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_session_scope", default=None)
+
+
+class _SavepointSession(Session):
+    """Sessione di un blocco annidato: commit() rilascia il suo savepoint e lo segnala al blocco esterno"""
+
+    def commit(self):
+        super().commit()
+        self.info["committed"] = True
+
+
 @contextmanager
 def get_session():
-    """Context manager per sessione database"""
-    with Session(engine) as session:
+    """Context manager per sessione database (quella della richiesta HTTP, se presente)"""
+    scope = _request_scope.get()
+    if scope is None:
+        with Session(engine) as session:
+            yield session
+        return
+
+    session = scope.get("session")
+    if session is None:
+        session = scope["session"] = _request_session(scope)
+
+    if scope.get("depth", 0) > 0:
+        with _nested_session(scope, session) as nested:
+            yield nested
+        return
+
+    scope["depth"] = 1
+    try:
         yield session
+        # Scritture degli helper ancora da confermare
+        if scope.get("helper_commits") and session.in_transaction():
+            if scope.get("route_writes") or session.new or session.dirty or session.deleted:
+                logger.warning("⚠️ La route non ha fatto commit: scartate anche le scritture degli helper")
+            else:
+                session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        scope["depth"] = 0
+        scope.pop("helper_commits", None)
+        scope.pop("route_writes", None)
+        # Fine del blocco più esterno: oggetti detached e connessione restituita al pool
+        session.close()
+
+
+def _request_session(scope: dict) -> Session:
+    """Sessione della richiesta: segna in scope["route_writes"] le scritture della route non ancora confermate"""
+    session = Session(engine)
+
+    def route_wrote(*args):
+        scope["route_writes"] = True
+
+    def route_executed(orm_execute_state):
+        if not orm_execute_state.is_select:
+            route_wrote()
+
+    def route_committed(*args):
+        scope.pop("route_writes", None)
+        scope.pop("helper_commits", None)
+
+    event.listen(session, "after_flush", route_wrote)
+    event.listen(session, "do_orm_execute", route_executed)
+    event.listen(session, "after_commit", route_committed)
+    return session
+
+
+@contextmanager
+def _nested_session(scope: dict, session: Session):
+    """Sessione in un SAVEPOINT sulla connessione della sessione della richiesta"""
+    # Le modifiche in sospeso della route restano visibili all'helper
+    session.flush()
+    nested = _SavepointSession(bind=session.connection(), join_transaction_mode="create_savepoint")
+    scope["depth"] += 1
+    try:
+        yield nested
+    finally:
+        scope["depth"] -= 1
+        if nested.info.get("committed"):
+            scope["helper_commits"] = True
+        # Annulla ciò che l'helper non ha confermato (tutto, in caso di eccezione)
+        nested.close()
+
+
+def get_db() -> Iterator[Session]:
+    """
+    Dipendenza FastAPI: session: Session = Depends(get_db)
+
+    La sessione resta aperta per tutta la route; gli helper che chiamano
+    get_session() nel frattempo lavorano sulla stessa connessione.
+    """
+    with get_session() as session:
+        yield session
+
+
+class RequestSessionMiddleware:
+    """Middleware ASGI: una sessione database per richiesta HTTP, creata al primo uso e chiusa alla fine"""
+
+    SKIP_PREFIXES = ("/static/", "/uploads/")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # I WebSocket restano aperti a lungo: niente sessione condivisa (terrebbe una connessione)
+        if scope["type"] != "http" or scope["path"].startswith(self.SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        request_scope: dict = {}
+        token = _request_scope.set(request_scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+            session = request_scope.pop("session", None)
+            if session is not None:
+                session.close()
 
 def create_db_and_tables():
     """Crea tutte le tabelle se non esistono"""
@@ -1,27 +1,50 @@
 import os
 from pathlib import Path
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from app.database import create_db_and_tables
-from app.routes import home, auth, consultants, user_profile, messages, community, public_profile, availability, booking, consultation, stripe_webhook, notifications
+from app.database import create_db_and_tables, RequestSessionMiddleware, async_engine
+from app.routes import home, auth, consultants, user_profile, messages, community, public_profile, availability, booking, consultation, stripe_webhook, notifications, push
 from app.logger_config import logger
 from app.scheduler import start_scheduler, shutdown_scheduler
 from app.utils.template_helpers import get_all_categories
 from app.utils_user import get_display_name
+from app.utils.search_backend import setup_search_backend
+from app.utils.category_registry import category_registry
+from app.utils.notification_type_registry import notification_type_registry
+from app.utils.push_hub import setup_push_broker, shutdown_push_broker
+from app.utils.outbound import outbound
+from app.utils.email import close_sendgrid_client
+from app.utils.notification_email import check_email_templates
 
 app = FastAPI(title="Helpy", version="1.0.0")
 
 
 # Middleware per aggiungere categorie globalmente ai template
-class CategoriesMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Carica categorie e le rende disponibili nel request.state
-        request.state.categories = get_all_categories()
-        response = await call_next(request)
-        return response
+class CategoriesMiddleware:
+    """
+    Middleware ASGI puro: mette le categorie (dal registro in memoria) in
+    request.state solo per le pagine HTML. Static, upload, API JSON, webhook e
+    websocket passano direttamente all'app senza lavoro aggiuntivo.
+    """
+
+    SKIP_PREFIXES = ("/static/", "/uploads/", "/api/", "/webhook/")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(self.SKIP_PREFIXES):
+            # Carica categorie e le rende disponibili nel request.state; il
+            # ricaricamento dal database (TTL scaduto, invalidazione) avviene nel threadpool
+            if category_registry.needs_reload():
+                categories = await run_in_threadpool(get_all_categories)
+            else:
+                categories = category_registry.cached()
+            scope.setdefault("state", {})["categories"] = categories
+        await self.app(scope, receive, send)
 
 
 # Session middleware
@@ -34,6 +57,9 @@ app.add_middleware(
 # Aggiungi middleware categorie
 app.add_middleware(CategoriesMiddleware)
 
+# Una sessione database per richiesta (riusata da route, verify_token e helper)
+app.add_middleware(RequestSessionMiddleware)
+
 # Templates
 templates = Jinja2Templates(directory="app/templates")
 # Aggiungi filtro personalizzato per nomi utenti
@@ -62,19 +88,29 @@ app.include_router(booking.router, tags=["booking"])
 app.include_router(consultation.router, tags=["consultation"])
 app.include_router(stripe_webhook.router, tags=["webhooks"])
 app.include_router(notifications.router, tags=["notifications"])
+app.include_router(push.router, tags=["push"])
 
 
 # Database init
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    setup_search_backend()  # Indici full-text (tsvector / FTS5)
+    category_registry.load()  # Categorie in memoria per menu e listing
+    notification_type_registry.load()  # Tipi di notifica in memoria (niente query per ogni notifica)
+    check_email_templates()  # Template email precompilati per ogni tipo di notifica
+    setup_push_broker()  # Eventi push condivisi tra i worker (LISTEN/NOTIFY su PostgreSQL)
     start_scheduler()  # Avvia lo scheduler per le notifiche programmate
     logger.info("✅ Helpy started successfully")
 
 
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
     shutdown_scheduler()  # Ferma lo scheduler in modo pulito
+    shutdown_push_broker()  # Chiude la connessione in LISTEN
+    outbound.shutdown()  # Scarta le chiamate esterne ancora in coda
+    close_sendgrid_client()  # Chiude le connessioni keep-alive verso SendGrid
+    await async_engine.dispose()  # Chiude le connessioni del driver asincrono
     logger.info("👋 Helpy shutting down")
 
 
@@ -1,4 +1,5 @@
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Index
 from datetime import datetime
 from typing import Optional, List
 from decimal import Decimal
@@ -75,12 +76,25 @@ class Conversation(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
+    # Riepilogo denormalizzato (aggiornato in app/utils/conversation_summary.py)
+    last_message_id: Optional[int] = Field(default=None)
+    last_message_preview: Optional[str] = Field(default=None, max_length=200)
+    last_message_at: Optional[datetime] = Field(default=None)
+    last_message_sender_id: Optional[int] = Field(default=None)
+    unread_for_user1: int = Field(default=0)  # Messaggi di user2 non letti da user1
+    unread_for_user2: int = Field(default=0)  # Messaggi di user1 non letti da user2
+    message_count: int = Field(default=0)
+    
     # ✅ Relationship con Message
     messages: List["Message"] = Relationship(back_populates="conversation")
 
 class Message(SQLModel, table=True):
     """Messaggi nelle conversazioni"""
     __tablename__ = "messages"
+    __table_args__ = (
+        # Paginazione a cursore (since_id / before_id) per conversazione
+        Index("idx_messages_conversation_id_id", "conversation_id", "id"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     conversation_id: int = Field(foreign_key="conversations.id", index=True)
@@ -157,6 +171,10 @@ class CommunityContact(SQLModel, table=True):
 class AvailabilityBlock(SQLModel, table=True):
     """Blocchi di disponibilità per consulenze"""
     __tablename__ = "availability_block"
+    __table_args__ = (
+        # Blocchi prenotabili di un consulente per giorno o periodo (intervalli su date)
+        Index("idx_availability_block_user_date_active_status", "user_id", "date", "is_active", "status"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
@@ -170,9 +188,44 @@ class AvailabilityBlock(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class AvailabilityRule(SQLModel, table=True):
+    """Disponibilità ricorrente settimanale: espansa negli slot al momento della richiesta, senza righe per giorno"""
+    __tablename__ = "availability_rule"
+    __table_args__ = (
+        Index("idx_availability_rule_user_weekday", "user_id", "weekday"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    weekday: int  # 0 = lunedì ... 6 = domenica
+    start_time: str  # Formato "HH:MM"
+    end_time: str    # Formato "HH:MM"
+    valid_from: Optional[datetime] = None   # Primo giorno di validità (incluso)
+    valid_until: Optional[datetime] = None  # Ultimo giorno di validità (incluso)
+    is_active: bool = Field(default=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AvailabilityException(SQLModel, table=True):
+    """Giorni in cui le regole ricorrenti non valgono (ferie, impegni)"""
+    __tablename__ = "availability_exception"
+    __table_args__ = (
+        Index("idx_availability_exception_user_date", "user_id", "date"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    date: datetime  # Giorno escluso
+    reason: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 class Booking(SQLModel, table=True):
     """Prenotazioni di consulenze tra clienti e consulenti"""
     __tablename__ = "booking"
+    __table_args__ = (
+        # Prenotazioni di un consulente per giorno o periodo, filtrate per stato
+        Index("idx_booking_consultant_date_status", "consultant_user_id", "booking_date", "status"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     client_user_id: int = Field(foreign_key="user.id", index=True)
@@ -291,3 +344,40 @@ class NotificationType(SQLModel, table=True):
     is_active: bool = Field(default=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EmailOutbox(SQLModel, table=True):
+    """
+    Email in attesa di invio (outbox).
+
+    Le notifiche scrivono qui l'email nella stessa transazione della riga
+    Notification; il worker in background (app/utils/email_outbox.py) la invia
+    con SendGrid, con retry e backoff. idempotency_key impedisce di accodare
+    due volte la stessa email (es. job del promemoria rieseguito).
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # Email da inviare: stato + prossimo tentativo
+        Index("idx_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    idempotency_key: str = Field(unique=True, index=True)
+    
+    # Destinatario e contenuto (template renderizzato al momento dell'invio)
+    to_email: str
+    to_name: Optional[str] = None
+    subject: str
+    template_name: str  # Nome template (es: 'reminder_1h.html')
+    template_data: str = Field(default="{}")  # Variabili del template in JSON
+    notification_id: Optional[int] = Field(default=None, foreign_key="notifications.id")
+    
+    # Stato di invio
+    status: str = Field(default="pending")  # pending, sending, sent, failed
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)  # Per 'sending': scadenza del claim
+    claim_token: Optional[str] = Field(default=None, index=True)  # Worker che sta inviando
+    last_error: Optional[str] = None
+    
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
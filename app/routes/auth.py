@@ -7,7 +7,8 @@ import time
 import hashlib
 from typing import Optional
 from app.logger_config import logger
-from app.utils.email import generate_verification_code  # ✅ RIMUOVI send_verification_email da qui
+from app.utils.email import generate_verification_code, send_with_sendgrid  # ✅ RIMUOVI send_verification_email da qui
+from app.utils.user_cache import user_cache
 import os
 import smtplib
 from email.mime.text import MIMEText
@@ -15,7 +16,6 @@ from email.mime.multipart import MIMEMultipart
 from loguru import logger
 import jwt
 from datetime import datetime, timedelta
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 
 router = APIRouter()
@@ -23,25 +23,36 @@ router = APIRouter()
 def verify_token(request: Request) -> Optional[User]:
     """
     Verifica token JWT e restituisce utente autenticato
+
+    L'utente arriva dalla cache degli utenti (app/utils/user_cache.py) e il
+    risultato resta in request.state: più chiamate nella stessa richiesta
+    (route, dipendenze) non ripetono decodifica e lookup.
     """
+    memo_key = (request.session.get("access_token"), request.session.get("user_id"))
+    memo = getattr(request.state, "auth_user", None)
+    if memo is not None and memo[0] == memo_key:
+        return memo[1]
+    
+    user = _authenticate(request)
+    request.state.auth_user = (memo_key, user)
+    return user
+
+
+def _authenticate(request: Request) -> Optional[User]:
     try:
         # ✅ Leggi token dalla sessione
         token = request.session.get("access_token")
         
         if not token:
-            logger.warning("⚠️ No access_token in session")
-            logger.debug(f"Session keys: {list(request.session.keys())}")
-            
             # Fallback: controlla se c'è user_id nella sessione (sessione senza JWT)
             user_id = request.session.get("user_id")
             if user_id:
-                logger.info(f"🔄 Fallback: Found user_id in session: {user_id}")
-                with get_session() as session:
-                    user = session.get(User, user_id)
-                    if user:
-                        logger.info(f"✅ User authenticated via session fallback: {user.nome} (ID: {user.id})")
-                        return user
+                user = user_cache.get(user_id)
+                if user:
+                    logger.debug(f"✅ User authenticated via session fallback: {user.nome} (ID: {user.id})")
+                    return user
             
+            logger.debug("No access_token in session")
             return None
         
         # Decodifica JWT
@@ -61,31 +72,27 @@ def verify_token(request: Request) -> Optional[User]:
             logger.warning(f"⚠️ Invalid token: {e}")
             return None
         
-        # ✅ Ottieni utente dal database
-        with get_session() as session:
-            user = session.get(User, user_id)
-            
-            if not user:
-                logger.warning(f"⚠️ User {user_id} not found in database")
-                return None
-            
-            logger.info(f"✅ User authenticated: {user.nome} (ID: {user.id})")
-            return user
+        # ✅ Ottieni utente (cache con TTL, database solo se scaduto)
+        user = user_cache.get(user_id)
+        
+        if not user:
+            logger.warning(f"⚠️ User {user_id} not found in database")
+            return None
+        
+        logger.debug(f"✅ User authenticated: {user.nome} (ID: {user.id})")
+        return user
     
     except Exception as e:
         logger.error(f"Error verifying token: {e}", exc_info=True)
         return None
 
-# Alias per compatibilità
+# Alias per compatibilità, usabile anche come dipendenza: Depends(get_current_user)
 def get_current_user(request: Request) -> Optional[User]:
     """Alias di verify_token"""
     return verify_token(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="Non autenticato")
-    return user
 
 @router.post("/login")
-async def login(
+def login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...)
@@ -124,7 +131,7 @@ async def login(
         return RedirectResponse(url="/profile", status_code=303)
 
 @router.post("/api/login")
-async def api_login(
+def api_login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...)
@@ -186,7 +193,7 @@ async def api_login(
         )
 
 @router.post("/api/register")
-async def api_register(
+def api_register(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
@@ -263,7 +270,7 @@ async def api_register(
         )
 
 @router.post("/api/verify-email")
-async def verify_email(
+def verify_email(
     request: Request,
     email: str = Form(...),
     code: str = Form(...)
@@ -304,7 +311,7 @@ async def verify_email(
         return JSONResponse({"error": "Errore durante la verifica"}, status_code=500)
 
 @router.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
+def login_page(request: Request):
     """Pagina di login"""
     return request.app.state.templates.TemplateResponse(
         "login.html",
@@ -312,7 +319,7 @@ async def login_page(request: Request):
     )
 
 @router.post("/api/resend-verification")
-async def resend_verification(
+def resend_verification(
     request: Request,
     email: str = Form(...)
 ):
@@ -343,7 +350,7 @@ async def resend_verification(
         return JSONResponse({"error": "Errore. Riprova."}, status_code=500)
 
 @router.post("/register")
-async def register(
+def register(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
@@ -380,7 +387,7 @@ async def register(
         return RedirectResponse("/login?registered=true", status_code=302)
 
 @router.get("/logout")
-async def logout(request: Request):
+def logout(request: Request):
     """Logout utente"""
     request.session.clear()
     return RedirectResponse("/", status_code=302)
@@ -389,7 +396,7 @@ async def logout(request: Request):
 # ========== RESET PASSWORD ROUTES ==========
 
 @router.get("/reset-password", response_class=HTMLResponse)
-async def reset_password_page(request: Request):
+def reset_password_page(request: Request):
     """Pagina reset password"""
     return request.app.state.templates.TemplateResponse(
         "reset_password.html",
@@ -397,7 +404,7 @@ async def reset_password_page(request: Request):
     )
 
 @router.post("/api/request-password-reset")
-async def request_password_reset(
+def request_password_reset(
     request: Request,
     email: str = Form(...)
 ):
@@ -432,7 +439,7 @@ async def request_password_reset(
         return JSONResponse({"error": "Errore. Riprova."}, status_code=500)
 
 @router.get("/register", response_class=HTMLResponse)
-async def register_page(request: Request):
+def register_page(request: Request):
     """Pagina di registrazione"""
     current_user = verify_token(request)
     
@@ -446,7 +453,7 @@ async def register_page(request: Request):
 
 
 @router.post("/api/reset-password")
-async def reset_password(
+def reset_password(
     request: Request,
     email: str = Form(...),
     code: str = Form(...),
@@ -645,13 +652,12 @@ def send_verification_email(to_email: str, code: str, nome: str = "User") -> boo
         logger.info("📤 STEP 3: Invio via SendGrid API...")
         
         try:
-            sg = SendGridAPIClient(api_key)
-            response = sg.send(message)
+            response = send_with_sendgrid(api_key, message)
             
             logger.info(f"✅ STEP 3: Email inviata!")
             logger.info(f"   ├─ Status Code: {response.status_code}")
             logger.info(f"   ├─ Headers: {dict(response.headers)}")
-            logger.info(f"   └─ Body: {response.body}")
+            logger.info(f"   └─ Body: {response.text}")
             
             logger.info("=" * 80)
             logger.info("🎉 EMAIL INVIATA CON SUCCESSO!")
@@ -686,7 +692,7 @@ def send_verification_email(to_email: str, code: str, nome: str = "User") -> boo
 # ...existing code (verify_token, login, etc)...
 
 @router.post("/api/register")
-async def api_register(
+def api_register(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
@@ -763,7 +769,7 @@ async def api_register(
         )
 
 @router.post("/api/verify-email")
-async def verify_email(
+def verify_email(
     request: Request,
     email: str = Form(...),
     code: str = Form(...)
@@ -804,7 +810,7 @@ async def verify_email(
         return JSONResponse({"error": "Errore durante la verifica"}, status_code=500)
 
 @router.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
+def login_page(request: Request):
     """Pagina di login"""
     return request.app.state.templates.TemplateResponse(
         "login.html",
@@ -812,7 +818,7 @@ async def login_page(request: Request):
     )
 
 @router.post("/api/resend-verification")
-async def resend_verification(
+def resend_verification(
     request: Request,
     email: str = Form(...)
 ):
@@ -843,7 +849,7 @@ async def resend_verification(
         return JSONResponse({"error": "Errore. Riprova."}, status_code=500)
 
 @router.post("/register")
-async def register(
+def register(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
@@ -880,7 +886,7 @@ async def register(
         return RedirectResponse("/login?registered=true", status_code=302)
 
 @router.get("/logout")
-async def logout(request: Request):
+def logout(request: Request):
     """Logout utente"""
     request.session.clear()
     return RedirectResponse("/", status_code=302)
@@ -889,7 +895,7 @@ async def logout(request: Request):
 # ========== RESET PASSWORD ROUTES ==========
 
 @router.get("/reset-password", response_class=HTMLResponse)
-async def reset_password_page(request: Request):
+def reset_password_page(request: Request):
     """Pagina reset password"""
     return request.app.state.templates.TemplateResponse(
         "reset_password.html",
@@ -897,7 +903,7 @@ async def reset_password_page(request: Request):
     )
 
 @router.post("/api/request-password-reset")
-async def request_password_reset(
+def request_password_reset(
     request: Request,
     email: str = Form(...)
 ):
@@ -932,7 +938,7 @@ async def request_password_reset(
         return JSONResponse({"error": "Errore. Riprova."}, status_code=500)
 
 @router.get("/register", response_class=HTMLResponse)
-async def register_page(request: Request):
+def register_page(request: Request):
     """Pagina di registrazione"""
     current_user = verify_token(request)
     
@@ -946,7 +952,7 @@ async def register_page(request: Request):
 
 
 @router.post("/api/reset-password")
-async def reset_password(
+def reset_password(
     request: Request,
     email: str = Form(...),
     code: str = Form(...),
@@ -1145,13 +1151,12 @@ def send_verification_email(to_email: str, code: str, nome: str = "User") -> boo
         logger.info("📤 STEP 3: Invio via SendGrid API...")
         
         try:
-            sg = SendGridAPIClient(api_key)
-            response = sg.send(message)
+            response = send_with_sendgrid(api_key, message)
             
             logger.info(f"✅ STEP 3: Email inviata!")
             logger.info(f"   ├─ Status Code: {response.status_code}")
             logger.info(f"   ├─ Headers: {dict(response.headers)}")
-            logger.info(f"   └─ Body: {response.body}")
+            logger.info(f"   └─ Body: {response.text}")
             
             logger.info("=" * 80)
             logger.info("🎉 EMAIL INVIATA CON SUCCESSO!")
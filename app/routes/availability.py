@@ -2,14 +2,17 @@
 from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select, func
+from sqlalchemy import delete, insert, or_
+from sqlmodel import select
 from datetime import datetime, timedelta, date, time
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
 import logging
 
-from app.database import engine
-from app.models import User, AvailabilityBlock
+from app.database import get_session
+from app.models import User, AvailabilityBlock, AvailabilityException, AvailabilityRule
 from app.routes.auth import verify_token
+from app.utils.date_filters import on_day, parse_day
+from app.utils.slot_cache import mark_days_changed
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -32,10 +35,66 @@ def format_time_field(time_value) -> str:
     else:
         # Fallback: converti a stringa
         return str(time_value)[:5]
+
+
+def replace_day_blocks(
+    session,
+    user_id: int,
+    days: Iterable[date],
+    blocks: Iterable[Tuple[str, str, int]]
+) -> int:
+    """
+    Sostituisce i blocchi dell'utente nei giorni indicati con gli stessi blocchi
+    (start_time, end_time, total_minutes), senza commit.
+
+    Un solo DELETE per tutti i giorni e un solo INSERT multiplo per tutti i
+    blocchi: copiare una settimana tipo su tre mesi non fa più una SELECT e
+    un DELETE per giorno e un INSERT per blocco.
+
+    Returns:
+        Blocchi inseriti
+    """
+    days = sorted(set(days))
+    blocks = list(blocks)
+    if not days:
+        return 0
+
+    table = AvailabilityBlock.__table__
+    session.execute(
+        delete(table).where(
+            table.c.user_id == user_id,
+            or_(*(on_day(table.c.date, day) for day in days))
+        )
+    )
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "date": datetime.combine(day, time()),
+            "start_time": start_time,
+            "end_time": end_time,
+            "total_minutes": total_minutes,
+            "booked_minutes": 0,
+            "status": "available",
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now
+        }
+        for day in days
+        for start_time, end_time, total_minutes in blocks
+    ]
+    if rows:
+        session.execute(insert(table), rows)
+
+    # Scritture Core: niente eventi ORM, la cache degli slot va avvisata qui
+    mark_days_changed(session, [(user_id, day) for day in days])
+    return len(rows)
+
 logger = logging.getLogger(__name__)
 
 @router.get("/availability", response_class=HTMLResponse)
-async def availability_page(request: Request):
+def availability_page(request: Request):
     """Pagina gestione disponibilità"""
     user = verify_token(request)
     if not user:
@@ -50,8 +109,177 @@ async def availability_page(request: Request):
         "current_user": user
     })
 
+# ========== DISPONIBILITÀ RICORRENTE ==========
+# Definite prima di /api/availability/{date_str}, che altrimenti catturerebbe /rules
+
+def parse_time_field(value: str) -> str:
+    """Orario HH:MM normalizzato (ValueError se non valido)"""
+    return datetime.strptime(value.strip(), "%H:%M").strftime("%H:%M")
+
+
+def format_rule(rule: AvailabilityRule) -> dict:
+    return {
+        "id": rule.id,
+        "weekday": rule.weekday,
+        "start_time": rule.start_time,
+        "end_time": rule.end_time,
+        "valid_from": rule.valid_from.strftime("%Y-%m-%d") if rule.valid_from else None,
+        "valid_until": rule.valid_until.strftime("%Y-%m-%d") if rule.valid_until else None
+    }
+
+
+@router.get("/api/availability/rules")
+def get_availability_rules(request: Request):
+    """Regole settimanali ed eccezioni (da oggi in poi) dell'utente corrente"""
+    user = verify_token(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non autorizzato")
+    
+    today = datetime.combine(date.today(), time())
+    with get_session() as session:
+        rules = session.exec(
+            select(AvailabilityRule)
+            .where(AvailabilityRule.user_id == user.id, AvailabilityRule.is_active == True)
+            .order_by(AvailabilityRule.weekday, AvailabilityRule.start_time)
+        ).all()
+        exceptions = session.exec(
+            select(AvailabilityException)
+            .where(AvailabilityException.user_id == user.id, AvailabilityException.date >= today)
+            .order_by(AvailabilityException.date)
+        ).all()
+        
+        return JSONResponse({
+            "success": True,
+            "rules": [format_rule(rule) for rule in rules],
+            "exceptions": [
+                {"id": exception.id, "date": exception.date.strftime("%Y-%m-%d"), "reason": exception.reason}
+                for exception in exceptions
+            ]
+        })
+
+@router.post("/api/availability/rules")
+def create_availability_rule(
+    request: Request,
+    weekday: int = Form(...),  # 0 = lunedì ... 6 = domenica
+    start_time: str = Form(...),
+    end_time: str = Form(...),
+    valid_from: Optional[str] = Form(None),
+    valid_until: Optional[str] = Form(None)
+):
+    """Aggiunge una fascia oraria ricorrente ogni settimana nel giorno indicato"""
+    user = verify_token(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non autorizzato")
+    
+    if weekday not in range(7):
+        raise HTTPException(status_code=400, detail="Giorno della settimana non valido (0 = lunedì ... 6 = domenica)")
+    
+    try:
+        start_time = parse_time_field(start_time)
+        end_time = parse_time_field(end_time)
+        first_day = parse_day(valid_from) if valid_from else None
+        last_day = parse_day(valid_until) if valid_until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato non valido (orari HH:MM, date YYYY-MM-DD)")
+    
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="L'orario di fine deve seguire quello di inizio")
+    if first_day and last_day and last_day < first_day:
+        raise HTTPException(status_code=400, detail="La data di fine precede quella di inizio")
+    
+    with get_session() as session:
+        rule = AvailabilityRule(
+            user_id=user.id,
+            weekday=weekday,
+            start_time=start_time,
+            end_time=end_time,
+            valid_from=datetime.combine(first_day, time()) if first_day else None,
+            valid_until=datetime.combine(last_day, time()) if last_day else None
+        )
+        session.add(rule)
+        session.commit()
+        session.refresh(rule)
+        logger.info(f"🔁 Availability rule {rule.id} for user {user.id}: weekday {weekday} {start_time}-{end_time}")
+        
+        return JSONResponse({"success": True, "rule": format_rule(rule)})
+
+@router.delete("/api/availability/rules/{rule_id}")
+def delete_availability_rule(request: Request, rule_id: int):
+    """Elimina una regola settimanale"""
+    user = verify_token(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non autorizzato")
+    
+    with get_session() as session:
+        rule = session.get(AvailabilityRule, rule_id)
+        if not rule or rule.user_id != user.id:
+            raise HTTPException(status_code=404, detail="Regola non trovata")
+        
+        session.delete(rule)
+        session.commit()
+        
+        return JSONResponse({"success": True, "message": "Regola eliminata"})
+
+@router.post("/api/availability/exceptions")
+def create_availability_exception(
+    request: Request,
+    date: str = Form(...),
+    reason: Optional[str] = Form(None)
+):
+    """Esclude un giorno dalle regole settimanali (ferie, impegni)"""
+    user = verify_token(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non autorizzato")
+    
+    try:
+        target_date = parse_day(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato data non valido")
+    
+    with get_session() as session:
+        exception = session.exec(
+            select(AvailabilityException).where(
+                AvailabilityException.user_id == user.id,
+                on_day(AvailabilityException.date, target_date)
+            )
+        ).first()
+        
+        if not exception:
+            exception = AvailabilityException(
+                user_id=user.id,
+                date=datetime.combine(target_date, time()),
+                reason=reason
+            )
+            session.add(exception)
+            session.commit()
+            session.refresh(exception)
+        
+        return JSONResponse({
+            "success": True,
+            "exception": {"id": exception.id, "date": target_date.strftime("%Y-%m-%d"), "reason": exception.reason}
+        })
+
+@router.delete("/api/availability/exceptions/{exception_id}")
+def delete_availability_exception(request: Request, exception_id: int):
+    """Riattiva le regole settimanali nel giorno dell'eccezione"""
+    user = verify_token(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Non autorizzato")
+    
+    with get_session() as session:
+        exception = session.get(AvailabilityException, exception_id)
+        if not exception or exception.user_id != user.id:
+            raise HTTPException(status_code=404, detail="Eccezione non trovata")
+        
+        session.delete(exception)
+        session.commit()
+        
+        return JSONResponse({"success": True, "message": "Eccezione eliminata"})
+
+# ========== DISPONIBILITÀ PER GIORNO ==========
+
 @router.get("/api/availability/{date_str}")
-async def get_availability_by_date(
+def get_availability_by_date(
     request: Request, 
     date_str: str,
     user_id: Optional[int] = None
@@ -70,11 +298,11 @@ async def get_availability_by_date(
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato data non valido")
     
-    with Session(engine) as session:
-        # Usa confronto con cast a DATE per SQLite compatibility
+    with get_session() as session:
+        # Intervallo sul giorno (usa l'indice, vedi app/utils/date_filters.py)
         statement = select(AvailabilityBlock).where(
             AvailabilityBlock.user_id == target_user_id,
-            func.date(AvailabilityBlock.date) == date_str,
+            on_day(AvailabilityBlock.date, target_date),
             AvailabilityBlock.is_active == True
         ).order_by(AvailabilityBlock.start_time)
         
@@ -97,7 +325,7 @@ async def get_availability_by_date(
         })
 
 @router.post("/api/availability/save")
-async def save_availability(
+def save_availability(
     request: Request,
     date: str = Form(...),
     blocks: str = Form(...)  # JSON string con array di blocchi
@@ -112,43 +340,28 @@ async def save_availability(
         target_date = datetime.strptime(date, "%Y-%m-%d").date()
         blocks_data = json.loads(blocks)
         
-        with Session(engine) as session:
-            # Rimuovi blocchi esistenti per quella data
-            existing = session.exec(
-                select(AvailabilityBlock).where(
-                    AvailabilityBlock.user_id == user.id,
-                    func.date(AvailabilityBlock.date) == date
-                )
-            ).all()
+        # Blocchi validi (durata positiva)
+        new_blocks = []
+        for block_data in blocks_data:
+            start_time = block_data["start_time"]
+            end_time = block_data["end_time"]
             
-            for block in existing:
-                session.delete(block)
+            # Calcola durata in minuti
+            start_parts = list(map(int, start_time.split(":")))
+            end_parts = list(map(int, end_time.split(":")))
+            start_minutes = start_parts[0] * 60 + start_parts[1]
+            end_minutes = end_parts[0] * 60 + end_parts[1]
+            total_minutes = end_minutes - start_minutes
             
-            # Crea nuovi blocchi
-            for block_data in blocks_data:
-                start_time = block_data["start_time"]
-                end_time = block_data["end_time"]
-                
-                # Calcola durata in minuti
-                start_parts = list(map(int, start_time.split(":")))
-                end_parts = list(map(int, end_time.split(":")))
-                start_minutes = start_parts[0] * 60 + start_parts[1]
-                end_minutes = end_parts[0] * 60 + end_parts[1]
-                total_minutes = end_minutes - start_minutes
-                
-                if total_minutes <= 0:
-                    continue
-                
-                new_block = AvailabilityBlock(
-                    user_id=user.id,
-                    date=target_date,
-                    start_time=start_time,
-                    end_time=end_time,
-                    total_minutes=total_minutes,
-                    status="available"
-                )
-                session.add(new_block)
-                logger.info(f"💾 Saving block: date={target_date} (type: {type(target_date)}), time={start_time}-{end_time}")
+            if total_minutes <= 0:
+                continue
+            
+            new_blocks.append((start_time, end_time, total_minutes))
+            logger.info(f"💾 Saving block: date={target_date}, time={start_time}-{end_time}")
+        
+        with get_session() as session:
+            # Sostituisci i blocchi esistenti per quella data
+            replace_day_blocks(session, user.id, [target_date], new_blocks)
             
             session.commit()
             logger.info(f"✅ Saved {len(blocks_data)} availability blocks for user {user.id} on {date}")
@@ -163,7 +376,7 @@ async def save_availability(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/availability/copy")
-async def copy_availability(
+def copy_availability(
     request: Request,
     source_date: str = Form(...),
     target_dates: str = Form(...)  # JSON array di date target
@@ -177,12 +390,12 @@ async def copy_availability(
         import json
         target_dates_list = json.loads(target_dates)
         
-        with Session(engine) as session:
+        with get_session() as session:
             # Ottieni blocchi dalla data sorgente
             source_blocks = session.exec(
                 select(AvailabilityBlock).where(
                     AvailabilityBlock.user_id == user.id,
-                    func.date(AvailabilityBlock.date) == source_date,
+                    on_day(AvailabilityBlock.date, source_date),
                     AvailabilityBlock.is_active == True
                 )
             ).all()
@@ -193,34 +406,15 @@ async def copy_availability(
                     "message": "Nessuna disponibilità trovata nella data sorgente"
                 })
             
-            copied_count = 0
+            target_days = [parse_day(target_date_str) for target_date_str in target_dates_list]
             
-            for target_date_str in target_dates_list:
-                target_date = datetime.strptime(target_date_str, "%Y-%m-%d").date()
-                
-                # Rimuovi blocchi esistenti
-                existing = session.exec(
-                    select(AvailabilityBlock).where(
-                        AvailabilityBlock.user_id == user.id,
-                        func.date(AvailabilityBlock.date) == target_date_str
-                    )
-                ).all()
-                
-                for block in existing:
-                    session.delete(block)
-                
-                # Copia blocchi
-                for source_block in source_blocks:
-                    new_block = AvailabilityBlock(
-                        user_id=user.id,
-                        date=target_date,
-                        start_time=source_block.start_time,
-                        end_time=source_block.end_time,
-                        total_minutes=source_block.total_minutes,
-                        status="available"
-                    )
-                    session.add(new_block)
-                    copied_count += 1
+            # Un DELETE e un INSERT per tutte le date target
+            copied_count = replace_day_blocks(
+                session,
+                user.id,
+                target_days,
+                [(block.start_time, block.end_time, block.total_minutes) for block in source_blocks]
+            )
             
             session.commit()
             logger.info(f"✅ Copied availability from {source_date} to {len(target_dates_list)} dates")
@@ -235,13 +429,13 @@ async def copy_availability(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/api/availability/block/{block_id}")
-async def delete_availability_block(request: Request, block_id: int):
+def delete_availability_block(request: Request, block_id: int):
     """Elimina un blocco di disponibilità"""
     user = verify_token(request)
     if not user:
         raise HTTPException(status_code=401, detail="Non autorizzato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         block = session.get(AvailabilityBlock, block_id)
         
         if not block or block.user_id != user.id:
@@ -1,15 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select, func
-from datetime import datetime, timedelta, time
-from typing import Optional, List, Dict, Union
+from sqlmodel import select
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict
 from zoneinfo import ZoneInfo
-from app.database import engine
-from app.models import Booking, User, AvailabilityBlock
+from app.database import get_session, get_async_session
+from app.models import Booking, User, AvailabilityBlock, AvailabilityException, AvailabilityRule
 from app.routes.auth import get_current_user
+from app.utils.availability_rules import rule_blocks_by_day
+from app.utils.date_filters import between_days, on_day, parse_day
+from app.utils.slot_cache import DayAvailability, slot_cache
 from app.utils.agora_recording import start_recording, stop_recording, get_recording_url
 from app.logger_config import logger
+from app.utils.push_hub import publish_to_user
+from app.utils.slot_engine import SLOT_DURATIONS
 from app.utils.stripe_config import create_checkout_session
 
 router = APIRouter()
@@ -18,115 +23,95 @@ templates = Jinja2Templates(directory="app/templates")
 # Timezone italiano
 ITALY_TZ = ZoneInfo("Europe/Rome")
 
+# Giorni massimi per una richiesta di slot su un periodo (un mese più la settimana a cavallo)
+MAX_SLOT_RANGE_DAYS = 62
+
 # ========== UTILITÀ ==========
 
-def parse_time_to_minutes(time_input: Union[str, time]) -> int:
-    """Converte una stringa HH:MM o un oggetto time in minuti dalla mezzanotte"""
-    if isinstance(time_input, time):
-        # Se è già un oggetto time, usa hour e minute
-        return time_input.hour * 60 + time_input.minute
-    # Se è una stringa, fai il parsing
-    hours, minutes = map(int, time_input.split(':'))
-    return hours * 60 + minutes
+async def load_users_by_id(session, user_ids) -> Dict[int, User]:
+    """Utenti per ID con una sola query (sessione asincrona)"""
+    ids = {user_id for user_id in user_ids if user_id}
+    if not ids:
+        return {}
+    users = (await session.exec(select(User).where(User.id.in_(ids)))).all()
+    return {user.id: user for user in users}
 
-def minutes_to_time(minutes: int) -> str:
-    """Converte minuti dalla mezzanotte in stringa HH:MM"""
-    hours = minutes // 60
-    mins = minutes % 60
-    return f"{hours:02d}:{mins:02d}"
 
-def calculate_available_slots(
-    availability_blocks: List[AvailabilityBlock],
-    existing_bookings: List[Booking],
-    duration_minutes: int,
-    date_str: str
-) -> List[Dict]:
+def load_day_availability(session, consultant_id: int, first_day: date, last_day: date) -> Dict[date, DayAvailability]:
     """
-    Calcola gli slot disponibili per una data e durata specificata.
+    Blocchi, prenotazioni e slot di un consulente per ogni giorno di un periodo.
     
-    Args:
-        availability_blocks: Blocchi di disponibilità del consulente
-        existing_bookings: Prenotazioni già esistenti
-        duration_minutes: Durata desiderata (30, 60, 90, 120)
-        date_str: Data in formato "YYYY-MM-DD"
+    I giorni in cache non fanno query; per quelli mancanti blocchi, regole
+    ricorrenti (con le eccezioni) e prenotazioni sull'intervallo che li
+    contiene, poi vanno in cache (anche quelli senza disponibilità).
     
-    Returns:
-        Lista di slot disponibili con start_time e end_time
+    Args:
+        session: Sessione database
+        consultant_id: ID del consulente
+        first_day: Primo giorno
+        last_day: Ultimo giorno (incluso)
     """
-    available_slots = []
+    days: Dict[date, Optional[DayAvailability]] = {}
+    day = first_day
+    while day <= last_day:
+        days[day] = slot_cache.get(consultant_id, day)
+        day += timedelta(days=1)
     
-    # Determina l'ora minima per la data odierna (timezone italiano)
-    now_italy = datetime.now(ITALY_TZ)
-    today = now_italy.date()
-    target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    current_time_minutes = None
-    
-    if target_date == today:
-        # Se è oggi, calcola i minuti dall'inizio della giornata
-        current_time_minutes = now_italy.hour * 60 + now_italy.minute
-    
-    for block in availability_blocks:
-        # Converti start_time e end_time in minuti
-        block_start = parse_time_to_minutes(block.start_time)
-        block_end = parse_time_to_minutes(block.end_time)
-        
-        # Se è oggi, non mostrare slot già passati
-        if current_time_minutes is not None:
-            # Lo slot deve iniziare almeno ora corrente + 5 minuti (buffer)
-            min_start_time = current_time_minutes + 5
-            if block_end <= min_start_time:
-                # Tutto il blocco è nel passato, saltalo
-                continue
-            # Aggiorna il block_start se parte del blocco è nel passato
-            if block_start < min_start_time:
-                # Arrotonda al prossimo slot di 30 minuti
-                block_start = ((min_start_time + 29) // 30) * 30
-        
-        # Crea lista di intervalli occupati in questo blocco
-        occupied_intervals = []
-        for booking in existing_bookings:
-            if booking.availability_block_id == block.id or (
-                booking.booking_date.strftime('%Y-%m-%d') == date_str and
-                booking.status not in ['cancelled', 'no_show']
-            ):
-                booking_start = parse_time_to_minutes(booking.start_time)
-                booking_end = parse_time_to_minutes(booking.end_time)
-                occupied_intervals.append((booking_start, booking_end))
-        
-        # Ordina gli intervalli occupati
-        occupied_intervals.sort()
-        
-        # Calcola slot disponibili
-        current_time = block_start
-        
-        for occupied_start, occupied_end in occupied_intervals:
-            # C'è spazio prima di questo intervallo occupato?
-            while current_time + duration_minutes <= occupied_start:
-                available_slots.append({
-                    'start_time': minutes_to_time(current_time),
-                    'end_time': minutes_to_time(current_time + duration_minutes),
-                    'availability_block_id': block.id
-                })
-                current_time += 30  # Incremento di 30 minuti per slot successivo
-            
-            # Salta l'intervallo occupato
-            current_time = max(current_time, occupied_end)
-        
-        # Slot disponibili dopo l'ultimo intervallo occupato
-        while current_time + duration_minutes <= block_end:
-            available_slots.append({
-                'start_time': minutes_to_time(current_time),
-                'end_time': minutes_to_time(current_time + duration_minutes),
-                'availability_block_id': block.id
-            })
-            current_time += 30
+    missing = [day for day, entry in days.items() if entry is None]
+    if missing:
+        version = slot_cache.version()
+        
+        blocks_by_day: Dict[date, List[AvailabilityBlock]] = {}
+        for block in session.exec(
+            select(AvailabilityBlock)
+            .where(AvailabilityBlock.user_id == consultant_id)
+            .where(between_days(AvailabilityBlock.date, missing[0], missing[-1]))
+            .where(AvailabilityBlock.is_active == True)
+            .where(AvailabilityBlock.status == "available")
+        ).all():
+            blocks_by_day.setdefault(parse_day(block.date), []).append(block)
+        
+        # Regole settimanali nei giorni senza blocchi salvati (eccezioni escluse)
+        rules = session.exec(
+            select(AvailabilityRule)
+            .where(AvailabilityRule.user_id == consultant_id)
+            .where(AvailabilityRule.is_active == True)
+        ).all()
+        if rules:
+            exception_days = {
+                parse_day(exception_date)
+                for exception_date in session.exec(
+                    select(AvailabilityException.date)
+                    .where(AvailabilityException.user_id == consultant_id)
+                    .where(between_days(AvailabilityException.date, missing[0], missing[-1]))
+                ).all()
+            }
+            blocks_by_day.update(rule_blocks_by_day(
+                rules, exception_days, [day for day in missing if day not in blocks_by_day]
+            ))
+        
+        # Senza blocchi non servono le prenotazioni
+        bookings_by_day: Dict[date, List[Booking]] = {}
+        if blocks_by_day:
+            for booking in session.exec(
+                select(Booking)
+                .where(Booking.consultant_user_id == consultant_id)
+                .where(between_days(Booking.booking_date, missing[0], missing[-1]))
+                .where(Booking.status.in_(['pending', 'confirmed']))
+            ).all():
+                bookings_by_day.setdefault(parse_day(booking.booking_date), []).append(booking)
+        
+        for day in missing:
+            days[day] = slot_cache.put(
+                consultant_id, day, blocks_by_day.get(day, []), bookings_by_day.get(day, []), version
+            )
     
-    return available_slots
+    return days
 
 # ========== PAGINA PRENOTAZIONE ==========
 
 @router.get("/book/{consultant_id}", response_class=HTMLResponse, name="booking_page")
-async def booking_page(
+def booking_page(
     request: Request,
     consultant_id: int
 ):
@@ -139,7 +124,7 @@ async def booking_page(
             "error": "Devi effettuare il login per prenotare una consulenza"
         })
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Prendi i dati del consulente
         consultant = session.get(User, consultant_id)
         if not consultant:
@@ -159,7 +144,7 @@ async def booking_page(
 # ========== API ENDPOINTS ==========
 
 @router.get("/api/booking/available-slots/{consultant_id}")
-async def get_available_slots(
+def get_available_slots(
     consultant_id: int,
     date: str,
     duration: int
@@ -176,7 +161,7 @@ async def get_available_slots(
     if duration not in [30, 60, 90, 120]:
         raise HTTPException(status_code=400, detail="Durata non valida. Valori ammessi: 30, 60, 90, 120")
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Verifica che il consulente esista
         consultant = session.get(User, consultant_id)
         if not consultant:
@@ -193,39 +178,16 @@ async def get_available_slots(
         if target_date < today_italy:
             raise HTTPException(status_code=400, detail="Non puoi prenotare nel passato")
         
-        # Prendi i blocchi di disponibilità per quella data
-        availability_blocks = session.exec(
-            select(AvailabilityBlock)
-            .where(func.date(AvailabilityBlock.date) == date)
-            .where(AvailabilityBlock.user_id == consultant_id)
-            .where(AvailabilityBlock.is_active == True)
-            .where(AvailabilityBlock.status == "available")
-        ).all()
+        # Blocchi e prenotazioni di quella data (dalla cache se già calcolati)
+        availability = load_day_availability(session, consultant_id, target_date, target_date)[target_date]
         
-        # DEBUG: Log dei blocchi trovati
-        print(f"🔍 DEBUG - Date: {date}, Consultant: {consultant_id}")
-        print(f"📅 Blocchi trovati: {len(availability_blocks)}")
-        for block in availability_blocks:
-            print(f"   Block ID {block.id}: {block.start_time} - {block.end_time} (status: {block.status}, active: {block.is_active})")
+        logger.debug(f"📅 {len(availability.blocks)} blocchi per il consulente {consultant_id} il {date}")
         
-        if not availability_blocks:
+        if not availability.blocks:
             return {"slots": [], "message": "Il consulente non è disponibile in questa data"}
         
-        # Prendi le prenotazioni esistenti per quella data
-        existing_bookings = session.exec(
-            select(Booking)
-            .where(func.date(Booking.booking_date) == date)
-            .where(Booking.consultant_user_id == consultant_id)
-            .where(Booking.status.in_(['pending', 'confirmed']))
-        ).all()
-        
-        # Calcola gli slot disponibili
-        available_slots = calculate_available_slots(
-            availability_blocks,
-            existing_bookings,
-            duration,
-            date
-        )
+        # Slot disponibili (timezone italiano: se è oggi niente slot passati)
+        available_slots = availability.slots_for((duration,), datetime.now(ITALY_TZ))[duration]
         
         return {
             "slots": available_slots,
@@ -239,8 +201,69 @@ async def get_available_slots(
             "duration_minutes": duration
         }
 
+
+@router.get("/api/booking/available-slots/{consultant_id}/range")
+def get_available_slots_range(
+    consultant_id: int,
+    start: str,
+    end: str
+):
+    """
+    Restituisce gli slot disponibili di un consulente per ogni giorno di un periodo
+    e per tutte le durate (es. un mese intero per il calendario).
+    
+    Poche query per tutto il periodo (solo per i giorni non in cache), poi
+    il calcolo giorno per giorno in memoria: il calendario non fa più una
+    richiesta per ogni giorno.
+    
+    Args:
+        consultant_id: ID del consulente
+        start: Primo giorno in formato YYYY-MM-DD
+        end: Ultimo giorno (incluso) in formato YYYY-MM-DD
+    """
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato data non valido. Usa YYYY-MM-DD")
+    
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="La data di fine precede quella di inizio")
+    
+    if (end_date - start_date).days + 1 > MAX_SLOT_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Periodo troppo lungo (massimo {MAX_SLOT_RANGE_DAYS} giorni)")
+    
+    # I giorni passati non sono prenotabili (timezone italiano)
+    now_italy = datetime.now(ITALY_TZ)
+    start_date = max(start_date, now_italy.date())
+    
+    with get_session() as session:
+        # Verifica che il consulente esista
+        consultant = session.get(User, consultant_id)
+        if not consultant:
+            raise HTTPException(status_code=404, detail="Consulente non trovato")
+        
+        # Tutti i giorni del periodo, anche quelli senza disponibilità
+        days = {}
+        if start_date <= end_date:
+            for day, availability in load_day_availability(session, consultant_id, start_date, end_date).items():
+                days[day.strftime('%Y-%m-%d')] = availability.slots_for(SLOT_DURATIONS, now_italy)
+        
+        return {
+            "days": days,
+            "consultant": {
+                "id": consultant.id,
+                "nome": consultant.nome,
+                "cognome": consultant.cognome,
+                "prezzo": consultant.prezzo_consulenza
+            },
+            "start": start,
+            "end": end,
+            "durations": list(SLOT_DURATIONS)
+        }
+
 @router.post("/api/booking/create")
-async def create_booking(
+def create_booking(
     request: Request,
     booking_data: dict
 ):
@@ -284,7 +307,7 @@ async def create_booking(
     if current_user.id == consultant_id:
         raise HTTPException(status_code=400, detail="Non puoi prenotare con te stesso")
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Verifica che il consulente esista
         consultant = session.get(User, consultant_id)
         if not consultant:
@@ -299,8 +322,8 @@ async def create_booking(
         # Verifica che lo slot sia ancora disponibile (prevenzione double booking)
         existing_booking = session.exec(
             select(Booking)
-            .where(func.date(Booking.booking_date) == booking_date_str)
             .where(Booking.consultant_user_id == consultant_id)
+            .where(on_day(Booking.booking_date, booking_date))
             .where(Booking.start_time == start_time)
             .where(Booking.status.in_(['pending', 'confirmed']))
         ).first()
@@ -361,34 +384,40 @@ async def create_booking(
 
 @router.get("/api/booking/my-bookings")
 async def get_my_bookings(
-    request: Request
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user)
 ):
     """Restituisce tutte le prenotazioni dell'utente corrente (come cliente o consulente)"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    async with get_async_session() as session:
         # Prenotazioni come cliente (solo quelle pagate)
-        bookings_as_client = session.exec(
+        bookings_as_client = (await session.exec(
             select(Booking)
             .where(Booking.client_user_id == current_user.id)
             .where(Booking.payment_status == 'paid')
             .order_by(Booking.booking_date.desc())
-        ).all()
+        )).all()
         
         # Prenotazioni come consulente (solo quelle pagate)
-        bookings_as_consultant = session.exec(
+        bookings_as_consultant = (await session.exec(
             select(Booking)
             .where(Booking.consultant_user_id == current_user.id)
             .where(Booking.payment_status == 'paid')
             .order_by(Booking.booking_date.desc())
-        ).all()
+        )).all()
+        
+        # Controparti caricate in una sola query
+        other_users = await load_users_by_id(session, (
+            [b.consultant_user_id for b in bookings_as_client] +
+            [b.client_user_id for b in bookings_as_consultant]
+        ))
         
         # Formatta i risultati
         def format_booking(booking: Booking, role: str):
             other_user_id = booking.consultant_user_id if role == 'client' else booking.client_user_id
-            other_user = session.get(User, other_user_id)
+            other_user = other_users.get(other_user_id)
             
             return {
                 "id": booking.id,
@@ -416,13 +445,12 @@ async def get_my_bookings(
         }
 
 @router.get("/api/booking/upcoming")
-async def get_upcoming_bookings(request: Request):
+async def get_upcoming_bookings(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Ottiene i prossimi 3 appuntamenti futuri dell'utente"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    async with get_async_session() as session:
         # Usa datetime.now() per l'ora locale
         now = datetime.now()
         
@@ -433,7 +461,13 @@ async def get_upcoming_bookings(request: Request):
             Booking.payment_status == 'paid'
         ).order_by(Booking.booking_date, Booking.start_time)
         
-        bookings = session.exec(statement).all()
+        bookings = (await session.exec(statement)).all()
+        
+        # Controparti caricate in una sola query
+        other_users = await load_users_by_id(session, [
+            b.consultant_user_id if b.client_user_id == current_user.id else b.client_user_id
+            for b in bookings
+        ])
         
         upcoming = []
         for booking in bookings:
@@ -466,7 +500,7 @@ async def get_upcoming_bookings(request: Request):
             
             # Ottieni i dati dell'altra persona
             other_user_id = booking.consultant_user_id if is_client else booking.client_user_id
-            other_user = session.get(User, other_user_id)
+            other_user = other_users.get(other_user_id)
             
             # Determina lo stato per l'UI
             can_join = time_until <= 10 and time_until >= -10  # Da 10 min prima a 10 min dopo inizio
@@ -500,14 +534,13 @@ async def get_upcoming_bookings(request: Request):
         return {"bookings": upcoming}
 
 @router.post("/api/booking/{booking_id}/join")
-async def join_booking(booking_id: int, request: Request):
+async def join_booking(booking_id: int, request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Segna che l'utente ha cliccato 'Partecipa' per un appuntamento"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
-        booking = session.get(Booking, booking_id)
+    async with get_async_session() as session:
+        booking = await session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
         
@@ -528,13 +561,21 @@ async def join_booking(booking_id: int, request: Request):
         
         booking.updated_at = now
         session.add(booking)
-        session.commit()
-        session.refresh(booking)
+        await session.commit()
+        await session.refresh(booking)
         
         # Controlla se entrambi hanno joinato
         client_joined = booking.client_joined_at is not None
         consultant_joined = booking.consultant_joined_at is not None
         
+        # 📡 Avvisa l'altro partecipante (la sua lista appuntamenti si aggiorna da sola)
+        other_user_id = booking.consultant_user_id if is_client else booking.client_user_id
+        publish_to_user(
+            other_user_id, "booking_join",
+            booking_id=booking.id,
+            can_start_call=client_joined and consultant_joined
+        )
+        
         return {
             "success": True,
             "has_joined": True,
@@ -543,7 +584,7 @@ async def join_booking(booking_id: int, request: Request):
         }
 
 @router.get("/api/booking/{booking_id}/agora-token")
-async def get_agora_token(booking_id: int, request: Request):
+def get_agora_token(booking_id: int, request: Request):
     """Genera un token Agora per accedere alla video call"""
     from app.utils.agora_token import generate_booking_call_token
     
@@ -551,7 +592,7 @@ async def get_agora_token(booking_id: int, request: Request):
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -598,13 +639,13 @@ async def get_agora_token(booking_id: int, request: Request):
             raise HTTPException(status_code=500, detail=f"Errore generazione token: {str(e)}")
 
 @router.get("/booking/call/{booking_id}")
-async def call_page(booking_id: int, request: Request):
+def call_page(booking_id: int, request: Request):
     """Pagina placeholder per la call"""
     current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -620,7 +661,7 @@ async def call_page(booking_id: int, request: Request):
         })
 
 @router.delete("/api/booking/cancel/{booking_id}")
-async def cancel_booking(
+def cancel_booking(
     booking_id: int,
     request: Request,
     reason: Optional[str] = None
@@ -630,7 +671,7 @@ async def cancel_booking(
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -661,13 +702,13 @@ async def cancel_booking(
 # ========== CLOUD RECORDING ENDPOINTS ==========
 
 @router.post("/api/booking/{booking_id}/recording/start")
-async def start_booking_recording(booking_id: int, request: Request):
+def start_booking_recording(booking_id: int, request: Request):
     """Avvia la registrazione cloud per una prenotazione"""
     current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -715,13 +756,13 @@ async def start_booking_recording(booking_id: int, request: Request):
         }
 
 @router.post("/api/booking/{booking_id}/recording/stop")
-async def stop_booking_recording(booking_id: int, request: Request):
+def stop_booking_recording(booking_id: int, request: Request):
     """Ferma la registrazione cloud"""
     current_user = get_current_user(request)
     if not current_user:
         # Se chiamato da sendBeacon, potrebbe non avere la sessione
         # Tentiamo comunque di fermare la registrazione
-        with Session(engine) as session:
+        with get_session() as session:
             booking = session.get(Booking, booking_id)
             if booking and booking.recording_status == "recording":
                 # Ferma senza autenticazione (emergenza)
@@ -755,7 +796,7 @@ async def stop_booking_recording(booking_id: int, request: Request):
         
         return {"success": True, "message": "Recording stop tentato"}
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -811,13 +852,13 @@ async def stop_booking_recording(booking_id: int, request: Request):
         }
 
 @router.get("/api/booking/{booking_id}/recording")
-async def get_booking_recording(booking_id: int, request: Request):
+def get_booking_recording(booking_id: int, request: Request):
     """Ottiene info sulla registrazione"""
     current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    with get_session() as session:
         booking = session.get(Booking, booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Prenotazione non trovata")
@@ -837,7 +878,7 @@ async def get_booking_recording(booking_id: int, request: Request):
         }
 
 @router.get("/booking/success", response_class=HTMLResponse)
-async def booking_success(request: Request):
+def booking_success(request: Request):
     """Payment success page"""
     current_user = get_current_user(request)
     return templates.TemplateResponse("booking_success.html", {
@@ -847,7 +888,7 @@ async def booking_success(request: Request):
     })
 
 @router.get("/booking/cancel", response_class=HTMLResponse)
-async def booking_cancel(request: Request, offer_id: Optional[int] = None):
+def booking_cancel(request: Request, offer_id: Optional[int] = None):
     """Payment cancelled page"""
     current_user = get_current_user(request)
     back_url = f"/consulenza/prenota/{offer_id}" if offer_id else "/profile"
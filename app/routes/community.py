@@ -1,20 +1,24 @@
-from fastapi import APIRouter, Request, Form, Query, HTTPException
+from fastapi import APIRouter, Depends, Request, Form, Query, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
+from sqlalchemy import update
 from sqlmodel import select, func, or_, and_
 from typing import Optional
 from datetime import datetime, timedelta
 import os
 
-from app.database import get_session
-from app.models import User, Category, CommunityQuestion, CommunityLike, CommunityContact, QuestionStatus
-from app.routes.auth import verify_token
+from app.database import get_session, get_async_session
+from app.models import User, CommunityQuestion, CommunityLike, CommunityContact, QuestionStatus
+from app.routes.auth import get_current_user, verify_token
+from app.routes.consultants import clean_search_query
+from app.utils.category_registry import category_registry
+from app.utils.search_backend import get_search_backend
 from app.utils_user import get_display_name
 from loguru import logger
 
 router = APIRouter()
 
 @router.get("/community", response_class=HTMLResponse)
-async def community_page(
+def community_page(
     request: Request,
     category: Optional[int] = Query(None),
     search: Optional[str] = Query(None),
@@ -35,63 +39,63 @@ async def community_page(
         
         with get_session() as session:
             # ========== CARICA CATEGORIE ==========
-            categories = session.exec(
-                select(Category).order_by(Category.name)
-            ).all()
-            
-            # ========== BASE QUERY ==========
-            query_stmt = select(CommunityQuestion).order_by(
-                CommunityQuestion.created_at.desc()
-            )
+            categories = category_registry.all()
             
-            # ========== FILTRO CATEGORIA ==========
-            if category:
-                query_stmt = query_stmt.where(CommunityQuestion.category_id == category)
-            
-            # ========== FILTRO STATUS ==========
-            if status and status in ['open', 'in_progress', 'closed']:
-                query_stmt = query_stmt.where(CommunityQuestion.status == status)
+            per_page = 10
+            offset = (page - 1) * per_page
             
-            # ========== RICERCA ==========
             if search:
-                search_pattern = f"%{search}%"
-                query_stmt = query_stmt.where(
-                    or_(
-                        CommunityQuestion.title.ilike(search_pattern),
-                        CommunityQuestion.description.ilike(search_pattern)
-                    )
+                # ========== RICERCA FULL-TEXT ==========
+                # Match, filtri e paginazione nel backend di ricerca (tsvector / FTS5)
+                keywords = clean_search_query(search) or [search.strip()]
+                question_ids, total_count = get_search_backend().search_questions(
+                    keywords,
+                    category=category,
+                    status=status,
+                    offset=offset,
+                    limit=per_page
                 )
-            
-            # ========== COUNT TOTALE ==========
-            count_query = select(func.count(CommunityQuestion.id))
-            
-            if category:
-                count_query = count_query.where(CommunityQuestion.category_id == category)
-            
-            if status:
-                count_query = count_query.where(CommunityQuestion.status == status)
-            
-            if search:
-                search_pattern = f"%{search}%"
-                count_query = count_query.where(
-                    or_(
-                        CommunityQuestion.title.ilike(search_pattern),
-                        CommunityQuestion.description.ilike(search_pattern)
-                    )
+                
+                questions_by_id = {}
+                if question_ids:
+                    questions_by_id = {
+                        question.id: question
+                        for question in session.exec(
+                            select(CommunityQuestion).where(CommunityQuestion.id.in_(question_ids))
+                        ).all()
+                    }
+                questions = [questions_by_id[qid] for qid in question_ids if qid in questions_by_id]
+            else:
+                # ========== BASE QUERY ==========
+                query_stmt = select(CommunityQuestion).order_by(
+                    CommunityQuestion.created_at.desc()
                 )
-            
-            total_count = session.exec(count_query).one()
+                
+                # ========== FILTRO CATEGORIA ==========
+                if category:
+                    query_stmt = query_stmt.where(CommunityQuestion.category_id == category)
+                
+                # ========== FILTRO STATUS ==========
+                if status and status in ['open', 'in_progress', 'closed']:
+                    query_stmt = query_stmt.where(CommunityQuestion.status == status)
+                
+                # ========== COUNT TOTALE ==========
+                count_query = select(func.count(CommunityQuestion.id))
+                
+                if category:
+                    count_query = count_query.where(CommunityQuestion.category_id == category)
+                
+                if status:
+                    count_query = count_query.where(CommunityQuestion.status == status)
+                
+                total_count = session.exec(count_query).one()
+                
+                # ========== ESEGUI QUERY ==========
+                questions = session.exec(query_stmt.offset(offset).limit(per_page)).all()
             
             # ========== PAGINAZIONE ==========
-            per_page = 10
-            offset = (page - 1) * per_page
             total_pages = max(1, (total_count + per_page - 1) // per_page)
             
-            query_stmt = query_stmt.offset(offset).limit(per_page)
-            
-            # ========== ESEGUI QUERY ==========
-            questions = session.exec(query_stmt).all()
-            
             # ========== CARICA LIKES UTENTE ==========
             # Se l'utente è loggato, carica tutti i suoi like per mostrare quali domande ha già likato
             user_liked_questions = set()
@@ -110,10 +114,8 @@ async def community_page(
                 # Carica autore
                 author = session.get(User, question.user_id)
                 
-                # Carica categoria
-                cat = None
-                if question.category_id:
-                    cat = session.get(Category, question.category_id)
+                # Categoria dal registro in memoria
+                cat = category_registry.get(question.category_id)
                 
                 # Trova consulenti suggeriti (solo se è la domanda dell'utente loggato)
                 suggested_consultants = []
@@ -228,8 +230,7 @@ async def community_page(
         logger.error(f"❌ Error loading community page: {e}", exc_info=True)
         
         try:
-            with get_session() as session:
-                categories = session.exec(select(Category).order_by(Category.name)).all()
+            categories = category_registry.all()
         except:
             categories = []
         
@@ -251,7 +252,7 @@ async def community_page(
         )
 
 @router.post("/api/community/ask")
-async def api_ask_question(
+def api_ask_question(
     request: Request,
     title: str = Form(...),
     description: str = Form(...),
@@ -320,17 +321,23 @@ async def increment_view(question_id: int):
     """Incrementa counter visualizzazioni"""
     
     try:
-        with get_session() as session:
-            question = session.get(CommunityQuestion, question_id)
-            
-            if not question:
+        async with get_async_session() as session:
+            # UPDATE atomico: le visite concorrenti non si sovrascrivono
+            result = await session.execute(
+                update(CommunityQuestion)
+                .where(CommunityQuestion.id == question_id)
+                .values(views=CommunityQuestion.views + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if not result.rowcount:
                 return JSONResponse({"error": "Domanda non trovata"}, status_code=404)
+            await session.commit()
             
-            question.increment_views()
-            session.add(question)
-            session.commit()
+            views = (await session.exec(
+                select(CommunityQuestion.views).where(CommunityQuestion.id == question_id)
+            )).one()
             
-            return JSONResponse({"success": True, "views": question.views})
+            return JSONResponse({"success": True, "views": views})
     
     except Exception as e:
         logger.error(f"Error incrementing view: {e}")
@@ -338,7 +345,7 @@ async def increment_view(question_id: int):
 
 
 @router.post("/api/community/{question_id}/like")
-async def toggle_like(request: Request, question_id: int):
+async def toggle_like(request: Request, question_id: int, current_user: Optional[User] = Depends(get_current_user)):
     """
     Mette o toglie like a una domanda della community.
     Un utente può mettere un solo like per domanda.
@@ -346,30 +353,29 @@ async def toggle_like(request: Request, question_id: int):
     """
     
     try:
-        # Verifica autenticazione
-        current_user = verify_token(request)
+        # Verifica autenticazione (dipendenza sync: l'eventuale lookup gira nel threadpool)
         if not current_user:
             return JSONResponse({"error": "Non autenticato"}, status_code=401)
         
-        with get_session() as session:
+        async with get_async_session() as session:
             # Verifica che la domanda esista
-            question = session.get(CommunityQuestion, question_id)
+            question = await session.get(CommunityQuestion, question_id)
             if not question:
                 return JSONResponse({"error": "Domanda non trovata"}, status_code=404)
             
             # Verifica se l'utente ha già messo like
-            existing_like = session.exec(
+            existing_like = (await session.exec(
                 select(CommunityLike).where(
                     and_(
                         CommunityLike.question_id == question_id,
                         CommunityLike.user_id == current_user.id
                     )
                 )
-            ).first()
+            )).first()
             
             if existing_like:
                 # ❌ Rimuovi like (toggle off)
-                session.delete(existing_like)
+                await session.delete(existing_like)
                 question.upvotes = max(0, question.upvotes - 1)
                 action = "removed"
                 logger.info(f"❌ User {current_user.id} removed like from question {question_id}")
@@ -385,7 +391,7 @@ async def toggle_like(request: Request, question_id: int):
                 logger.info(f"✅ User {current_user.id} liked question {question_id}")
             
             session.add(question)
-            session.commit()
+            await session.commit()
             
             return JSONResponse({
                 "success": True,
@@ -400,32 +406,31 @@ async def toggle_like(request: Request, question_id: int):
 
 
 @router.post("/api/community/{question_id}/contact")
-async def track_contact(request: Request, question_id: int):
+async def track_contact(request: Request, question_id: int, current_user: Optional[User] = Depends(get_current_user)):
     """
     Traccia quando un utente clicca sul tasto 'Messaggia'.
     Ogni utente può incrementare il contatore una sola volta per domanda.
     """
     try:
-        # Verifica utente loggato
-        current_user = verify_token(request)
+        # Verifica utente loggato (dipendenza sync: l'eventuale lookup gira nel threadpool)
         if not current_user:
             return JSONResponse({"error": "Non autenticato"}, status_code=401)
         
-        with get_session() as session:
+        async with get_async_session() as session:
             # Trova la domanda
-            question = session.get(CommunityQuestion, question_id)
+            question = await session.get(CommunityQuestion, question_id)
             if not question:
                 return JSONResponse({"error": "Domanda non trovata"}, status_code=404)
             
             # Verifica se l'utente ha già contattato (per incrementare counter solo prima volta)
-            existing_contact = session.exec(
+            existing_contact = (await session.exec(
                 select(CommunityContact).where(
                     and_(
                         CommunityContact.question_id == question_id,
                         CommunityContact.user_id == current_user.id
                     )
                 )
-            ).first()
+            )).first()
             
             if not existing_contact:
                 # Crea nuovo contatto e incrementa counter (SOLO PRIMA VOLTA)
@@ -436,7 +441,7 @@ async def track_contact(request: Request, question_id: int):
                 session.add(new_contact)
                 question.views += 1
                 session.add(question)
-                session.commit()
+                await session.commit()
                 
                 logger.info(f"✅ User {current_user.id} contacted author of question {question_id} (first time)")
                 
@@ -5,8 +5,10 @@ from typing import Optional
 import re
 
 from app.database import get_session
-from app.models import User, Category
+from app.models import User
 from app.routes.auth import verify_token
+from app.utils.category_registry import category_registry
+from app.utils.search_backend import get_search_backend
 from loguru import logger
 
 router = APIRouter()
@@ -131,7 +133,7 @@ def calculate_relevance_score(user: User, keywords: list[str], expanded_keywords
     return score
 
 @router.get("/consultants", response_class=HTMLResponse)
-async def consultants_page(
+def consultants_page(
     request: Request,
     category: Optional[int] = Query(None),
     search: Optional[str] = Query(None),
@@ -147,23 +149,10 @@ async def consultants_page(
         
         with get_session() as session:
             # ========== CARICA CATEGORIE ==========
-            categories = session.exec(
-                select(Category).order_by(Category.name)
-            ).all()
+            categories = category_registry.all()
             
-            # ========== BASE QUERY ==========
-            query_stmt = select(User)
-            
-            # ========== FILTRO CATEGORIA ==========
-            if category:
-                query_stmt = query_stmt.where(User.category_id == category)
-            
-            # ========== FILTRO PREZZO ==========
-            if min_price is not None and min_price >= 10:
-                query_stmt = query_stmt.where(User.prezzo_consulenza >= min_price)
-            
-            if max_price is not None and max_price >= 10:
-                query_stmt = query_stmt.where(User.prezzo_consulenza <= max_price)
+            per_page = 12
+            offset = (page - 1) * per_page
             
             # ========== RICERCA INTELLIGENTE CON SKILL MATCHING ==========
             keywords = []
@@ -178,62 +167,54 @@ async def consultants_page(
                     f"   Keywords: {keywords}\n"
                     f"   Expanded: {expanded_keywords[:15]}..."  # Primi 15 per brevità
                 )
-                
-                if expanded_keywords:
-                    search_conditions = []
-                    
-                    for keyword in expanded_keywords:
-                        keyword_pattern = f"%{keyword}%"
-                        
-                        search_conditions.append(
-                            or_(
-                                User.nome.ilike(keyword_pattern),
-                                User.cognome.ilike(keyword_pattern),
-                                User.professione.ilike(keyword_pattern),
-                                User.descrizione.ilike(keyword_pattern),
-                                and_(
-                                    User.aree_interesse.isnot(None),
-                                    User.aree_interesse.ilike(keyword_pattern)
-                                )
-                                # ✅ Rimosso blocco macro_aree
-                            )
-                        )
-                    
-                    query_stmt = query_stmt.where(or_(*search_conditions))
-            
-            # ========== ESEGUI QUERY (senza paginazione per scoring) ==========
-            all_results = session.exec(query_stmt).all()
             
-            # ========== SCORING E ORDINAMENTO ==========
-            if search and keywords:
-                # Calcola score per ogni risultato
-                scored_results = [
-                    (user, calculate_relevance_score(user, keywords, expanded_keywords))
-                    for user in all_results
-                ]
+            if keywords:
+                # ========== RICERCA FULL-TEXT ==========
+                # Match, ranking e paginazione avvengono nel backend di ricerca:
+                # dal database si caricano soltanto gli utenti della pagina corrente
+                page_ids, total_count = get_search_backend().search_users(
+                    keywords,
+                    expanded_keywords,
+                    category=category,
+                    min_price=min_price if min_price is not None and min_price >= 10 else None,
+                    max_price=max_price if max_price is not None and max_price >= 10 else None,
+                    offset=offset,
+                    limit=per_page
+                )
+                
+                users_by_id = {}
+                if page_ids:
+                    users_by_id = {
+                        user.id: user
+                        for user in session.exec(select(User).where(User.id.in_(page_ids))).all()
+                    }
+                consultants = [users_by_id[user_id] for user_id in page_ids if user_id in users_by_id]
+            else:
+                # ========== BASE QUERY ==========
+                query_stmt = select(User)
                 
-                # Ordina per score decrescente
-                scored_results.sort(key=lambda x: x[1], reverse=True)
+                # ========== FILTRO CATEGORIA ==========
+                if category:
+                    query_stmt = query_stmt.where(User.category_id == category)
                 
-                # Log top 5 scores
-                logger.info("🏆 Top 5 scores:")
-                for user, score in scored_results[:5]:
-                    logger.info(f"   {user.nome} {user.cognome}: {score:.1f} pts")
+                # ========== FILTRO PREZZO ==========
+                if min_price is not None and min_price >= 10:
+                    query_stmt = query_stmt.where(User.prezzo_consulenza >= min_price)
                 
-                # Estrai solo gli utenti ordinati
-                consultants = [user for user, _ in scored_results]
-            else:
-                consultants = all_results
-            
-            total_count = len(consultants)
+                if max_price is not None and max_price >= 10:
+                    query_stmt = query_stmt.where(User.prezzo_consulenza <= max_price)
+                
+                # ========== COUNT E PAGINAZIONE IN SQL ==========
+                total_count = session.exec(
+                    select(func.count()).select_from(query_stmt.subquery())
+                ).one()
+                
+                consultants = session.exec(
+                    query_stmt.order_by(User.id).offset(offset).limit(per_page)
+                ).all()
             
-            # ========== PAGINAZIONE ==========
-            per_page = 12
-            offset = (page - 1) * per_page
             total_pages = max(1, (total_count + per_page - 1) // per_page)
             
-            consultants = consultants[offset:offset + per_page]
-            
             # ========== ENRICHMENT DATI ==========
             enriched_consultants = []
             for user in consultants:
@@ -246,14 +227,9 @@ async def consultants_page(
                     'prezzo_consulenza': user.prezzo_consulenza,
                     'bollini': user.bollini,
                     'consulenze_vendute': user.consulenze_vendute,
-                    'category': None
+                    'category': category_registry.get(user.category_id)
                 }
                 
-                if user.category_id:
-                    cat = session.get(Category, user.category_id)
-                    if cat:
-                        user_data['category'] = cat
-                
                 enriched_consultants.append(user_data)
             
             logger.info(
@@ -284,8 +260,7 @@ async def consultants_page(
         logger.error(f"❌ Error loading consultants page: {e}", exc_info=True)
         
         try:
-            with get_session() as session:
-                categories = session.exec(select(Category).order_by(Category.name)).all()
+            categories = category_registry.all()
         except:
             categories = []
         
@@ -1,28 +1,32 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, status, Form
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from pydantic import BaseModel
+from sqlmodel import select
 from datetime import datetime, timedelta
 from typing import Optional
 from decimal import Decimal
 
-from ..database import engine
+from ..database import get_session
+from ..logger_config import logger
 from ..models import User, ConsultationOffer, Message
 from .auth import get_current_user
+from ..utils.conversation_summary import record_new_message
+from ..utils.push_hub import publish_to_user
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
 @router.get("/consulenza/crea/{client_user_id}", response_class=HTMLResponse)
-async def show_create_consultation_form(
+def show_create_consultation_form(
     request: Request,
     client_user_id: int,
     user: User = Depends(get_current_user)
 ):
     """Show form for consultant to create a consultation offer"""
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Verify current user is a consultant
         if user.category_id != 2:
             raise HTTPException(status_code=403, detail="Solo i consulenti possono creare offerte di consulenza")
@@ -52,7 +56,7 @@ async def show_create_consultation_form(
 
 
 @router.post("/consulenza/crea/{client_user_id}")
-async def create_consultation_offer(
+def create_consultation_offer(
     request: Request,
     client_user_id: int,
     price: float = Form(...),
@@ -62,7 +66,7 @@ async def create_consultation_offer(
 ):
     """Create a new consultation offer and send automated message"""
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Verify current user is a consultant
         if user.category_id != 2:
             raise HTTPException(status_code=403, detail="Solo i consulenti possono creare offerte di consulenza")
@@ -152,12 +156,21 @@ _Questa offerta scade il {new_offer.expires_at.strftime('%d/%m/%Y alle %H:%M')}_
         )
         session.add(system_message)
         
-        # Update conversation timestamp
-        conversation.updated_at = datetime.utcnow()
-        session.add(conversation)
+        # Update conversation summary (last message, unread, timestamp)
+        record_new_message(session, conversation, system_message)
         
         session.commit()
         
+        # Push the new message to the client and to the consultant's other tabs
+        for push_user_id in (client_user_id, user.id):
+            publish_to_user(
+                push_user_id, "message",
+                conversation_id=conversation.id,
+                message_id=system_message.id,
+                from_user_id=user.id,
+                to_user_id=client_user_id
+            )
+        
         # Return JSON response instead of redirect
         return JSONResponse({
             "success": True,
@@ -169,14 +182,14 @@ _Questa offerta scade il {new_offer.expires_at.strftime('%d/%m/%Y alle %H:%M')}_
 
 
 @router.get("/consulenza/prenota/{offer_id}", response_class=HTMLResponse)
-async def show_booking_page(
+def show_booking_page(
     request: Request,
     offer_id: int,
     user: User = Depends(get_current_user)
 ):
     """Show booking page for client to book consultation"""
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Get consultation offer
         offer = session.get(ConsultationOffer, offer_id)
         if not offer:
@@ -211,13 +224,13 @@ async def show_booking_page(
 
 
 @router.get("/api/consultation-offers/{offer_id}")
-async def get_consultation_offer(
+def get_consultation_offer(
     offer_id: int,
     user: User = Depends(get_current_user)
 ):
     """Get consultation offer details (API endpoint)"""
     
-    with Session(engine) as session:
+    with get_session() as session:
         offer = session.get(ConsultationOffer, offer_id)
         if not offer:
             raise HTTPException(status_code=404, detail="Offerta non trovata")
@@ -251,27 +264,37 @@ async def get_consultation_offer(
         })
 
 
+class SelectedSlot(BaseModel):
+    """Slot scelto dal cliente (body JSON di confirm_booking)"""
+    date: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+
 @router.post("/consulenza/prenota/{offer_id}/confirm")
-async def confirm_booking(
+def confirm_booking(
     request: Request,
     offer_id: int,
+    slot: SelectedSlot,
     user: User = Depends(get_current_user)
 ):
-    """Create Stripe Checkout Session for consultation booking"""
+    """
+    Create Stripe Checkout Session for consultation booking
+
+    Route sync (threadpool): database e chiamata a Stripe, che attende fino al
+    timeout del provider, non bloccano l'event loop.
+    """
     from app.utils.stripe_config import create_checkout_session
-    import json
     import os
     
-    # Get slot data from request body
-    body = await request.json()
-    selected_date = body.get('date')
-    start_time = body.get('start_time')
-    end_time = body.get('end_time')
+    selected_date = slot.date
+    start_time = slot.start_time
+    end_time = slot.end_time
     
     if not selected_date or not start_time or not end_time:
         raise HTTPException(status_code=400, detail="Dati slot mancanti")
     
-    with Session(engine) as session:
+    with get_session() as session:
         # Get consultation offer
         offer = session.get(ConsultationOffer, offer_id)
         if not offer:
@@ -1,20 +1,19 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
 from app.database import get_session
-from app.models import User, Category
-from app.routes.auth import verify_token
+from app.models import User
+from app.routes.auth import get_current_user
 from sqlmodel import select, func
+from typing import Optional
 from app.logger_config import logger
+from app.utils.category_registry import category_registry
 
 router = APIRouter()
 
 @router.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+def home(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Homepage con consulenti in evidenza"""
     
-    # Controlla se utente è loggato
-    current_user = verify_token(request)
-    
     # Categorie disponibili tramite middleware
     categories = getattr(request.state, 'categories', [])
     
@@ -32,13 +31,9 @@ async def home(request: Request):
             # ✅ Crea struttura dati come nel template (con categoria)
             consultants = []
             for user in featured_users:
-                category = None
-                if user.category_id:
-                    category = session.get(Category, user.category_id)
-                
                 consultants.append({
                     "user": user,
-                    "category": category
+                    "category": category_registry.get(user.category_id)
                 })
             
             logger.info(f"Home page loaded with {len(consultants)} featured consultants")
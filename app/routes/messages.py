@@ -1,17 +1,27 @@
 from fastapi import APIRouter, Request, Form, HTTPException, Query, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from app.database import get_session
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from app.database import get_session, get_async_session
 from app.models import User, Conversation, Message
-from sqlmodel import select, or_, and_, func
+from sqlmodel import select, or_, and_, func, case
 from datetime import datetime, timedelta
 from app.logger_config import logger
 from typing import Optional
+import hashlib
 import os
 
 # ✅ Importa funzioni autenticazione da auth.py
-from app.routes.auth import verify_token, get_current_user
-from app.utils.notification_manager import send_notification
+from app.routes.auth import get_current_user
+from app.utils.notification_service import NotificationItem, notify_many
 from app.utils_user import get_display_name
+from app.utils.conversation_summary import (
+    record_new_message,
+    mark_conversation_read,
+    rebuild_conversation_summary,
+    unread_for
+)
+from app.utils.push_hub import publish_to_user
 
 router = APIRouter()
 
@@ -22,9 +32,8 @@ MAX_MESSAGE_LENGTH = 1000
 # ========== API ENDPOINTS ==========
 
 @router.get("/api/current-user")
-async def api_get_current_user(request: Request):
+def api_get_current_user(request: Request, user: Optional[User] = Depends(get_current_user)):
     """API endpoint to get current logged-in user info"""
-    user = verify_token(request)
     if not user:
         return JSONResponse({"error": "Not authenticated"}, status_code=401)
     
@@ -65,13 +74,43 @@ def get_or_create_conversation(session, user1_id: int, user2_id: int) -> Convers
     
     return conversation
 
+def find_conversation(session, user1_id: int, user2_id: int) -> Optional[Conversation]:
+    """Ottieni conversazione esistente senza crearla"""
+    return session.exec(
+        select(Conversation).where(
+            and_(
+                Conversation.user1_id == min(user1_id, user2_id),
+                Conversation.user2_id == max(user1_id, user2_id)
+            )
+        )
+    ).first()
+
+def conversation_etag(conversation: Conversation, query: str = "") -> str:
+    """ETag debole dal riepilogo della conversazione e dai parametri della richiesta"""
+    state = (
+        f"{conversation.id}:{conversation.last_message_id}:{conversation.message_count}:"
+        f"{conversation.unread_for_user1}:{conversation.unread_for_user2}:{query}"
+    )
+    return 'W/"' + hashlib.sha1(state.encode()).hexdigest()[:20] + '"'
+
+def serialize_message(msg: Message, user_id: int) -> dict:
+    """Formato JSON di un messaggio per chat e widget"""
+    return {
+        "id": msg.id,
+        "content": msg.content,
+        "sender_id": msg.sender_id,
+        "is_sender": msg.sender_id == user_id,  # ✅ Rinominato da is_mine a is_sender per il frontend
+        "is_mine": msg.sender_id == user_id,  # ✅ Mantenuto per backward compatibility
+        "is_system_message": msg.is_system_message if hasattr(msg, 'is_system_message') else False,  # ✅ Aggiunto per messaggi di sistema
+        "created_at": msg.created_at.isoformat(),
+        "is_read": msg.is_read
+    }
+
 # ========== PAGINA LISTA CONVERSAZIONI ==========
 
 @router.get("/messaggi", response_class=HTMLResponse)
-async def messages_inbox_page(request: Request):
+def messages_inbox_page(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Pagina inbox con lista conversazioni"""
-    current_user = verify_token(request)
-    
     if not current_user:
         return RedirectResponse("/login?redirect=/messaggi", status_code=302)
     
@@ -88,10 +127,8 @@ async def messages_inbox_page(request: Request):
 # ========== PAGINA CHAT CON UTENTE SPECIFICO ==========
 
 @router.get("/messaggi/{other_user_id}", response_class=HTMLResponse)
-async def chat_page(request: Request, other_user_id: int):
+def chat_page(request: Request, other_user_id: int, current_user: Optional[User] = Depends(get_current_user)):
     """Pagina chat con un altro utente"""
-    current_user = verify_token(request)
-    
     if not current_user:
         return RedirectResponse(f"/login?redirect=/messaggi/{other_user_id}", status_code=302)
     
@@ -118,74 +155,70 @@ async def chat_page(request: Request, other_user_id: int):
 # ========== API: Lista Conversazioni ==========
 
 @router.get("/api/conversations")
-async def get_conversations(request: Request):
+async def get_conversations(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Ottieni lista conversazioni dell'utente loggato"""
-    # ✅ Usa verify_token da auth.py
-    current_user = verify_token(request)
-    
     if not current_user:
         return JSONResponse({"error": "Non autenticato"}, status_code=401)
     
     try:
-        with get_session() as session:
+        async with get_async_session() as session:
             user_id = current_user.id
             
-            conversations = session.exec(
-                select(Conversation)
-                .where(
-                    or_(
-                        Conversation.user1_id == user_id,
-                        Conversation.user2_id == user_id
-                    )
+            is_participant = or_(
+                Conversation.user1_id == user_id,
+                Conversation.user2_id == user_id
+            )
+            other_user_id = case(
+                (Conversation.user1_id == user_id, Conversation.user2_id),
+                else_=Conversation.user1_id
+            )
+            my_unread = case(
+                (Conversation.user1_id == user_id, Conversation.unread_for_user1),
+                else_=Conversation.unread_for_user2
+            )
+            
+            # Una sola query sulle righe conversazione (riepilogo denormalizzato) + altro utente
+            rows = (await session.exec(
+                select(
+                    Conversation.id,
+                    Conversation.updated_at,
+                    User.id,
+                    User.nome,
+                    User.cognome,
+                    User.profile_picture,
+                    User.professione,
+                    Conversation.last_message_id,
+                    Conversation.last_message_preview,
+                    Conversation.last_message_at,
+                    Conversation.last_message_sender_id,
+                    my_unread
                 )
+                .join(User, User.id == other_user_id)
+                .where(is_participant)
                 .order_by(Conversation.updated_at.desc())
-            ).all()
+            )).all()
             
             result = []
-            for conv in conversations:
-                other_user_id = conv.user2_id if conv.user1_id == user_id else conv.user1_id
-                other_user = session.get(User, other_user_id)
-                
-                if not other_user:
-                    continue
-                
-                last_message = session.exec(
-                    select(Message)
-                    .where(Message.conversation_id == conv.id)
-                    .order_by(Message.created_at.desc())
-                    .limit(1)
-                ).first()
-                
-                unread_count = session.exec(
-                    select(func.count())
-                    .select_from(Message)
-                    .where(
-                        and_(
-                            Message.conversation_id == conv.id,
-                            Message.sender_id != user_id,
-                            Message.is_read == False
-                        )
-                    )
-                ).one()
-                
+            for (conv_id, updated_at, other_id, nome, cognome, profile_picture, professione,
+                 last_id, last_content, last_created_at, last_sender_id, unread_count) in rows:
                 result.append({
-                    "conversation_id": conv.id,
+                    "conversation_id": conv_id,
                     "other_user": {
-                        "id": other_user.id,
-                        "nome": other_user.nome or "Utente",
-                        "cognome": other_user.cognome or "",
-                        "profile_picture": other_user.profile_picture or None,
-                        "professione": other_user.professione or ""
+                        "id": other_id,
+                        "nome": nome or "Utente",
+                        "cognome": cognome or "",
+                        "profile_picture": profile_picture or None,
+                        "professione": professione or ""
                     },
                     "last_message": {
-                        "id": last_message.id if last_message else None,  # ✅ Aggiunto ID
-                        "content": last_message.content if last_message else None,
-                        "created_at": last_message.created_at.isoformat() if last_message else None,
-                        "is_mine": last_message.sender_id == user_id if last_message else False,
-                        "is_sender": last_message.sender_id == user_id if last_message else False  # ✅ Aggiunto is_sender
-                    } if last_message else None,
+                        "id": last_id,  # ✅ Aggiunto ID
+                        "content": last_content,
+                        "created_at": last_created_at.isoformat(),
+                        "is_mine": last_sender_id == user_id,
+                        "is_sender": last_sender_id == user_id  # ✅ Aggiunto is_sender
+                    } if last_id is not None else None,
                     "unread_count": unread_count,
-                    "updated_at": conv.updated_at.isoformat()
+                    "updated_at": updated_at.isoformat()
                 })
             
             logger.info(f"✅ Loaded {len(result)} conversations for user {user_id}")
@@ -202,77 +235,116 @@ async def get_messages(
     request: Request,
     other_user_id: int,
     offset: int = Query(0, ge=0),
-    limit: int = Query(50, le=100)
+    limit: int = Query(100, ge=1, le=100),
+    since_id: Optional[int] = Query(None, ge=0),
+    before_id: Optional[int] = Query(None, ge=1),
+    current_user: Optional[User] = Depends(get_current_user)
 ):
-    """Ottieni messaggi di una conversazione"""
-    current_user = verify_token(request)
+    """
+    Ottieni messaggi di una conversazione.
+    
+    Modalità:
+    - default: ultimi `limit` messaggi (saltando i `offset` più recenti)
+    - before_id: pagina precedente, messaggi con id < before_id (keyset su conversation_id, id)
+    - since_id: solo i messaggi con id > since_id (polling incrementale)
     
+    Ogni risposta ha un ETag calcolato dal riepilogo della conversazione: se il
+    client lo rimanda in If-None-Match e nulla è cambiato risponde 304 senza
+    leggere i messaggi.
+    """
     if not current_user:
         return JSONResponse({"error": "Non autenticato"}, status_code=401)
     
     try:
-        with get_session() as session:
+        async with get_async_session() as session:
             user_id = current_user.id
             
-            conversation = get_or_create_conversation(session, user_id, other_user_id)
-            
-            # ✅ Ottieni gli ultimi 100 messaggi (modificato da 15)
-            messages = session.exec(
-                select(Message)
-                .where(Message.conversation_id == conversation.id)
-                .order_by(Message.created_at.desc())
-                .limit(100)  # ✅ Carica ultimi 100 messaggi
-            ).all()
-            
-            # Conta messaggi totali
-            total_messages = session.exec(
-                select(func.count())
-                .select_from(Message)
-                .where(Message.conversation_id == conversation.id)
-            ).one()
-            
-            # Marca messaggi come letti
-            unread_messages = session.exec(
-                select(Message)
+            if since_id is not None:
+                # Polling: nessuna conversazione da creare se non esiste ancora
+                conversation = await session.run_sync(find_conversation, user_id, other_user_id)
+                if not conversation:
+                    return JSONResponse({
+                        "messages": [],
+                        "total": 0,
+                        "showing": 0,
+                        "has_more": False,
+                        "last_read_id": None
+                    }, status_code=200)
+            else:
+                conversation = await session.run_sync(get_or_create_conversation, user_id, other_user_id)
+            
+            # Marca messaggi come letti (solo se il riepilogo dice che ce ne sono)
+            if unread_for(conversation, user_id):
+                marked = await session.execute(
+                    update(Message)
+                    .where(
+                        and_(
+                            Message.conversation_id == conversation.id,
+                            Message.sender_id == other_user_id,
+                            Message.is_read == False
+                        )
+                    )
+                    .values(is_read=True)
+                    .execution_options(synchronize_session=False)
+                )
+                
+                await session.run_sync(mark_conversation_read, conversation, user_id, marked.rowcount)
+                await session.commit()
+                await session.refresh(conversation)  # Riepilogo aggiornato per l'ETag
+                logger.info(f"✅ Marked {marked.rowcount} messages as read")
+                
+                # 📡 Spunte di lettura per il mittente, badge per le altre schede del lettore
+                for push_user_id in (other_user_id, user_id):
+                    publish_to_user(push_user_id, "read", conversation_id=conversation.id, reader_id=user_id)
+            
+            # ========== ETAG / 304 ==========
+            # Nuovi messaggi, eliminazioni e letture (anche dell'altro utente) cambiano il riepilogo
+            etag = conversation_etag(conversation, request.url.query)
+            if etag in request.headers.get("if-none-match", ""):
+                return Response(status_code=304, headers={"ETag": etag})
+            
+            total_messages = conversation.message_count
+            
+            # ========== QUERY MESSAGGI ==========
+            query = select(Message).where(Message.conversation_id == conversation.id)
+            
+            if since_id is not None:
+                # Dal più vecchio al più recente: il client li accoda in ordine
+                query = query.where(Message.id > since_id).order_by(Message.id).limit(limit + 1)
+            else:
+                if before_id is not None:
+                    query = query.where(Message.id < before_id)
+                query = query.order_by(Message.id.desc()).offset(0 if before_id else offset).limit(limit + 1)
+            
+            messages = (await session.exec(query)).all()
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+            if since_id is None:
+                messages = list(reversed(messages))
+            
+            # Ricevute di lettura: i miei messaggi fino a questo id sono stati letti
+            last_read_id = (await session.exec(
+                select(func.max(Message.id))
                 .where(
                     and_(
                         Message.conversation_id == conversation.id,
-                        Message.sender_id == other_user_id,
-                        Message.is_read == False
+                        Message.sender_id == user_id,
+                        Message.is_read == True
                     )
                 )
-            ).all()
-            
-            for msg in unread_messages:
-                msg.is_read = True
-                session.add(msg)
-            
-            if unread_messages:
-                session.commit()
-                logger.info(f"✅ Marked {len(unread_messages)} messages as read")
-            
-            result = [
-                {
-                    "id": msg.id,
-                    "content": msg.content,
-                    "sender_id": msg.sender_id,
-                    "is_sender": msg.sender_id == user_id,  # ✅ Rinominato da is_mine a is_sender per il frontend
-                    "is_mine": msg.sender_id == user_id,  # ✅ Mantenuto per backward compatibility
-                    "is_system_message": msg.is_system_message if hasattr(msg, 'is_system_message') else False,  # ✅ Aggiunto per messaggi di sistema
-                    "created_at": msg.created_at.isoformat(),
-                    "is_read": msg.is_read
-                }
-                for msg in reversed(messages)
-            ]
-            
-            logger.info(f"✅ Loaded {len(result)}/{total_messages} messages for conversation {conversation.id}")
+            )).one()
+            
+            result = [serialize_message(msg, user_id) for msg in messages]
+            
+            logger.debug(f"Loaded {len(result)}/{total_messages} messages for conversation {conversation.id}")
             
             return JSONResponse({
                 "messages": result,
                 "total": total_messages,
                 "showing": len(result),
-                "has_more": total_messages > 100  # ✅ Indica se ci sono più di 100 messaggi
-            }, status_code=200)
+                "has_more": has_more,  # ✅ Altri messaggi oltre questa pagina
+                "last_read_id": last_read_id
+            }, status_code=200, headers={"ETag": etag})
     
     except Exception as e:
         logger.error(f"Error getting messages: {e}", exc_info=True)
@@ -284,11 +356,10 @@ async def get_messages(
 async def send_message(
     request: Request,
     other_user_id: int,
-    content: str = Form(...)
+    content: str = Form(...),
+    current_user: Optional[User] = Depends(get_current_user)
 ):
     """Invia un messaggio"""
-    current_user = verify_token(request)
-    
     if not current_user:
         return JSONResponse({"error": "Non autenticato"}, status_code=401)
     
@@ -302,31 +373,27 @@ async def send_message(
         }, status_code=400)
     
     try:
-        with get_session() as session:
+        async with get_async_session() as session:
             user_id = current_user.id
             
-            other_user = session.get(User, other_user_id)
+            other_user = await session.get(User, other_user_id)
             if not other_user:
                 return JSONResponse({"error": "Utente non trovato"}, status_code=404)
             
             if user_id == other_user_id:
                 return JSONResponse({"error": "Non puoi inviare messaggi a te stesso"}, status_code=400)
             
-            conversation = get_or_create_conversation(session, user_id, other_user_id)
+            conversation = await session.run_sync(get_or_create_conversation, user_id, other_user_id)
             
             # ⏰ CONTROLLO PER NOTIFICA: primo messaggio O >30 minuti dall'ultimo
             should_notify = False
             
-            # Trova l'ultimo messaggio nella conversazione
-            last_message = session.exec(
-                select(Message)
-                .where(Message.conversation_id == conversation.id)
-                .order_by(Message.created_at.desc())
-            ).first()
+            # Data dell'ultimo messaggio dal riepilogo della conversazione
+            last_message_at = conversation.last_message_at
             
-            if last_message:
+            if last_message_at:
                 # Calcola tempo trascorso dall'ultimo messaggio
-                time_since_last = datetime.utcnow() - last_message.created_at
+                time_since_last = datetime.utcnow() - last_message_at
                 should_notify = time_since_last > timedelta(minutes=30)
                 logger.info(f"⏱️ Ultimo messaggio {time_since_last.seconds // 60} minuti fa. Notifica: {should_notify}")
             else:
@@ -335,11 +402,7 @@ async def send_message(
                 logger.info(f"🆕 Primo messaggio nella conversazione. Notifica: True")
             
             # ✅ VERIFICA LIMITE MESSAGGI
-            message_count = session.exec(
-                select(func.count())
-                .select_from(Message)
-                .where(Message.conversation_id == conversation.id)
-            ).one()
+            message_count = conversation.message_count
             
             if message_count >= MAX_MESSAGES_PER_CONVERSATION:
                 return JSONResponse({
@@ -355,14 +418,24 @@ async def send_message(
             )
             session.add(message)
             
-            conversation.updated_at = datetime.utcnow()
-            session.add(conversation)
+            # Ultimo messaggio, non letti del destinatario e contatore nella stessa transazione
+            await session.run_sync(record_new_message, conversation, message)
             
-            session.commit()
-            session.refresh(message)
+            await session.commit()
+            await session.refresh(message)
             
             logger.info(f"✅ Message sent: {current_user.nome} (#{user_id}) -> {other_user.nome} (#{other_user_id}) [{message_count + 1}/{MAX_MESSAGES_PER_CONVERSATION}]")
             
+            # 📡 Push al destinatario e alle altre schede del mittente
+            for push_user_id in (other_user_id, user_id):
+                publish_to_user(
+                    push_user_id, "message",
+                    conversation_id=conversation.id,
+                    message_id=message.id,
+                    from_user_id=user_id,
+                    to_user_id=other_user_id
+                )
+            
             # 📧🔔 Invia notifica al destinatario SE should_notify è True
             if should_notify:
                 try:
@@ -370,11 +443,10 @@ async def send_message(
                     sender_name = get_display_name(current_user)
                     recipient_name = get_display_name(other_user, include_full_name=False)
                     
-                    notification_sent = send_notification(
-                        notification_type_key='community_contact',
-                        recipient_user_id=other_user.id,
-                        recipient_email=other_user.email,
-                        recipient_name=recipient_name,
+                    # Notifica in-app + email in outbox: sessione sincrona, fuori dall'event loop
+                    notification_sent = await run_in_threadpool(notify_many, 'community_contact', [NotificationItem(
+                        user_id=other_user.id,
+                        message=f"{sender_name} vuole contattarti!",
                         template_data={
                             'author_name': recipient_name,
                             'contact_name': sender_name,
@@ -384,7 +456,7 @@ async def send_message(
                         },
                         related_user_id=current_user.id,
                         action_url=f"{base_url}/messages"
-                    )
+                    )])
                     
                     if notification_sent:
                         logger.info(f"✅ Notifica messaggio inviata a user {other_user.id} ({other_user.email})")
@@ -413,17 +485,14 @@ async def send_message(
 # ========== API: Elimina Messaggio ==========
 
 @router.delete("/api/messaggi/{message_id}")
-async def delete_message(request: Request, message_id: int):
+async def delete_message(request: Request, message_id: int, current_user: Optional[User] = Depends(get_current_user)):
     """Elimina un messaggio (solo il mittente può eliminare)"""
-    # ✅ Usa verify_token da auth.py
-    current_user = verify_token(request)
-    
     if not current_user:
         return JSONResponse({"error": "Non autenticato"}, status_code=401)
     
     try:
-        with get_session() as session:
-            message = session.get(Message, message_id)
+        async with get_async_session() as session:
+            message = await session.get(Message, message_id)
             
             if not message:
                 return JSONResponse({"error": "Messaggio non trovato"}, status_code=404)
@@ -431,11 +500,19 @@ async def delete_message(request: Request, message_id: int):
             if message.sender_id != current_user.id:
                 return JSONResponse({"error": "Non autorizzato"}, status_code=403)
             
-            session.delete(message)
-            session.commit()
+            conversation = await session.get(Conversation, message.conversation_id)
+            
+            await session.delete(message)
+            if conversation:
+                await session.run_sync(rebuild_conversation_summary, conversation)
+            await session.commit()
             
             logger.info(f"✅ Message {message_id} deleted by user {current_user.id}")
             
+            if conversation:
+                for push_user_id in (conversation.user1_id, conversation.user2_id):
+                    publish_to_user(push_user_id, "conversation", conversation_id=conversation.id)
+            
             return JSONResponse({"success": True}, status_code=200)
     
     except Exception as e:
@@ -445,33 +522,32 @@ async def delete_message(request: Request, message_id: int):
 # ========== API: Conta Messaggi Non Letti Totali ==========
 
 @router.get("/api/unread-count")
-async def get_unread_count(request: Request):
+async def get_unread_count(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Ottieni conteggio totale messaggi non letti"""
-    # ✅ Usa verify_token da auth.py
-    current_user = verify_token(request)
-    
     if not current_user:
         return JSONResponse({"error": "Non autenticato"}, status_code=401)
     
     try:
-        with get_session() as session:
+        async with get_async_session() as session:
             user_id = current_user.id
             
-            unread_count = session.exec(
-                select(func.count())
-                .select_from(Message)
-                .join(Conversation)
+            # Somma dei contatori denormalizzati: una riga per conversazione
+            unread_count = (await session.exec(
+                select(
+                    func.coalesce(func.sum(
+                        case(
+                            (Conversation.user1_id == user_id, Conversation.unread_for_user1),
+                            else_=Conversation.unread_for_user2
+                        )
+                    ), 0)
+                )
                 .where(
-                    and_(
-                        or_(
-                            Conversation.user1_id == user_id,
-                            Conversation.user2_id == user_id
-                        ),
-                        Message.sender_id != user_id,
-                        Message.is_read == False
+                    or_(
+                        Conversation.user1_id == user_id,
+                        Conversation.user2_id == user_id
                     )
                 )
-            ).one()
+            )).one()
             
             return JSONResponse({"unread_count": unread_count}, status_code=200)
     
@@ -1,31 +1,41 @@
 """
 Route per gestione notifiche utente
 """
-from fastapi import APIRouter, HTTPException, Request
-from sqlmodel import Session, select, func
-from app.database import engine
+from fastapi import APIRouter, HTTPException, Request, Depends
+from sqlalchemy import update
+from sqlmodel import select, func
+from app.database import get_async_session
 from app.models import Notification, User
 from app.routes.auth import get_current_user
+from app.utils.notification_type_registry import notification_type_registry
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
 
 
 @router.get("/api/notifications")
-async def get_notifications(request: Request, limit: int = 50, offset: int = 0):
+async def get_notifications(request: Request, limit: int = 50, offset: int = 0, current_user: Optional[User] = Depends(get_current_user)):
     """Ottiene le notifiche dell'utente corrente"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
+    async with get_async_session() as session:
         # Query per le notifiche dell'utente
         statement = select(Notification).where(
             Notification.user_id == current_user.id
         ).order_by(Notification.created_at.desc()).offset(offset).limit(limit)
         
-        notifications = session.exec(statement).all()
+        notifications = (await session.exec(statement)).all()
+        
+        # Utenti correlati caricati in una sola query
+        related_ids = {notif.related_user_id for notif in notifications if notif.related_user_id}
+        related_users = {}
+        if related_ids:
+            related_users = {
+                user.id: user
+                for user in (await session.exec(select(User).where(User.id.in_(related_ids)))).all()
+            }
         
         # Formatta le notifiche con i dati dell'utente correlato
         result = []
@@ -43,7 +53,7 @@ async def get_notifications(request: Request, limit: int = 50, offset: int = 0):
             
             # Aggiungi dati utente correlato se presente
             if notif.related_user_id:
-                related_user = session.get(User, notif.related_user_id)
+                related_user = related_users.get(notif.related_user_id)
                 if related_user:
                     notif_data["related_user"] = {
                         "id": related_user.id,
@@ -58,32 +68,30 @@ async def get_notifications(request: Request, limit: int = 50, offset: int = 0):
 
 
 @router.get("/api/notifications/unread/count")
-async def get_unread_notifications_count(request: Request):
+async def get_unread_notifications_count(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Ottiene il numero di notifiche non lette"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
-        count = session.exec(
+    async with get_async_session() as session:
+        count = (await session.exec(
             select(func.count(Notification.id)).where(
                 Notification.user_id == current_user.id,
                 Notification.is_read == False
             )
-        ).one()
+        )).one()
         
         return {"count": count}
 
 
 @router.post("/api/notifications/{notification_id}/read")
-async def mark_notification_as_read(notification_id: int, request: Request):
+async def mark_notification_as_read(notification_id: int, request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Segna una notifica come letta"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
-        notification = session.get(Notification, notification_id)
+    async with get_async_session() as session:
+        notification = await session.get(Notification, notification_id)
         
         if not notification:
             raise HTTPException(status_code=404, detail="Notifica non trovata")
@@ -93,46 +101,42 @@ async def mark_notification_as_read(notification_id: int, request: Request):
         
         notification.is_read = True
         session.add(notification)
-        session.commit()
+        await session.commit()
         
         return {"success": True}
 
 
 @router.post("/api/notifications/read-all")
-async def mark_all_notifications_as_read(request: Request):
+async def mark_all_notifications_as_read(request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Segna tutte le notifiche come lette"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
-        # Ottieni tutte le notifiche non lette
-        notifications = session.exec(
-            select(Notification).where(
+    async with get_async_session() as session:
+        # Segna tutte le notifiche non lette con un solo UPDATE
+        marked = await session.execute(
+            update(Notification)
+            .where(
                 Notification.user_id == current_user.id,
                 Notification.is_read == False
             )
-        ).all()
-        
-        # Segna tutte come lette
-        for notification in notifications:
-            notification.is_read = True
-            session.add(notification)
+            .values(is_read=True)
+            .execution_options(synchronize_session=False)
+        )
         
-        session.commit()
+        await session.commit()
         
-        return {"success": True, "marked_count": len(notifications)}
+        return {"success": True, "marked_count": marked.rowcount}
 
 
 @router.delete("/api/notifications/{notification_id}")
-async def delete_notification(notification_id: int, request: Request):
+async def delete_notification(notification_id: int, request: Request, current_user: Optional[User] = Depends(get_current_user)):
     """Elimina una notifica"""
-    current_user = get_current_user(request)
     if not current_user:
         raise HTTPException(status_code=401, detail="Non autenticato")
     
-    with Session(engine) as session:
-        notification = session.get(Notification, notification_id)
+    async with get_async_session() as session:
+        notification = await session.get(Notification, notification_id)
         
         if not notification:
             raise HTTPException(status_code=404, detail="Notifica non trovata")
@@ -140,7 +144,22 @@ async def delete_notification(notification_id: int, request: Request):
         if notification.user_id != current_user.id:
             raise HTTPException(status_code=403, detail="Non autorizzato")
         
-        session.delete(notification)
-        session.commit()
+        await session.delete(notification)
+        await session.commit()
         
         return {"success": True}
+
+
+@router.post("/api/notification-types/reload")
+def reload_notification_types(request: Request, current_user: Optional[User] = Depends(get_current_user)):
+    """Ricarica il registro dei tipi di notifica (solo amministratori, es. dopo una modifica diretta al database)"""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Non autenticato")
+    
+    if current_user.user_type_id != 3:
+        raise HTTPException(status_code=403, detail="Non autorizzato")
+    
+    # Ricarica solo questo worker: gli altri si allineano entro NOTIFICATION_TYPE_CACHE_TTL
+    notification_type_registry.load()
+    
+    return {"success": True, "types_count": len(notification_type_registry.all())}
@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from app.models import User
-from app.models import Category
 from app.database import get_session
 from app.logger_config import logger
+from app.routes.auth import get_current_user
+from typing import Optional
+from app.utils.category_registry import category_registry
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/user/{user_id}", response_class=HTMLResponse)
-def public_user_profile(request: Request, user_id: int):
+def public_user_profile(request: Request, user_id: int, current_user: Optional[User] = Depends(get_current_user)):
     """Visualizza il profilo pubblico di un utente"""
     with get_session() as session:
         user = session.get(User, user_id)
@@ -18,21 +20,11 @@ def public_user_profile(request: Request, user_id: int):
             return RedirectResponse("/")
         
         # Carica la categoria
-        category = None
-        if user.category_id:
-            category = session.get(Category, user.category_id)
+        category = category_registry.get(user.category_id)
         
         # Converti aree_interesse da stringa a lista
         aree_interesse_list = user.aree_interesse.split(',') if user.aree_interesse else []
         
-        # Ottieni l'utente loggato (se c'è) - USA verify_token con Request
-        current_user = None
-        try:
-            from app.routes.auth import verify_token
-            current_user = verify_token(request)
-        except:
-            pass
-        
         logger.info(f"Public profile viewed: {user.email} (ID: {user.id}) by {current_user.email if current_user else 'anonymous'}")
         
         return templates.TemplateResponse("user_profile.html", {
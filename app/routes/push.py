@@ -0,0 +1,65 @@
+"""
+Canale push WebSocket: nuovi messaggi, notifiche e badge dei non letti
+
+Il client apre /ws una volta per pagina e riceve piccoli eventi JSON
+({"type": "message" | "read" | "conversation" | "notification" | "booking_join"
+| "resync" | "ping", ...}) pubblicati da app.utils.push_hub. I template
+ricaricano la parte interessata con le API esistenti e tornano al polling
+solo quando il socket non è disponibile.
+"""
+import asyncio
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+
+from app.routes.auth import verify_token
+from app.utils.push_hub import push_hub
+from app.logger_config import logger
+
+router = APIRouter()
+
+# Ogni quanti secondi inviare un ping per tenere viva la connessione (proxy, load balancer)
+PING_INTERVAL = 25
+
+
+@router.websocket("/ws")
+async def push_socket(websocket: WebSocket):
+    """Connessione push dell'utente autenticato (cookie di sessione)"""
+    # Con la cache degli utenti scaduta verify_token interroga il database: fuori dall'event loop
+    user = await run_in_threadpool(verify_token, websocket)
+    if not user:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    queue = push_hub.subscribe(user.id)
+    logger.debug(f"🔌 Push socket opened for user {user.id}")
+
+    # Il client non invia nulla di utile, ma leggere serve ad accorgersi della chiusura
+    receiver = asyncio.create_task(websocket.receive_text())
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, receiver}, timeout=PING_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            # Un evento già tolto dalla coda va inviato anche se nel frattempo è arrivato altro dal client
+            if getter.done():
+                await websocket.send_json(getter.result())
+            else:
+                getter.cancel()
+
+            if receiver in done:
+                receiver.result()  # Solleva WebSocketDisconnect se il client ha chiuso
+                receiver = asyncio.create_task(websocket.receive_text())
+            elif not done:
+                await websocket.send_json({"type": "ping"})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Push socket error for user {user.id}: {e}")
+    finally:
+        receiver.cancel()
+        push_hub.unsubscribe(user.id, queue)
+        logger.debug(f"🔌 Push socket closed for user {user.id}")
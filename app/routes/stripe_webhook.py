@@ -3,17 +3,17 @@ Stripe Webhook Handler
 Receives and processes Stripe events (payment confirmations, etc.)
 """
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from sqlmodel import Session
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import os
-from app.database import engine
+from app.database import get_session
 from app.models import Booking, ConsultationOffer, User, Notification
 from app.utils.stripe_config import construct_webhook_event
 from app.logger_config import logger
 from app.scheduler import schedule_booking_reminders
-from app.utils.notification_service import send_notification
+from app.utils.notification_service import NotificationItem, notify_many
 
 router = APIRouter()
 
@@ -69,15 +69,16 @@ async def handle_checkout_session_completed(checkout_session):
     # Check booking type
     booking_type = metadata.get('booking_type', 'consultation_offer')
     
+    # Database, notifiche e scheduler sono sync: nel threadpool, fuori dall'event loop
     if booking_type == 'direct':
         # Direct booking (from booking.html)
-        await handle_direct_booking(session_id, payment_intent_id, metadata)
+        await run_in_threadpool(handle_direct_booking, session_id, payment_intent_id, metadata)
     else:
         # Consultation offer booking (from consultation offer)
-        await handle_consultation_offer_booking(session_id, payment_intent_id, metadata)
+        await run_in_threadpool(handle_consultation_offer_booking, session_id, payment_intent_id, metadata)
 
 
-async def handle_direct_booking(session_id, payment_intent_id, metadata):
+def handle_direct_booking(session_id, payment_intent_id, metadata):
     """Handle direct booking payment"""
     client_user_id = int(metadata.get('client_user_id'))
     consultant_user_id = int(metadata.get('consultant_user_id'))
@@ -88,7 +89,7 @@ async def handle_direct_booking(session_id, payment_intent_id, metadata):
     availability_block_id = metadata.get('availability_block_id')
     client_notes = metadata.get('client_notes', '')
     
-    with Session(engine) as db_session:
+    with get_session() as db_session:
         # Check if booking already exists
         existing_booking = db_session.query(Booking).filter(
             Booking.stripe_checkout_session_id == session_id
@@ -129,48 +130,46 @@ async def handle_direct_booking(session_id, payment_intent_id, metadata):
         
         db_session.add(new_booking)
         db_session.commit()
-        db_session.refresh(new_booking)
+        booking_id = new_booking.id
         
         # Get client and consultant info
         client = db_session.get(User, client_user_id)
-        consultant = db_session.get(User, consultant_user_id)
         client_name = f"{client.nome} {client.cognome}" if client and client.nome else "Un utente"
-        consultant_name = f"{consultant.nome} {consultant.cognome}" if consultant and consultant.nome else "Il consulente"
-        
-        # Invia notifica al consulente usando il nuovo sistema
-        send_notification(
-            user_id=consultant_user_id,
-            type_key='booking_confirmed',
-            title="Nuova Prenotazione!",
-            message=f"{client_name} ha prenotato una consulenza per il {booking_date_str} alle {start_time}",
-            template_data={
-                'consultant_name': consultant_name,
-                'client_name': client_name,
-                'date': booking_date_str,
-                'time': start_time,
-                'duration': str(duration_minutes),
-                'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
-            },
-            related_booking_id=new_booking.id,
-            related_user_id=client_user_id,
-            action_url=f"/profile#bookings"
-        )
-        
-        logger.info(f"✅ Direct booking {new_booking.id} created successfully for session {session_id}")
-        
-        # Schedula notifiche promemoria (1 ora prima e 10 minuti prima)
-        booking_datetime_tz = booking_datetime.replace(tzinfo=ITALY_TZ)
-        schedule_booking_reminders(
-            booking_id=new_booking.id,
-            booking_datetime=booking_datetime_tz,
-            client_id=client_user_id,
-            consultant_id=consultant_user_id
-        )
-        logger.info(f"📅 Notifiche reminder schedulate per booking {new_booking.id}")
+        consultant_name = f"{consultant.nome} {consultant.cognome}" if consultant.nome else "Il consulente"
+    
+    # Invia notifica al consulente usando il nuovo sistema
+    notify_many('booking_confirmed', [NotificationItem(
+        user_id=consultant_user_id,
+        title="Nuova Prenotazione!",
+        message=f"{client_name} ha prenotato una consulenza per il {booking_date_str} alle {start_time}",
+        template_data={
+            'consultant_name': consultant_name,
+            'client_name': client_name,
+            'date': booking_date_str,
+            'time': start_time,
+            'duration': str(duration_minutes),
+            'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
+        },
+        related_booking_id=booking_id,
+        related_user_id=client_user_id,
+        action_url=f"/profile#bookings"
+    )])
+    
+    logger.info(f"✅ Direct booking {booking_id} created successfully for session {session_id}")
+    
+    # Schedula notifiche promemoria (1 ora prima e 10 minuti prima)
+    booking_datetime_tz = booking_datetime.replace(tzinfo=ITALY_TZ)
+    schedule_booking_reminders(
+        booking_id=booking_id,
+        booking_datetime=booking_datetime_tz,
+        client_id=client_user_id,
+        consultant_id=consultant_user_id
+    )
+    logger.info(f"📅 Notifiche reminder schedulate per booking {booking_id}")
 
 
 
-async def handle_consultation_offer_booking(session_id, payment_intent_id, metadata):
+def handle_consultation_offer_booking(session_id, payment_intent_id, metadata):
     """Handle consultation offer booking payment"""
     offer_id = int(metadata.get('offer_id'))
     client_user_id = int(metadata.get('client_user_id'))
@@ -180,7 +179,7 @@ async def handle_consultation_offer_booking(session_id, payment_intent_id, metad
     end_time = metadata.get('end_time')
     duration_minutes = int(metadata.get('duration_minutes'))
     
-    with Session(engine) as db_session:
+    with get_session() as db_session:
         # Get consultation offer
         offer = db_session.get(ConsultationOffer, offer_id)
         if not offer:
@@ -217,12 +216,12 @@ async def handle_consultation_offer_booking(session_id, payment_intent_id, metad
         )
         
         db_session.add(new_booking)
-        db_session.commit()
-        db_session.refresh(new_booking)
+        db_session.flush()
+        booking_id = new_booking.id
         
-        # Update offer status
+        # Update offer status (stessa transazione della prenotazione)
         offer.status = "accepted"
-        offer.booking_id = new_booking.id
+        offer.booking_id = booking_id
         offer.updated_at = datetime.utcnow()
         db_session.add(offer)
         db_session.commit()
@@ -232,35 +231,34 @@ async def handle_consultation_offer_booking(session_id, payment_intent_id, metad
         consultant = db_session.get(User, consultant_user_id)
         client_name = f"{client.nome} {client.cognome}" if client and client.nome else "Un utente"
         consultant_name = f"{consultant.nome} {consultant.cognome}" if consultant and consultant.nome else "Il consulente"
-        
-        # Invia notifica al consulente usando il nuovo sistema
-        send_notification(
-            user_id=consultant_user_id,
-            type_key='booking_confirmed',
-            title="Nuova Prenotazione!",
-            message=f"{client_name} ha accettato la tua offerta e prenotato per il {selected_date} alle {start_time}",
-            template_data={
-                'consultant_name': consultant_name,
-                'client_name': client_name,
-                'date': selected_date,
-                'time': start_time,
-                'duration': str(duration_minutes),
-                'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
-            },
-            related_booking_id=new_booking.id,
-            related_user_id=client_user_id,
-            action_url=f"/profile#bookings"
-        )
-        
-        logger.info(f"✅ Booking {new_booking.id} created successfully for session {session_id}")
-        
-        # Schedula notifiche promemoria (1 ora prima e 10 minuti prima)
-        booking_datetime_tz = booking_datetime.replace(tzinfo=ITALY_TZ)
-        schedule_booking_reminders(
-            booking_id=new_booking.id,
-            booking_datetime=booking_datetime_tz,
-            client_id=client_user_id,
-            consultant_id=consultant_user_id
-        )
-        logger.info(f"📅 Notifiche reminder schedulate per booking {new_booking.id}")
+    
+    # Invia notifica al consulente usando il nuovo sistema
+    notify_many('booking_confirmed', [NotificationItem(
+        user_id=consultant_user_id,
+        title="Nuova Prenotazione!",
+        message=f"{client_name} ha accettato la tua offerta e prenotato per il {selected_date} alle {start_time}",
+        template_data={
+            'consultant_name': consultant_name,
+            'client_name': client_name,
+            'date': selected_date,
+            'time': start_time,
+            'duration': str(duration_minutes),
+            'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
+        },
+        related_booking_id=booking_id,
+        related_user_id=client_user_id,
+        action_url=f"/profile#bookings"
+    )])
+    
+    logger.info(f"✅ Booking {booking_id} created successfully for session {session_id}")
+    
+    # Schedula notifiche promemoria (1 ora prima e 10 minuti prima)
+    booking_datetime_tz = booking_datetime.replace(tzinfo=ITALY_TZ)
+    schedule_booking_reminders(
+        booking_id=booking_id,
+        booking_datetime=booking_datetime_tz,
+        client_id=client_user_id,
+        consultant_id=consultant_user_id
+    )
+    logger.info(f"📅 Notifiche reminder schedulate per booking {booking_id}")
 
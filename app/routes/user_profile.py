@@ -1,21 +1,24 @@
 from fastapi import APIRouter, Request, Form, UploadFile, File
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from app.database import get_session
-from app.models import User, Category
+from app.models import User
 from sqlmodel import select
 from app.routes.auth import verify_token
 from app.logger_config import logger
-from app.utils.email import send_profile_verification_request
+from app.utils.email_outbox import build_outbox_email, enqueue_emails
+from app.utils.category_registry import category_registry
+from app.utils.search_index import search_index
 from typing import Optional
 import os
 import hashlib
+from datetime import date
 from PIL import Image
 import io
 
 router = APIRouter()
 
 @router.get("/profile", response_class=HTMLResponse)
-async def user_profile(request: Request):
+def user_profile(request: Request):
     """Pagina profilo utente"""
     try:
         user = verify_token(request)
@@ -32,7 +35,7 @@ async def user_profile(request: Request):
                 request.session.clear()
                 return RedirectResponse("/login", status_code=307)
             
-            categories = session.exec(select(Category)).all()
+            categories = category_registry.all()
             logger.info(f"✅ Loaded {len(categories)} categories")
             
             # ✅ AGGIUNGI cognome
@@ -70,7 +73,7 @@ async def user_profile(request: Request):
         return RedirectResponse("/login", status_code=307)
 
 @router.post("/api/profile/update")
-async def update_profile(
+def update_profile(
     request: Request,
     nome: str = Form(None),
     cognome: str = Form(None),  # ✅ AGGIUNGI cognome
@@ -119,6 +122,9 @@ async def update_profile(
             session.commit()
             session.refresh(db_user)
             
+            # Aggiorna l'indice di ricerca consulenti solo per questo utente
+            search_index.update_user(db_user)
+            
             logger.info(f"✅ Profile updated for user: {db_user.email}")
             
             # 🔍 DEBUG: Log dello stato di verifica
@@ -157,21 +163,33 @@ async def update_profile(
                 if verifiers:
                     user_full_name = f"{db_user.nome or ''} {db_user.cognome or ''}".strip() or "Utente"
                     
+                    base_url = os.getenv("BASE_URL", "http://localhost:8000")
+                    
+                    # Email accodate nell'outbox e inviate in background (una al giorno per verifier)
+                    template_data = {
+                        "user_name": user_full_name,
+                        "user_email": db_user.email,
+                        "user_id": db_user.id,
+                        "action_url": f"{base_url}/user/{db_user.id}"
+                    }
+                    emails = []
                     for verifier in verifiers:
                         if verifier.email:
-                            try:
-                                logger.info(f"📧 Attempting to send email to {verifier.email}...")
-                                send_profile_verification_request(
-                                    to_email=verifier.email,
-                                    user_id=db_user.id,
-                                    user_name=user_full_name,
-                                    user_email=db_user.email
-                                )
-                                logger.info(f"✅ Verification request sent to {verifier.email}")
-                            except Exception as e:
-                                logger.error(f"❌ Failed to send email to {verifier.email}: {e}", exc_info=True)
+                            emails.append(build_outbox_email(
+                                to_email=verifier.email,
+                                to_name=verifier.nome,
+                                subject=f"Richiesta Verifica Profilo - {user_full_name}",
+                                template_name="profile_verification_request.html",
+                                template_data=template_data,
+                                idempotency_key=f"profile_verification:{db_user.id}:{verifier.id}:{date.today().isoformat()}"
+                            ))
                         else:
                             logger.warning(f"⚠️ Verifier ID {verifier.id} has no email address")
+                    
+                    # Una sola query sulle chiavi già in outbox per tutti i verifier
+                    enqueue_emails(session, emails)
+                    session.commit()
+                    logger.info(f"📬 Verification request queued for {len(verifiers)} verifiers")
                 else:
                     logger.warning("⚠️ No verifiers found in the system (user_type_id 2 or 3)")
             elif not profile_complete:
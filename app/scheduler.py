@@ -9,15 +9,18 @@ APScheduler funziona così:
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from sqlmodel import Session, select
 from app.database import engine
 from app.models import Notification, Booking, User
 from app.logger_config import logger
-from app.utils.notification_service import send_notification
+from app.utils.notification_service import NotificationItem, notify_many
+from app.utils.email_outbox import drain_email_outbox, EMAIL_OUTBOX_INTERVAL
 import os
 
 # Timezone italiano
@@ -25,7 +28,9 @@ ITALY_TZ = ZoneInfo("Europe/Rome")
 
 # Configurazione APScheduler
 jobstores = {
-    'default': SQLAlchemyJobStore(url=os.getenv('DATABASE_URL', 'sqlite:///helpy.db'))
+    'default': SQLAlchemyJobStore(url=os.getenv('DATABASE_URL', 'sqlite:///helpy.db')),
+    # Job periodici del processo (ricreati a ogni avvio, non salvati nel database)
+    'memory': MemoryJobStore()
 }
 
 # Crea lo scheduler (BackgroundScheduler = esegue in un thread separato)
@@ -35,12 +40,94 @@ scheduler = BackgroundScheduler(
 )
 
 
+# Stati delle prenotazioni che ricevono ancora i promemoria
+REMINDER_BOOKING_STATUSES = ('confirmed', 'pending')
+
+
+def build_reminder_item(booking: Booking, user: User, other_user: User, minutes_before: int) -> NotificationItem:
+    """Notifica promemoria per uno dei due partecipanti (user) della prenotazione"""
+    if minutes_before == 60:
+        title = "📅 Promemoria Consulenza"
+        message = f"La tua consulenza con {other_user.nome} {other_user.cognome} inizia tra 1 ora (alle {booking.start_time})"
+    else:
+        title = "🔔 Consulenza in Partenza!"
+        message = f"La tua consulenza con {other_user.nome} {other_user.cognome} inizia tra 10 minuti! Preparati a confermare la presenza."
+    
+    return NotificationItem(
+        user_id=user.id,
+        title=title,
+        message=message,
+        template_data={
+            'user_name': user.nome or user.email.split('@')[0],
+            'other_user_name': f"{other_user.nome} {other_user.cognome}" if other_user.nome else other_user.email.split('@')[0],
+            'date': booking.booking_date.strftime('%d/%m/%Y'),
+            'time': booking.start_time,
+            'duration': str(booking.duration_minutes),
+            'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
+        },
+        related_booking_id=booking.id,
+        related_user_id=other_user.id,
+        action_url=f"/profile?tab=bookings",
+        # Se il job viene rieseguito l'email non parte due volte
+        email_idempotency_key=f"reminder:{booking.id}:{user.id}:{minutes_before}"
+    )
+
+
+def reminder_type_key(minutes_before: int) -> str:
+    return 'reminder_1h' if minutes_before == 60 else 'reminder_10min'
+
+
+def send_booking_reminders(starts_at: datetime, minutes_before: int):
+    """
+    Invia i promemoria di tutte le prenotazioni che iniziano a starts_at.
+    
+    Questa funzione viene eseguita AUTOMATICAMENTE da APScheduler, con un job
+    per fascia oraria (1 ora prima o 10 minuti prima): allo scoccare dell'ora,
+    quando iniziano molte consulenze, clienti e consulenti di tutte le
+    prenotazioni ricevono la notifica con una sola transazione (notify_many).
+    
+    Args:
+        starts_at: Inizio delle prenotazioni (ora italiana, come Booking.booking_date)
+        minutes_before: Minuti prima dell'appuntamento (60 o 10)
+    """
+    try:
+        with Session(engine) as session:
+            bookings = session.exec(
+                select(Booking).where(
+                    Booking.booking_date == starts_at,
+                    Booking.status.in_(REMINDER_BOOKING_STATUSES)
+                )
+            ).all()
+            
+            # Clienti e consulenti con una sola query
+            user_ids = {booking.client_user_id for booking in bookings} | {booking.consultant_user_id for booking in bookings}
+            users = {}
+            if user_ids:
+                users = {user.id: user for user in session.exec(select(User).where(User.id.in_(user_ids))).all()}
+        
+        items = []
+        for booking in bookings:
+            client = users.get(booking.client_user_id)
+            consultant = users.get(booking.consultant_user_id)
+            if not client or not consultant:
+                logger.warning(f"Utente non trovato per il promemoria del booking {booking.id}")
+                continue
+            items.append(build_reminder_item(booking, client, consultant, minutes_before))
+            items.append(build_reminder_item(booking, consultant, client, minutes_before))
+        
+        sent = notify_many(reminder_type_key(minutes_before), items)
+        logger.info(f"✅ Promemoria {minutes_before} min inviati per {len(bookings)} prenotazioni delle {starts_at} ({sent} destinatari)")
+        
+    except Exception as e:
+        logger.error(f"❌ Errore nell'invio promemoria delle {starts_at}: {e}")
+
+
 def send_booking_reminder_notification(booking_id: int, user_id: int, is_consultant: bool, minutes_before: int):
     """
-    Invia una notifica promemoria per una prenotazione usando il nuovo sistema.
+    Promemoria per un singolo partecipante di una prenotazione.
     
-    Questa funzione viene eseguita AUTOMATICAMENTE da APScheduler
-    al momento programmato (1 ora prima o 10 minuti prima).
+    Job schedulati prima dei promemoria per fascia oraria (send_booking_reminders):
+    resta per quelli già salvati nel jobstore.
     
     Args:
         booking_id: ID della prenotazione
@@ -57,7 +144,7 @@ def send_booking_reminder_notification(booking_id: int, user_id: int, is_consult
                 return
             
             # Verifica che la prenotazione sia ancora confermata
-            if booking.status not in ['confirmed', 'pending']:
+            if booking.status not in REMINDER_BOOKING_STATUSES:
                 logger.info(f"Booking {booking_id} non è più confermato, skip notifica")
                 return
             
@@ -69,42 +156,9 @@ def send_booking_reminder_notification(booking_id: int, user_id: int, is_consult
             if not user or not other_user:
                 logger.warning(f"Utente non trovato")
                 return
-            
-            # Determina tipo notifica e dati
-            if minutes_before == 60:
-                type_key = 'reminder_1h'
-                title = "📅 Promemoria Consulenza"
-                message = f"La tua consulenza con {other_user.nome} {other_user.cognome} inizia tra 1 ora (alle {booking.start_time})"
-                time_label = "1 ora"
-            else:
-                type_key = 'reminder_10min'
-                title = "🔔 Consulenza in Partenza!"
-                message = f"La tua consulenza con {other_user.nome} {other_user.cognome} inizia tra 10 minuti! Preparati a confermare la presenza."
-                time_label = "10 minuti"
-            
-            # Formatta la data
-            booking_date_str = booking.booking_date.strftime('%d/%m/%Y')
-            
-            # Invia notifica usando il nuovo sistema (gestisce sia in-app che email)
-            send_notification(
-                user_id=user_id,
-                type_key=type_key,
-                title=title,
-                message=message,
-                template_data={
-                    'user_name': user.nome or user.email.split('@')[0],
-                    'other_user_name': f"{other_user.nome} {other_user.cognome}" if other_user.nome else other_user.email.split('@')[0],
-                    'date': booking_date_str,
-                    'time': booking.start_time,
-                    'duration': str(booking.duration_minutes),
-                    'action_url': f"{os.getenv('BASE_URL', 'http://localhost:8080')}/profile#bookings"
-                },
-                related_booking_id=booking_id,
-                related_user_id=other_user_id,
-                action_url=f"/profile?tab=bookings"
-            )
-            
-            logger.info(f"✅ Notifica reminder inviata a user {user_id} per booking {booking_id} ({minutes_before} min prima)")
+        
+        notify_many(reminder_type_key(minutes_before), [build_reminder_item(booking, user, other_user, minutes_before)])
+        logger.info(f"✅ Notifica reminder inviata a user {user_id} per booking {booking_id} ({minutes_before} min prima)")
             
     except Exception as e:
         logger.error(f"❌ Errore nell'invio notifica reminder: {e}")
@@ -115,9 +169,9 @@ def schedule_booking_reminders(booking_id: int, booking_datetime: datetime, clie
     Schedula le notifiche promemoria per una prenotazione.
     
     Questa funzione viene chiamata SUBITO DOPO che una prenotazione è confermata.
-    Crea 4 job totali:
-    - 2 job per il cliente (1 ora prima + 10 min prima)
-    - 2 job per il consulente (1 ora prima + 10 min prima)
+    I job sono per fascia oraria, non per prenotazione: tutte le prenotazioni
+    che iniziano alla stessa ora condividono i due job (1 ora prima + 10 min
+    prima), che avvisano clienti e consulenti insieme.
     
     Args:
         booking_id: ID della prenotazione
@@ -130,60 +184,26 @@ def schedule_booking_reminders(booking_id: int, booking_datetime: datetime, clie
         if booking_datetime.tzinfo is None:
             booking_datetime = booking_datetime.replace(tzinfo=ITALY_TZ)
         
-        # Calcola i momenti per le notifiche
-        one_hour_before = booking_datetime - timedelta(hours=1)
-        ten_minutes_before = booking_datetime - timedelta(minutes=10)
+        # Booking.booking_date è salvato senza timezone (ora italiana)
+        starts_at = booking_datetime.astimezone(ITALY_TZ).replace(tzinfo=None)
         
         # Non schedulare se è troppo tardi (già passato)
         now = datetime.now(ITALY_TZ)
         
-        # Schedula notifiche 1 ora prima (se non è troppo tardi)
-        if one_hour_before > now:
-            # Notifica al cliente
-            scheduler.add_job(
-                send_booking_reminder_notification,
-                trigger=DateTrigger(run_date=one_hour_before),
-                args=[booking_id, client_id, False, 60],
-                id=f"reminder_client_60_{booking_id}",
-                replace_existing=True,  # Se esiste già, lo sostituisce
-                misfire_grace_time=300  # Tollera 5 minuti di ritardo
-            )
-            
-            # Notifica al consulente
-            scheduler.add_job(
-                send_booking_reminder_notification,
-                trigger=DateTrigger(run_date=one_hour_before),
-                args=[booking_id, consultant_id, True, 60],
-                id=f"reminder_consultant_60_{booking_id}",
-                replace_existing=True,
-                misfire_grace_time=300
-            )
-            
-            logger.info(f"📅 Schedulata notifica 1h prima per booking {booking_id} alle {one_hour_before}")
-        
-        # Schedula notifiche 10 minuti prima (se non è troppo tardi)
-        if ten_minutes_before > now:
-            # Notifica al cliente
-            scheduler.add_job(
-                send_booking_reminder_notification,
-                trigger=DateTrigger(run_date=ten_minutes_before),
-                args=[booking_id, client_id, False, 10],
-                id=f"reminder_client_10_{booking_id}",
-                replace_existing=True,
-                misfire_grace_time=300
-            )
+        for minutes_before in (60, 10):
+            run_date = booking_datetime - timedelta(minutes=minutes_before)
+            if run_date <= now:
+                continue
             
-            # Notifica al consulente
             scheduler.add_job(
-                send_booking_reminder_notification,
-                trigger=DateTrigger(run_date=ten_minutes_before),
-                args=[booking_id, consultant_id, True, 10],
-                id=f"reminder_consultant_10_{booking_id}",
-                replace_existing=True,
-                misfire_grace_time=300
+                send_booking_reminders,
+                trigger=DateTrigger(run_date=run_date),
+                args=[starts_at, minutes_before],
+                id=f"reminders_{minutes_before}_{starts_at:%Y%m%d%H%M}",
+                replace_existing=True,  # Un solo job per fascia, anche con più prenotazioni
+                misfire_grace_time=300  # Tollera 5 minuti di ritardo
             )
-            
-            logger.info(f"🔔 Schedulata notifica 10min prima per booking {booking_id} alle {ten_minutes_before}")
+            logger.info(f"📅 Promemoria {minutes_before} min prima per booking {booking_id} alle {run_date}")
         
     except Exception as e:
         logger.error(f"❌ Errore nello scheduling notifiche per booking {booking_id}: {e}")
@@ -195,6 +215,16 @@ def start_scheduler():
     Chiamata all'avvio dell'applicazione (in main.py).
     """
     if not scheduler.running:
+        # Worker dell'outbox email: un'esecuzione alla volta, quelle perse non si accumulano
+        scheduler.add_job(
+            drain_email_outbox,
+            trigger=IntervalTrigger(seconds=EMAIL_OUTBOX_INTERVAL),
+            id="email_outbox_drain",
+            jobstore="memory",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
         scheduler.start()
         logger.info("🚀 APScheduler avviato con successo")
 
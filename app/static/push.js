@@ -0,0 +1,62 @@
+// Canale push (WebSocket /ws) per messaggi, notifiche e badge dei non letti.
+//
+// Ogni evento ricevuto viene rilanciato come `helpy:push` su window
+// (event.detail = {type, ...}); le pagine ricaricano la parte interessata con
+// le API esistenti. Finché window.helpyPush.connected è false i poller delle
+// pagine restano attivi come fallback.
+(function () {
+    if (!('WebSocket' in window)) {
+        window.helpyPush = { connected: false };
+        return;
+    }
+
+    const MIN_RETRY_MS = 1000;
+    const MAX_RETRY_MS = 30000;
+
+    const state = { connected: false };
+    window.helpyPush = state;
+
+    let retryDelay = MIN_RETRY_MS;
+    let hasConnected = false;
+
+    function emit(detail) {
+        window.dispatchEvent(new CustomEvent('helpy:push', { detail: detail }));
+    }
+
+    function connect() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws`);
+
+        socket.onopen = () => {
+            state.connected = true;
+            retryDelay = MIN_RETRY_MS;
+            // Dopo una riconnessione gli eventi persi vanno recuperati
+            if (hasConnected) {
+                emit({ type: 'resync' });
+            }
+            hasConnected = true;
+        };
+
+        socket.onmessage = (event) => {
+            let data;
+            try {
+                data = JSON.parse(event.data);
+            } catch (error) {
+                return;
+            }
+            if (data.type !== 'ping') {
+                emit(data);
+            }
+        };
+
+        socket.onclose = (event) => {
+            state.connected = false;
+            // 1008: non autenticato, inutile riprovare (resta il polling)
+            if (event.code === 1008) return;
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, MAX_RETRY_MS);
+        };
+    }
+
+    connect();
+})();
@@ -8,9 +8,12 @@ import requests
 import base64
 import boto3
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 
+from app.utils.outbound import outbound
+
 load_dotenv()
 
 # Credenziali Agora
@@ -39,6 +42,10 @@ def get_agora_auth_header() -> str:
     encoded = base64.b64encode(credentials.encode()).decode()
     return f"Basic {encoded}"
 
+def agora_post(url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+    """POST verso l'API Agora tramite l'executor delle chiamate esterne (limite e timeout)"""
+    return outbound.call("agora", requests.post, url, json=payload, headers=headers, timeout=outbound.timeout("agora"))
+
 
 def start_recording(channel_name: str, uid: int, token: str) -> Optional[Dict[str, Any]]:
     """
@@ -69,7 +76,7 @@ def start_recording(channel_name: str, uid: int, token: str) -> Optional[Dict[st
             "Authorization": get_agora_auth_header()
         }
         
-        response = requests.post(acquire_url, json=acquire_payload, headers=headers)
+        response = agora_post(acquire_url, acquire_payload, headers)
         
         if response.status_code != 200:
             print(f"❌ Errore acquire: {response.status_code} - {response.text}")
@@ -113,7 +120,7 @@ def start_recording(channel_name: str, uid: int, token: str) -> Optional[Dict[st
             }
         }
         
-        response = requests.post(start_url, json=start_payload, headers=headers)
+        response = agora_post(start_url, start_payload, headers)
         
         if response.status_code != 200:
             print(f"❌ Errore start recording: {response.status_code} - {response.text}")
@@ -161,7 +168,7 @@ def stop_recording(resource_id: str, sid: str, channel_name: str, uid: int) -> O
             "Authorization": get_agora_auth_header()
         }
         
-        response = requests.post(stop_url, json=stop_payload, headers=headers)
+        response = agora_post(stop_url, stop_payload, headers)
         
         if response.status_code != 200:
             print(f"❌ Errore stop recording: {response.status_code} - {response.text}")
@@ -195,6 +202,16 @@ def stop_recording(resource_id: str, sid: str, channel_name: str, uid: int) -> O
         return None
 
 
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Client S3 condiviso (thread-safe): crearlo a ogni richiesta costa più della firma"""
+    return boto3.client(
+        's3',
+        region_name=AWS_S3_REGION,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY
+    )
+
 def get_recording_url(file_name: str) -> str:
     """
     Genera URL firmato per accedere al file registrato su S3
@@ -206,15 +223,9 @@ def get_recording_url(file_name: str) -> str:
         URL firmato valido per 7 giorni
     """
     try:
-        s3_client = boto3.client(
-            's3',
-            region_name=AWS_S3_REGION,
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-        )
-        
-        # Genera URL firmato valido per 7 giorni
-        url = s3_client.generate_presigned_url(
+        # Genera URL firmato valido per 7 giorni (firma locale, nessuna chiamata di rete:
+        # non passa dal pool delle chiamate esterne)
+        url = get_s3_client().generate_presigned_url(
             'get_object',
             Params={'Bucket': AWS_S3_BUCKET_NAME, 'Key': file_name},
             ExpiresIn=604800  # 7 giorni in secondi
@@ -0,0 +1,61 @@
+"""
+Disponibilità ricorrente: regole settimanali (AvailabilityRule) ed eccezioni
+(AvailabilityException) espanse in blocchi al momento della richiesta degli slot.
+
+Le regole non creano righe in availability_block: per ogni giorno richiesto
+diventano blocchi virtuali (BlockRow senza id) per il motore degli slot.
+
+Precedenza in un giorno:
+1. blocchi salvati per quel giorno (save / copy): sostituiscono la regola;
+2. eccezione per quel giorno: nessuna disponibilità dalle regole;
+3. regole attive per il giorno della settimana, nel periodo di validità.
+"""
+from datetime import date
+from typing import Collection, Dict, Iterable, List
+
+from app.models import AvailabilityRule
+from app.utils.date_filters import parse_day
+from app.utils.slot_cache import BlockRow
+
+
+def rule_applies_on(rule: AvailabilityRule, day: date) -> bool:
+    """True se la regola vale nel giorno (giorno della settimana e periodo di validità)"""
+    if not rule.is_active or rule.weekday != day.weekday():
+        return False
+    if rule.valid_from is not None and day < parse_day(rule.valid_from):
+        return False
+    if rule.valid_until is not None and day > parse_day(rule.valid_until):
+        return False
+    return True
+
+
+def rule_blocks_by_day(
+    rules: Iterable[AvailabilityRule],
+    exception_days: Collection[date],
+    days: Iterable[date]
+) -> Dict[date, List[BlockRow]]:
+    """
+    Blocchi virtuali delle regole per ogni giorno (solo i giorni con almeno un blocco).
+
+    Args:
+        rules: Regole del consulente
+        exception_days: Giorni esclusi dalle eccezioni
+        days: Giorni richiesti (quelli con blocchi salvati vanno già esclusi)
+    """
+    by_weekday: Dict[int, List[AvailabilityRule]] = {}
+    for rule in rules:
+        by_weekday.setdefault(rule.weekday, []).append(rule)
+
+    blocks: Dict[date, List[BlockRow]] = {}
+    for day in days:
+        if day in exception_days:
+            continue
+        day_blocks = [
+            BlockRow(None, rule.start_time, rule.end_time)
+            for rule in sorted(by_weekday.get(day.weekday(), ()), key=lambda rule: rule.start_time)
+            if rule_applies_on(rule, day)
+        ]
+        if day_blocks:
+            blocks[day] = day_blocks
+    return blocks
+
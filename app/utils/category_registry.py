@@ -0,0 +1,108 @@
+"""
+Registro delle categorie condiviso dal processo.
+
+Le categorie sono poche e cambiano raramente, ma servono a quasi ogni pagina
+(menu, filtri, badge dei consulenti). Il registro le carica una volta sola e
+le serve dalla memoria: liste e lookup per ID senza query.
+
+Viene invalidato automaticamente quando una Category viene inserita,
+modificata o eliminata tramite ORM (eventi SQLAlchemy) e, per le modifiche
+fatte da altri worker o direttamente sul database, ricaricato comunque dopo
+CATEGORY_CACHE_TTL secondi.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import Category
+from app.logger_config import logger
+
+# Dopo quanti secondi ricaricare comunque le categorie dal database
+CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL", "300"))
+
+
+class CategoryRegistry:
+    """Cache thread-safe delle categorie (oggetti detached, sola lettura)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # Un solo ricaricamento alla volta
+        self._categories: Tuple[Category, ...] = ()
+        self._by_id: Dict[int, Category] = {}
+        self._loaded_at: Optional[float] = None
+
+    def load(self):
+        """(Ri)carica tutte le categorie ordinate per nome"""
+        with Session(engine) as session:
+            categories = tuple(session.exec(select(Category).order_by(Category.name)).all())
+
+        with self._lock:
+            self._categories = categories
+            self._by_id = {category.id: category for category in categories}
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"🏷️ Category registry loaded: {len(categories)} categories")
+
+    def needs_reload(self) -> bool:
+        """True se mai caricato, invalidato o più vecchio di CATEGORY_CACHE_TTL"""
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > CATEGORY_CACHE_TTL
+
+    def _ensure_loaded(self):
+        if not self.needs_reload():
+            return
+        with self._load_lock:
+            # Le altre richieste in attesa trovano il registro già ricaricato
+            if self.needs_reload():
+                self.load()
+
+    def all(self) -> List[Category]:
+        """Tutte le categorie ordinate per nome"""
+        self._ensure_loaded()
+        return list(self._categories)
+
+    def cached(self) -> List[Category]:
+        """Categorie in memoria, senza mai interrogare il database (anche se scadute)"""
+        return list(self._categories)
+
+    def get(self, category_id: Optional[int]) -> Optional[Category]:
+        """Categoria per ID (None se assente o non trovata)"""
+        if not category_id:
+            return None
+        self._ensure_loaded()
+        return self._by_id.get(category_id)
+
+    def invalidate(self):
+        """Forza il ricaricamento al prossimo accesso"""
+        with self._lock:
+            self._loaded_at = None
+
+
+# Istanza condivisa dal processo
+category_registry = CategoryRegistry()
+
+
+# ========== INVALIDAZIONE AUTOMATICA ==========
+
+def _mark_categories_changed(mapper, connection, target):
+    # Invalida subito e ricorda alla sessione di farlo di nuovo al commit, così
+    # un ricaricamento avvenuto tra flush e commit non resta in cache
+    category_registry.invalidate()
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['categories_changed'] = True
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event_name, _mark_categories_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('categories_changed', False):
+        category_registry.invalidate()
@@ -0,0 +1,151 @@
+"""
+Riepilogo denormalizzato delle conversazioni.
+
+Ogni Conversation tiene ultimo messaggio (id, anteprima, data, mittente),
+contatori dei non letti per ciascun lato e numero totale di messaggi, così
+inbox, widget chat e badge dei non letti leggono una riga per conversazione
+invece di ricalcolare aggregati sulla tabella messages.
+
+Le funzioni vanno chiamate nella stessa transazione della modifica ai
+messaggi (prima del commit). Gli incrementi sono UPDATE atomici lato database,
+quindi due invii concorrenti non si perdono a vicenda.
+
+Per ricalcolare tutti i riepiloghi su DATABASE_URL (come la migrazione
+migration_add_conversation_summary.sql, es. dopo correzioni manuali ai messaggi):
+
+    python -m app.utils.conversation_summary
+"""
+from sqlalchemy import update
+from sqlmodel import select, func, and_, case
+
+from app.models import Conversation, Message
+
+# Lunghezza massima dell'anteprima salvata sulla conversazione
+PREVIEW_LENGTH = 200
+
+SUMMARY_FIELDS = [
+    'last_message_id', 'last_message_preview', 'last_message_at', 'last_message_sender_id',
+    'unread_for_user1', 'unread_for_user2', 'message_count', 'updated_at'
+]
+
+
+def unread_column(conversation: Conversation, reader_id: int):
+    """Colonna dei non letti per il lato del lettore"""
+    if reader_id == conversation.user1_id:
+        return Conversation.unread_for_user1
+    return Conversation.unread_for_user2
+
+
+def unread_for(conversation: Conversation, reader_id: int) -> int:
+    """Messaggi non letti dal lettore in questa conversazione"""
+    if reader_id == conversation.user1_id:
+        return conversation.unread_for_user1 or 0
+    return conversation.unread_for_user2 or 0
+
+
+def _update_summary(session, conversation: Conversation, values: dict):
+    session.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation.id)
+        .values(values)
+        .execution_options(synchronize_session=False)
+    )
+    # L'istanza in sessione non conosce i nuovi valori: verranno riletti al prossimo accesso
+    session.expire(conversation, SUMMARY_FIELDS)
+
+
+def record_new_message(session, conversation: Conversation, message: Message):
+    """Aggiorna il riepilogo dopo session.add(message)"""
+    session.flush()  # Assegna message.id
+
+    recipient_id = conversation.user2_id if message.sender_id == conversation.user1_id else conversation.user1_id
+    recipient_unread = unread_column(conversation, recipient_id)
+
+    _update_summary(session, conversation, {
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_preview: (message.content or '')[:PREVIEW_LENGTH],
+        Conversation.last_message_at: message.created_at,
+        Conversation.last_message_sender_id: message.sender_id,
+        recipient_unread: recipient_unread + 1,
+        Conversation.message_count: Conversation.message_count + 1,
+        Conversation.updated_at: message.created_at,
+    })
+
+
+def mark_conversation_read(session, conversation: Conversation, reader_id: int, read_count: int):
+    """
+    Scala dai non letti del lettore i messaggi appena marcati come letti
+    (read_count = rowcount dell'update di is_read sui messaggi).
+
+    Non si azzera il contatore: un messaggio inviato tra l'update di is_read
+    e questo resta non letto e deve restare nel conteggio.
+    """
+    column = unread_column(conversation, reader_id)
+    _update_summary(session, conversation, {
+        column: case((column > read_count, column - read_count), else_=0)
+    })
+
+
+def _summary_values():
+    """Valori del riepilogo ricalcolati dai messaggi (subquery correlate a conversations)"""
+    def last_message(column):
+        return (
+            select(column)
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+
+    def unread_from(sender_column):
+        return (
+            select(func.count(Message.id))
+            .where(
+                and_(
+                    Message.conversation_id == Conversation.id,
+                    Message.sender_id == sender_column,
+                    Message.is_read == False
+                )
+            )
+            .scalar_subquery()
+        )
+
+    return {
+        Conversation.last_message_id: last_message(Message.id),
+        Conversation.last_message_preview: last_message(func.substr(Message.content, 1, PREVIEW_LENGTH)),
+        Conversation.last_message_at: last_message(Message.created_at),
+        Conversation.last_message_sender_id: last_message(Message.sender_id),
+        Conversation.unread_for_user1: unread_from(Conversation.user2_id),
+        Conversation.unread_for_user2: unread_from(Conversation.user1_id),
+        Conversation.message_count: (
+            select(func.count(Message.id))
+            .where(Message.conversation_id == Conversation.id)
+            .scalar_subquery()
+        ),
+    }
+
+
+def rebuild_conversation_summary(session, conversation: Conversation):
+    """Ricalcola il riepilogo di una conversazione (es. dopo l'eliminazione di un messaggio)"""
+    session.flush()
+    _update_summary(session, conversation, _summary_values())
+
+
+def backfill_conversation_summaries(session) -> int:
+    """Ricalcola il riepilogo di tutte le conversazioni (vedi migration_add_conversation_summary.sql)"""
+    result = session.execute(
+        update(Conversation)
+        .values(_summary_values())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from app.database import get_session
+    from app.logger_config import logger
+
+    with get_session() as session:
+        updated = backfill_conversation_summaries(session)
+        session.commit()
+    logger.info(f"✅ Riepilogo ricalcolato per {updated} conversazioni")
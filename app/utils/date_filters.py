@@ -0,0 +1,52 @@
+"""
+Filtri per giorno sulle colonne datetime (AvailabilityBlock.date, Booking.booking_date).
+
+func.date(colonna) == 'YYYY-MM-DD' applica una funzione alla colonna: il
+database non può usare gli indici e scansiona tutte le righe. Qui il giorno
+diventa un intervallo semiaperto [giorno, giorno successivo) sulla colonna
+così com'è, che usa gli indici compositi (user_id, date, ...) e
+(consultant_user_id, booking_date, ...).
+
+I limiti sono legati come DATE e non come DATETIME: su SQLite le righe
+inserite a mano dagli script SQL hanno la data senza ora ('2025-11-03'),
+che come stringa è minore di '2025-11-03 00:00:00.000000' e resterebbe fuori
+dal giorno; '2025-11-03' <= valore < '2025-11-04' le comprende tutte.
+Su PostgreSQL il confronto timestamp/date è lo stesso intervallo.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+
+from sqlalchemy import Date, and_, literal
+
+DayLike = Union[str, date]
+
+
+def parse_day(day: DayLike) -> date:
+    """Giorno da stringa YYYY-MM-DD, date o datetime (ValueError se il formato non è valido)"""
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    return datetime.strptime(day, '%Y-%m-%d').date()
+
+
+def between_days(column, first_day: DayLike, last_day: Optional[DayLike] = None):
+    """
+    Condizione column in [first_day, last_day + 1 giorno): i giorni sono inclusi.
+
+    Args:
+        column: Colonna datetime (es. AvailabilityBlock.date)
+        first_day: Primo giorno
+        last_day: Ultimo giorno incluso (default: solo first_day)
+    """
+    first = parse_day(first_day)
+    last = parse_day(last_day) if last_day is not None else first
+    return and_(
+        column >= literal(first, Date),
+        column < literal(last + timedelta(days=1), Date)
+    )
+
+
+def on_day(column, day: DayLike):
+    """Condizione column nel giorno day (sostituisce func.date(column) == day)"""
+    return between_days(column, day)
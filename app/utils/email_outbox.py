@@ -0,0 +1,285 @@
+"""
+Outbox delle email di notifica.
+
+Le notifiche non chiamano più SendGrid durante la richiesta: enqueue_email()
+aggiunge una riga EmailOutbox nella stessa transazione della Notification e
+il job drain_email_outbox (APScheduler, ogni EMAIL_OUTBOX_INTERVAL secondi)
+la invia in background:
+
+- claim a lotti con UPDATE condizionale + claim_token: con più worker ogni
+  email viene presa da uno solo; se il processo muore durante l'invio il
+  claim scade dopo EMAIL_OUTBOX_CLAIM_TIMEOUT e l'email torna disponibile;
+- le email del lotto con lo stesso template partono con una sola richiesta
+  SendGrid (personalizations, vedi send_batch_emails); se il lotto viene
+  rifiutato per un errore definitivo si riprova un destinatario alla volta;
+- errori temporanei (timeout, 429, 5xx): nuovo tentativo con backoff
+  esponenziale fino a EMAIL_OUTBOX_MAX_ATTEMPTS, poi 'failed';
+- errori definitivi (template mancante, altri 4xx): 'failed' subito;
+- idempotency_key: la stessa email non viene accodata due volte.
+"""
+import json
+import os
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sendgrid.helpers.mail import CustomArg
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.database import get_session
+from app.logger_config import logger
+from app.models import EmailOutbox
+from app.utils.email import send_with_sendgrid
+from app.utils.notification_email import (
+    EmailRecipient, build_notification_message, get_sendgrid_api_key, send_batch_emails
+)
+
+# Ogni quanti secondi il worker controlla l'outbox
+EMAIL_OUTBOX_INTERVAL = float(os.getenv("EMAIL_OUTBOX_INTERVAL", "5"))
+
+# Email prese in carico per lotto (quelle con lo stesso template partono con una richiesta)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "500"))
+
+# Tentativi massimi prima di segnare l'email come 'failed'
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+
+# Backoff tra i tentativi: 30 s, 1 min, 2 min... fino a 1 ora
+EMAIL_OUTBOX_BASE_BACKOFF = float(os.getenv("EMAIL_OUTBOX_BASE_BACKOFF", "30"))
+EMAIL_OUTBOX_MAX_BACKOFF = float(os.getenv("EMAIL_OUTBOX_MAX_BACKOFF", "3600"))
+
+# Dopo quanto un claim non completato torna disponibile per altri worker
+EMAIL_OUTBOX_CLAIM_TIMEOUT = float(os.getenv("EMAIL_OUTBOX_CLAIM_TIMEOUT", "300"))
+
+
+def enqueue_email(
+    session: Session,
+    to_email: str,
+    to_name: Optional[str],
+    subject: str,
+    template_name: str,
+    template_data: Optional[Dict[str, str]] = None,
+    idempotency_key: Optional[str] = None,
+    notification_id: Optional[int] = None
+) -> Optional[EmailOutbox]:
+    """
+    Accoda un'email nell'outbox senza fare commit: entra nella transazione del chiamante.
+
+    Returns:
+        La riga accodata, None se un'email con la stessa idempotency_key esiste già
+    """
+    queued = enqueue_emails(session, [build_outbox_email(
+        to_email, to_name, subject, template_name, template_data, idempotency_key, notification_id
+    )])
+    return queued[0] if queued else None
+
+
+def build_outbox_email(
+    to_email: str,
+    to_name: Optional[str],
+    subject: str,
+    template_name: str,
+    template_data: Optional[Dict[str, str]] = None,
+    idempotency_key: Optional[str] = None,
+    notification_id: Optional[int] = None
+) -> EmailOutbox:
+    """Riga EmailOutbox da passare a enqueue_emails (chiave casuale se non indicata)"""
+    return EmailOutbox(
+        idempotency_key=idempotency_key or f"email:{uuid.uuid4().hex}",
+        to_email=to_email,
+        to_name=to_name,
+        subject=subject,
+        template_name=template_name,
+        template_data=json.dumps(template_data or {}, default=str),
+        notification_id=notification_id
+    )
+
+
+def enqueue_emails(session: Session, emails: List[EmailOutbox]) -> List[EmailOutbox]:
+    """
+    Accoda più email con una sola query sulle idempotency_key già presenti, senza commit.
+
+    Returns:
+        Le righe accodate (escluse quelle con una chiave già in outbox o ripetuta nel lotto)
+    """
+    keys = {email.idempotency_key for email in emails}
+    existing = set()
+    if keys:
+        existing = set(session.exec(
+            select(EmailOutbox.idempotency_key).where(EmailOutbox.idempotency_key.in_(keys))
+        ).all())
+
+    queued = []
+    for email in emails:
+        if email.idempotency_key in existing:
+            logger.info(f"⏭️ Email '{email.idempotency_key}' già in outbox, skip")
+            continue
+        existing.add(email.idempotency_key)
+        queued.append(email)
+
+    session.add_all(queued)
+    return queued
+
+
+# ========== WORKER ==========
+
+def drain_email_outbox(batch_size: int = EMAIL_OUTBOX_BATCH_SIZE) -> int:
+    """
+    Invia le email in attesa (job dello scheduler).
+    Continua a lotti finché ci sono email scadute; restituisce quante sono state inviate.
+    """
+    api_key = get_sendgrid_api_key()
+    if not api_key:
+        # Senza SendGrid le email restano in attesa finché non viene configurato
+        return 0
+
+    sent = 0
+    while True:
+        emails, token = claim_emails(batch_size)
+        by_template: Dict[str, List[EmailOutbox]] = defaultdict(list)
+        for email in emails:
+            by_template[email.template_name].append(email)
+        for template_name, group in by_template.items():
+            outcomes = _send_group(api_key, template_name, group)
+            _record_outcomes(token, outcomes)
+            sent += sum(1 for _, error, _ in outcomes if error is None)
+        if len(emails) < batch_size:
+            return sent
+
+
+def claim_emails(batch_size: int) -> Tuple[List[EmailOutbox], str]:
+    """Prende in carico un lotto di email scadute (pending o claim scaduto)"""
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimable = (
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now
+    )
+
+    with get_session() as session:
+        ids = session.exec(
+            select(EmailOutbox.id)
+            .where(*claimable)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            return [], token
+
+        # Le condizioni ripetute nell'UPDATE escludono le email prese nel frattempo da un altro worker
+        session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids), *claimable)
+            .values(
+                status="sending",
+                claim_token=token,
+                attempts=EmailOutbox.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=EMAIL_OUTBOX_CLAIM_TIMEOUT)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+        emails = session.exec(select(EmailOutbox).where(EmailOutbox.claim_token == token)).all()
+        return list(emails), token
+
+
+# Esito di un'email: (email, errore o None se inviata, errore definitivo)
+Outcome = Tuple[EmailOutbox, Optional[str], bool]
+
+
+def _send_group(api_key: str, template_name: str, emails: List[EmailOutbox]) -> List[Outcome]:
+    """Invia le email di uno stesso template: una richiesta sola se sono più di una"""
+    if len(emails) == 1:
+        error, permanent = _deliver(api_key, emails[0])
+        return [(emails[0], error, permanent)]
+
+    recipients = [
+        EmailRecipient(
+            to_email=email.to_email,
+            to_name=email.to_name,
+            subject=email.subject,
+            template_data=json.loads(email.template_data or "{}"),
+            custom_args={"outbox_key": email.idempotency_key}
+        )
+        for email in emails
+    ]
+    try:
+        send_batch_emails(api_key, template_name, recipients)
+    except ValueError as e:
+        return [(email, str(e), True) for email in emails]
+    except Exception as e:
+        error, permanent = _describe_error(e)
+        if permanent:
+            # Un destinatario non valido fa rifiutare tutto il lotto: uno alla volta
+            logger.warning(f"⚠️ Lotto '{template_name}' rifiutato ({error}), invio singolo di {len(emails)} email")
+            return [outcome for email in emails for outcome in _send_group(api_key, template_name, [email])]
+        return [(email, error, False) for email in emails]
+    return [(email, None, False) for email in emails]
+
+
+def _record_outcomes(token: str, outcomes: List[Outcome]):
+    now = datetime.utcnow()
+    # Solo se il claim è ancora nostro (non scaduto e ripreso da un altro worker)
+    claimed = EmailOutbox.claim_token == token
+
+    with get_session() as session:
+        sent_ids = [email.id for email, error, _ in outcomes if error is None]
+        if sent_ids:
+            session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(sent_ids), claimed)
+                .values(status="sent", sent_at=now, last_error=None, claim_token=None)
+                .execution_options(synchronize_session=False)
+            )
+            logger.info(f"📧 {len(sent_ids)} email inviate dall'outbox")
+
+        for email, error, permanent in outcomes:
+            if error is None:
+                continue
+            if permanent or email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                values = {"status": "failed"}
+                logger.error(f"❌ Email {email.id} a {email.to_email} scartata dopo {email.attempts} tentativi: {error}")
+            else:
+                values = {"status": "pending", "next_attempt_at": now + retry_delay(email.attempts)}
+                logger.warning(f"⚠️ Email {email.id} a {email.to_email} non inviata (tentativo {email.attempts}), riprovo: {error}")
+            session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == email.id, claimed)
+                .values(last_error=error, claim_token=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+        session.commit()
+
+
+def _deliver(api_key: str, email: EmailOutbox) -> Tuple[Optional[str], bool]:
+    """Invia l'email; restituisce (errore, definitivo) oppure (None, False) se inviata"""
+    message = build_notification_message(
+        email.to_email, email.to_name, email.subject, email.template_name, json.loads(email.template_data or "{}")
+    )
+    if message is None:
+        return f"Template {email.template_name} non trovato", True
+
+    # Chiave dell'outbox tra i custom args: permette di riconciliare gli eventi SendGrid
+    message.custom_arg = CustomArg("outbox_key", email.idempotency_key)
+
+    try:
+        send_with_sendgrid(api_key, message)
+    except Exception as e:
+        return _describe_error(e)
+    return None, False
+
+
+def _describe_error(error: Exception) -> Tuple[str, bool]:
+    """Messaggio dell'errore e se è definitivo (4xx tranne 429) o da riprovare"""
+    status_code = getattr(error, "status_code", None)
+    permanent = status_code is not None and 400 <= status_code < 500 and status_code != 429
+    return f"{type(error).__name__}: {error}"[:500], permanent
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff esponenziale con un po' di jitter (evita che i retry ripartano tutti insieme)"""
+    delay = min(EMAIL_OUTBOX_MAX_BACKOFF, EMAIL_OUTBOX_BASE_BACKOFF * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
@@ -0,0 +1,98 @@
+"""
+Matcher precompilato per lo scoring di rilevanza dei consulenti.
+
+calculate_relevance_score unisce e mette in lowercase i campi dell'utente a
+ogni chiamata e poi esegue un controllo `keyword in user_text` per ogni keyword
+originale ed espansa (anche 20+ termini per keyword dopo expand_with_skills),
+comprese quelle ripetute nelle due liste. KeywordMatcher prepara una sola volta
+per query le keyword distinte con i punti già sommati, lavora sul testo in
+cache nell'indice di ricerca e memorizza i punti per insieme di match e per
+professione, che si ripetono spesso tra profili diversi.
+
+Lo score è identico a calculate_relevance_score
+(vedi benchmarks/bench_relevance_score.py).
+"""
+from typing import Dict, List, Tuple
+
+# Campi testuali nell'ordine usato da calculate_relevance_score
+TEXT_FIELDS = ('nome', 'cognome', 'professione', 'descrizione', 'aree_interesse')
+
+
+def user_text(user) -> Tuple[str, Tuple[int, int]]:
+    """
+    Testo lowercase dell'utente e posizione (inizio, fine) della professione.
+
+    Se l'oggetto ha già testo e span precalcolati (IndexedUser dell'indice di
+    ricerca) li riusa, altrimenti li calcola al volo.
+    """
+    text = getattr(user, 'text', None)
+    if text is not None:
+        return text, user.prof_span
+
+    parts = []
+    prof_span = (0, 0)
+    position = 0
+    for field in TEXT_FIELDS:
+        value = (getattr(user, field, None) or '').lower()
+        if not value:
+            continue
+        if parts:
+            position += 1
+        if field == 'professione':
+            prof_span = (position, position + len(value))
+        parts.append(value)
+        position += len(value)
+
+    return ' '.join(parts), prof_span
+
+
+class KeywordMatcher:
+    """Keyword originali ed espanse preparate una volta per query"""
+
+    def __init__(self, keywords: List[str], expanded_keywords: List[str]):
+        # Punti per keyword trovata nel testo (+10 originale, +5 espansa, cumulativi
+        # come nel loop di calculate_relevance_score) e in professione (+3)
+        self.text_points: Dict[str, int] = {}
+        self.prof_points: Dict[str, int] = {}
+        for keyword in keywords:
+            self.text_points[keyword] = self.text_points.get(keyword, 0) + 10
+            self.prof_points[keyword] = self.prof_points.get(keyword, 0) + 3
+        for keyword in expanded_keywords:
+            self.text_points[keyword] = self.text_points.get(keyword, 0) + 5
+
+        # La stringa vuota è contenuta in ogni testo (e in ogni professione non vuota)
+        self.empty_text_points = self.text_points.pop('', 0)
+        self.empty_prof_points = self.prof_points.pop('', 0)
+
+        # Ogni keyword distinta viene cercata una sola volta per testo
+        self.patterns = tuple(self.text_points)
+        self.prof_patterns = tuple(self.prof_points)
+
+        self._text_cache: Dict[Tuple[str, ...], int] = {}
+        self._prof_cache: Dict[str, int] = {}
+
+    def score(self, user) -> float:
+        """Score di rilevanza (stessa formula di calculate_relevance_score)"""
+        text, (prof_start, prof_end) = user_text(user)
+
+        score = (user.bollini or 0) * 2 + (user.consulenze_vendute or 0)
+        score += self.empty_text_points
+
+        # Molti profili producono lo stesso insieme di match: punti memorizzati per insieme
+        found = tuple([pattern for pattern in self.patterns if pattern in text])
+        text_points = self._text_cache.get(found)
+        if text_points is None:
+            text_points = self._text_cache[found] = sum(self.text_points[pattern] for pattern in found)
+        score += text_points
+
+        # Le professioni distinte sono poche: punti memorizzati per professione
+        if prof_end > prof_start:
+            profession = text[prof_start:prof_end]
+            prof_points = self._prof_cache.get(profession)
+            if prof_points is None:
+                prof_points = self._prof_cache[profession] = self.empty_prof_points + sum(
+                    self.prof_points[pattern] for pattern in self.prof_patterns if pattern in profession
+                )
+            score += prof_points
+
+        return float(score)
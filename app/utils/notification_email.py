@@ -1,13 +1,32 @@
 """
 Utility per l'invio di email notifiche usando SendGrid.
 
-Gestisce l'invio di email basate su template HTML configurabili.
+Gestisce l'invio di email basate su template HTML configurabili, singole o a
+lotti (send_batch_emails: una richiesta SendGrid per più destinatari dello
+stesso template).
 """
+import html
 import os
-from sendgrid import SendGridAPIClient
+from functools import lru_cache
+from pathlib import Path
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, meta
+from markupsafe import Markup
 from sendgrid.helpers.mail import Mail, Email, To, Content
 from app.logger_config import logger
-from typing import Dict, Optional
+from app.utils.email import send_with_sendgrid, send_sendgrid_payload
+from typing import Dict, List, NamedTuple, Optional
+
+# Limite SendGrid di personalizations (destinatari) per richiesta
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+
+class EmailRecipient(NamedTuple):
+    """Destinatario di un invio a lotti"""
+    to_email: str
+    to_name: Optional[str]
+    subject: str
+    template_data: Dict[str, str]
+    custom_args: Optional[Dict[str, str]] = None
 
 
 def send_notification_email(
@@ -33,32 +52,21 @@ def send_notification_email(
     """
     try:
         # Verifica che SendGrid sia configurato
-        # Usa SMTP_PASSWORD che contiene la chiave API SendGrid
-        sendgrid_api_key = os.getenv('SMTP_PASSWORD')
-        from_email = os.getenv('FROM_EMAIL', 'noreply@helpy.com')
+        sendgrid_api_key = get_sendgrid_api_key()
         
         if not sendgrid_api_key:
             logger.warning("SendGrid API key (SMTP_PASSWORD) non configurata, skip invio email")
             return False
         
-        # Genera l'HTML del template
-        html_content = generate_email_html(template_name, template_data)
+        # Crea il messaggio dal template
+        message = build_notification_message(to_email, to_name, subject, template_name, template_data)
         
-        if not html_content:
+        if not message:
             logger.error(f"Template {template_name} non trovato o errore generazione")
             return False
         
-        # Crea il messaggio
-        message = Mail(
-            from_email=Email(from_email, "Helpy"),
-            to_emails=To(to_email, to_name),
-            subject=subject,
-            html_content=Content("text/html", html_content)
-        )
-        
-        # Invia tramite SendGrid
-        sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
+        # Invia tramite SendGrid (thread pool delle chiamate esterne, con timeout)
+        response = send_with_sendgrid(sendgrid_api_key, message)
         
         if response.status_code in [200, 201, 202]:
             logger.info(f"✅ Email notifica inviata a {to_email}: {subject}")
@@ -72,221 +80,161 @@ def send_notification_email(
         return False
 
 
+def get_sendgrid_api_key() -> Optional[str]:
+    """Chiave API SendGrid (SENDGRID_API_KEY o, come in passato, SMTP_PASSWORD)"""
+    return os.getenv('SENDGRID_API_KEY') or os.getenv('SMTP_PASSWORD')
+
+
+def build_notification_message(
+    to_email: str,
+    to_name: Optional[str],
+    subject: str,
+    template_name: str,
+    template_data: Dict[str, str]
+) -> Optional[Mail]:
+    """Messaggio SendGrid pronto da inviare, None se il template non esiste"""
+    html_content = generate_email_html(template_name, template_data)
+    if not html_content:
+        return None
+    
+    from_email = os.getenv('FROM_EMAIL', 'noreply@helpy.com')
+    return Mail(
+        from_email=Email(from_email, "Helpy"),
+        to_emails=To(to_email, to_name),
+        subject=subject,
+        html_content=Content("text/html", html_content)
+    )
+
+
+def send_batch_emails(api_key: str, template_name: str, recipients: List[EmailRecipient]) -> int:
+    """
+    Invia lo stesso template a più destinatari con le personalizations SendGrid.
+    
+    Il template viene generato una volta sola con i segnaposto {variabile}
+    al posto dei valori; ogni destinatario ha le proprie substitutions (stessi
+    segnaposto, valori già escapati come nel rendering Jinja, stringa vuota
+    per le variabili assenti da template_data), il proprio
+    oggetto e i propri custom_args. Fino a
+    SENDGRID_MAX_PERSONALIZATIONS destinatari per richiesta.
+    
+    Returns:
+        int: Numero di richieste HTTP fatte
+    
+    Raises:
+        ValueError: Template inesistente
+        SendGridError / OutboundTimeoutError: Invio fallito (l'intero lotto)
+    """
+    html_content = generate_email_placeholders_html(template_name)
+    if not html_content:
+        raise ValueError(f"Template {template_name} non trovato")
+    
+    from_email = os.getenv('FROM_EMAIL', 'noreply@helpy.com')
+    variables = sorted(EMAIL_TEMPLATE_VARIABLES[template_name])
+    requests_made = 0
+    
+    for start in range(0, len(recipients), SENDGRID_MAX_PERSONALIZATIONS):
+        chunk = recipients[start:start + SENDGRID_MAX_PERSONALIZATIONS]
+        personalizations = []
+        for recipient in chunk:
+            to = {"email": recipient.to_email}
+            if recipient.to_name:
+                to["name"] = recipient.to_name
+            personalization = {
+                "to": [to],
+                "subject": recipient.subject,
+                # Tutti i segnaposto del template: le variabili mancanti diventano "" come in Jinja
+                "substitutions": {
+                    f"{{{name}}}": html.escape(str(recipient.template_data.get(name, "")))
+                    for name in variables
+                }
+            }
+            if recipient.custom_args:
+                personalization["custom_args"] = recipient.custom_args
+            personalizations.append(personalization)
+        
+        send_sendgrid_payload(api_key, {
+            "from": {"email": from_email, "name": "Helpy"},
+            "subject": chunk[0].subject,
+            "personalizations": personalizations,
+            "content": [{"type": "text/html", "value": html_content}]
+        })
+        requests_made += 1
+    
+    logger.info(f"📧 {len(recipients)} email '{template_name}' inviate con {requests_made} richieste SendGrid")
+    return requests_made
+
+
 def generate_email_html(template_name: str, data: Dict[str, str]) -> Optional[str]:
     """
-    Genera l'HTML dell'email sostituendo le variabili nel template.
+    Genera l'HTML dell'email dal template Jinja2 già compilato.
     
     Args:
         template_name: Nome del template (es: 'booking_confirmed.html')
-        data: Dizionario con le variabili da sostituire
+        data: Dizionario con le variabili del template
     
     Returns:
         str: HTML generato, None se errore
     """
+    template = EMAIL_TEMPLATES.get(template_name)
+    if template is None:
+        logger.error(f"Template {template_name} non trovato")
+        return None
+    
     try:
-        # I template email sono semplici HTML con placeholder {variable}
-        templates = {
-            'booking_confirmed.html': """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-        .footer {{ text-align: center; color: #999; font-size: 12px; margin-top: 30px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📅 Nuova Prenotazione!</h1>
-        </div>
-        <div class="content">
-            <p>Ciao <strong>{consultant_name}</strong>,</p>
-            <p>Hai ricevuto una nuova prenotazione da <strong>{client_name}</strong>!</p>
-            
-            <div class="details">
-                <p><strong>📅 Data:</strong> {date}</p>
-                <p><strong>🕐 Orario:</strong> {time}</p>
-                <p><strong>⏱️ Durata:</strong> {duration} minuti</p>
-            </div>
-            
-            <p>Puoi visualizzare i dettagli della prenotazione e prepararti per la consulenza.</p>
-            
-            <a href="{action_url}" class="button">Visualizza Prenotazione</a>
-            
-            <p style="margin-top: 30px; font-size: 14px; color: #666;">
-                Ti consigliamo di prepararti in anticipo e di essere puntuale per offrire la migliore esperienza al tuo cliente.
-            </p>
-        </div>
-        <div class="footer">
-            <p>Questa è un'email automatica da Helpy. Non rispondere a questo messaggio.</p>
-        </div>
-    </div>
-</body>
-</html>
-""",
-            'reminder_1h.html': """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #f39c12 0%, #e67e22 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #fff9e6; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .button {{ display: inline-block; background: #f39c12; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #f39c12; }}
-        .footer {{ text-align: center; color: #999; font-size: 12px; margin-top: 30px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🔔 Promemoria Consulenza</h1>
-        </div>
-        <div class="content">
-            <p>Ciao <strong>{user_name}</strong>,</p>
-            <p>La tua consulenza con <strong>{other_user_name}</strong> inizia tra <strong>1 ora</strong>!</p>
-            
-            <div class="details">
-                <p><strong>📅 Data:</strong> {date}</p>
-                <p><strong>🕐 Orario inizio:</strong> {time}</p>
-                <p><strong>⏱️ Durata:</strong> {duration} minuti</p>
-            </div>
-            
-            <p>Preparati per la sessione e assicurati di avere una buona connessione internet.</p>
-            
-            <a href="{action_url}" class="button">Vai alla Prenotazione</a>
-            
-            <p style="margin-top: 30px; font-size: 14px; color: #666;">
-                💡 <strong>Suggerimento:</strong> Testa audio e video prima dell'inizio per evitare problemi tecnici.
-            </p>
-        </div>
-        <div class="footer">
-            <p>Questa è un'email automatica da Helpy. Non rispondere a questo messaggio.</p>
-        </div>
-    </div>
-</body>
-</html>
-""",
-            'reminder_10min.html': """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #e74c3c 0%, #c0392b 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #ffebee; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .button {{ display: inline-block; background: #e74c3c; color: white; padding: 15px 40px; text-decoration: none; border-radius: 5px; margin: 20px 0; font-size: 18px; font-weight: bold; }}
-        .details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #e74c3c; }}
-        .urgent {{ background: #fff3cd; padding: 15px; border-radius: 5px; border-left: 4px solid #ffc107; margin: 20px 0; }}
-        .footer {{ text-align: center; color: #999; font-size: 12px; margin-top: 30px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>⏰ Consulenza in Partenza!</h1>
-        </div>
-        <div class="content">
-            <p>Ciao <strong>{user_name}</strong>,</p>
-            <p style="font-size: 18px; font-weight: bold; color: #e74c3c;">La tua consulenza inizia tra 10 MINUTI!</p>
-            
-            <div class="details">
-                <p><strong>👥 Con:</strong> {other_user_name}</p>
-                <p><strong>🕐 Orario:</strong> {time}</p>
-                <p><strong>⏱️ Durata:</strong> {duration} minuti</p>
-            </div>
-            
-            <div class="urgent">
-                <p style="margin: 0; font-weight: bold;">⚠️ Preparati a confermare la tua presenza!</p>
-                <p style="margin: 5px 0 0 0; font-size: 14px;">Tra pochi minuti potrai accedere alla stanza virtuale.</p>
-            </div>
-            
-            <a href="{action_url}" class="button">🚀 Entra nella Stanza</a>
-            
-            <p style="margin-top: 30px; font-size: 14px; color: #666;">
-                ✅ Controlla che audio e video funzionino correttamente<br>
-                ✅ Trova un luogo tranquillo e senza distrazioni<br>
-                ✅ Tieni a portata di mano eventuali documenti necessari
-            </p>
-        </div>
-        <div class="footer">
-            <p>Questa è un'email automatica da Helpy. Non rispondere a questo messaggio.</p>
-        </div>
-    </div>
-</body>
-</html>
-""",
-            'community_contact.html': """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-        .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-        .button {{ display: inline-block; background: #667eea; color: white; padding: 12px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-        .details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #667eea; }}
-        .footer {{ text-align: center; margin-top: 20px; color: #888; font-size: 12px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>💬 Nuovo Messaggio dalla Community</h1>
-        </div>
-        <div class="content">
-            <p>Ciao <strong>{author_name}</strong>,</p>
-            <p style="font-size: 16px;">Qualcuno è interessato alla tua domanda e vuole contattarti!</p>
-            
-            <div class="details">
-                <p><strong>👤 Chi:</strong> {contact_name}</p>
-                <p><strong>📝 La tua domanda:</strong> {question_title}</p>
-                <p><strong>📅 Quando:</strong> {contact_date}</p>
-            </div>
-            
-            <p>Riceverai i suoi messaggi nella sezione chat di Helpy.</p>
-            
-            <a href="{action_url}" class="button">💬 Apri Chat</a>
-            
-            <p style="margin-top: 30px; font-size: 14px; color: #666;">
-                Rispondi velocemente per aumentare le tue possibilità di ricevere una consulenza! 🚀
-            </p>
-        </div>
-        <div class="footer">
-            <p>Questa è un'email automatica da Helpy. Non rispondere a questo messaggio.</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        }
-        
-        template_html = templates.get(template_name)
-        
-        if not template_html:
-            logger.error(f"Template {template_name} non trovato")
-            return None
-        
-        # Sostituisci le variabili nel template
-        html_content = template_html
-        for key, value in data.items():
-            html_content = html_content.replace(f"{{{key}}}", str(value))
-        
-        return html_content
-        
+        return template.render(**data)
     except Exception as e:
         logger.error(f"Errore generazione HTML template {template_name}: {e}")
         return None
+
+
+@lru_cache(maxsize=None)
+def generate_email_placeholders_html(template_name: str) -> Optional[str]:
+    """HTML del template con i segnaposto {variabile} al posto dei valori (per le substitutions SendGrid)"""
+    template = EMAIL_TEMPLATES.get(template_name)
+    if template is None:
+        return None
+    return template.render({name: Markup(f"{{{name}}}") for name in EMAIL_TEMPLATE_VARIABLES[template_name]})
+
+
+# ========== TEMPLATE EMAIL (JINJA2) ==========
+# I template stanno in app/templates/emails/ (uno per NotificationType.email_template)
+# e vengono compilati una sola volta all'import; la cache del bytecode su disco
+# evita di ricompilarli a ogni avvio dei worker.
+
+EMAIL_TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates" / "emails"
+
+email_env = Environment(
+    loader=FileSystemLoader(str(EMAIL_TEMPLATES_DIR)),
+    # Default: cartella temporanea del sistema
+    bytecode_cache=FileSystemBytecodeCache(os.getenv("EMAIL_TEMPLATE_CACHE_DIR")),
+    autoescape=True,  # Nomi e titoli scritti dagli utenti finiscono nell'HTML
+    auto_reload=False
+)
+
+
+def _load_email_templates():
+    templates, variables = {}, {}
+    for name in email_env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        source = email_env.loader.get_source(email_env, name)[0]
+        templates[name] = email_env.get_template(name)
+        variables[name] = frozenset(meta.find_undeclared_variables(email_env.parse(source)))
+    return templates, variables
+
+
+EMAIL_TEMPLATES, EMAIL_TEMPLATE_VARIABLES = _load_email_templates()
+
+
+def check_email_templates() -> List[str]:
+    """Segnala i NotificationType con un email_template che non esiste (chiamata all'avvio)"""
+    from app.utils.notification_type_registry import notification_type_registry
+
+    names = {
+        notification_type.email_template
+        for notification_type in notification_type_registry.all()
+        if notification_type.send_email and notification_type.email_template
+    }
+    missing = sorted(name for name in names if name not in EMAIL_TEMPLATES)
+    for name in missing:
+        logger.warning(f"⚠️ Template email {name} usato dai tipi di notifica ma assente in {EMAIL_TEMPLATES_DIR}")
+    logger.info(f"📧 {len(EMAIL_TEMPLATES)} template email compilati")
+    return missing
@@ -2,14 +2,165 @@
 Sistema centralizzato per l'invio di notifiche in-app ed email.
 
 Gestisce la creazione di notifiche controllando la configurazione
-in notification_types per decidere se inviare in-app e/o email.
+in notification_types (dal registro in memoria) per decidere se inviare
+in-app e/o email.
+
+notify_many() invia lo stesso tipo di notifica a più destinatari con una
+sola transazione: destinatari caricati con una query, righe Notification
+inserite con un solo INSERT, email accodate insieme nell'outbox (le invia
+il worker in background) e un solo commit. send_notification() è la
+scorciatoia per un destinatario.
 """
-from sqlmodel import Session, select
-from app.database import engine
-from app.models import Notification, NotificationType, User
-from app.utils.notification_email import send_notification_email
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert
+from sqlmodel import select
+from app.database import get_session
+from app.models import Notification, User
+from app.utils.email_outbox import build_outbox_email, enqueue_emails
+from app.utils.notification_type_registry import notification_type_registry
+from app.utils.push_hub import publish_to_user
 from app.logger_config import logger
-from typing import Optional, Dict
+from typing import Dict, List, NamedTuple, Optional
+
+
+class NotificationItem(NamedTuple):
+    """Una notifica per notify_many (titolo e messaggio di default dal tipo di notifica)"""
+    user_id: int
+    title: Optional[str] = None
+    message: Optional[str] = None
+    template_data: Optional[Dict[str, str]] = None  # Variabili del template email
+    related_booking_id: Optional[int] = None
+    related_user_id: Optional[int] = None  # Chi ha generato la notifica
+    action_url: Optional[str] = None
+    email_idempotency_key: Optional[str] = None  # Default: legata alla notifica in-app
+
+
+def notify_many(type_key: str, items: List[NotificationItem]) -> int:
+    """
+    Invia una notifica di tipo type_key a più destinatari in una transazione.
+
+    1. Controlla nel registro se il tipo è configurato e attivo
+    2. Se in_app=True: inserisce tutte le notifiche con un solo INSERT
+    3. Se send_email=True: accoda tutte le email nell'outbox (stessa transazione)
+    4. Dopo il commit: push in tempo reale a ogni destinatario
+
+    Args:
+        type_key: Chiave tipo notifica (es: 'booking_confirmed', 'reminder_1h')
+        items: Notifiche da inviare, una per destinatario
+
+    Returns:
+        int: Destinatari per cui è stata creata una notifica o accodata un'email
+    """
+    notif_type = notification_type_registry.get(type_key)
+    if not notif_type or not notif_type.is_active:
+        logger.warning(f"Tipo notifica '{type_key}' non configurato o disattivato")
+        return 0
+
+    if not items:
+        return 0
+
+    try:
+        with get_session() as session:
+            # Destinatari con una sola query
+            user_ids = {item.user_id for item in items}
+            recipients = {
+                user.id: user
+                for user in session.exec(select(User).where(User.id.in_(user_ids))).all()
+            }
+
+            deliverable = []
+            for item in items:
+                user = recipients.get(item.user_id)
+                if not user or not user.email:
+                    logger.error(f"Utente {item.user_id} non trovato o senza email")
+                    continue
+                deliverable.append(item)
+
+            if not deliverable:
+                return 0
+
+            # 1. Notifiche in-app: un solo INSERT
+            notification_ids: List[Optional[int]] = [None] * len(deliverable)
+            if notif_type.in_app:
+                now = datetime.utcnow()
+                table = Notification.__table__
+                inserted = session.execute(
+                    insert(table).returning(table.c.id, table.c.user_id),
+                    [
+                        {
+                            "user_id": item.user_id,
+                            "type": type_key,
+                            "title": item.title or notif_type.name,
+                            "message": item.message if item.message is not None else (notif_type.description or ""),
+                            "related_booking_id": item.related_booking_id,
+                            "related_user_id": item.related_user_id,
+                            "action_url": item.action_url,
+                            "is_read": False,
+                            "created_at": now
+                        }
+                        for item in deliverable
+                    ]
+                ).all()
+                # L'ordine delle righe di RETURNING non è garantito (e chiederlo su SQLite
+                # torna a un INSERT per riga): ID abbinati per destinatario, in ordine crescente
+                ids_by_user: Dict[int, List[int]] = defaultdict(list)
+                for notification_id, user_id in sorted(inserted):
+                    ids_by_user[user_id].append(notification_id)
+                notification_ids = [ids_by_user[item.user_id].pop(0) for item in deliverable]
+
+            # 2. Email (se configurata): accodate insieme nell'outbox
+            email_keys: List[Optional[str]] = [None] * len(deliverable)
+            queued_keys = set()
+            if notif_type.send_email and notif_type.email_template:
+                emails = []
+                for item, notification_id in zip(deliverable, notification_ids):
+                    user = recipients[item.user_id]
+                    user_name = user.nome or user.email.split('@')[0]
+
+                    # Aggiungi dati base al template
+                    template_data = dict(item.template_data or {})
+                    template_data.setdefault('user_name', user_name)
+                    if item.action_url:
+                        template_data.setdefault('action_url', item.action_url)
+
+                    idempotency_key = item.email_idempotency_key
+                    if not idempotency_key and notification_id:
+                        idempotency_key = f"notification:{notification_id}"
+
+                    emails.append(build_outbox_email(
+                        to_email=user.email,
+                        to_name=user_name,
+                        subject=notif_type.email_subject or notif_type.name,
+                        template_name=notif_type.email_template,
+                        template_data=template_data,
+                        idempotency_key=idempotency_key,
+                        notification_id=notification_id
+                    ))
+                email_keys = [email.idempotency_key for email in emails]
+                queued_keys = {email.idempotency_key for email in enqueue_emails(session, emails)}
+
+            # Notifiche ed email confermate insieme
+            session.commit()
+
+        for item, notification_id in zip(deliverable, notification_ids):
+            if notification_id:
+                publish_to_user(item.user_id, "notification", notification_id=notification_id, notification_type=type_key)
+
+        created = sum(1 for notification_id in notification_ids if notification_id)
+        if created:
+            logger.info(f"✅ {created} notifiche in-app '{type_key}' create")
+        if queued_keys:
+            logger.info(f"📬 {len(queued_keys)} email '{type_key}' accodate")
+
+        return sum(
+            1 for notification_id, email_key in zip(notification_ids, email_keys)
+            if notification_id or email_key in queued_keys
+        )
+
+    except Exception as e:
+        logger.error(f"❌ Errore nell'invio notifiche '{type_key}': {e}")
+        return 0
 
 
 def send_notification(
@@ -20,93 +171,22 @@ def send_notification(
     template_data: Optional[Dict[str, str]] = None,
     related_booking_id: Optional[int] = None,
     related_user_id: Optional[int] = None,
-    action_url: Optional[str] = None
+    action_url: Optional[str] = None,
+    email_idempotency_key: Optional[str] = None
 ) -> bool:
     """
-    Invia una notifica controllando la configurazione in notification_types.
-    
-    Questa funzione:
-    1. Controlla in notification_types se il tipo è configurato
-    2. Se in_app=True: crea notifica nel database
-    3. Se send_email=True: invia email usando SendGrid
-    
-    Args:
-        user_id: ID destinatario
-        type_key: Chiave tipo notifica (es: 'booking_confirmed', 'reminder_1h')
-        title: Titolo notifica in-app
-        message: Messaggio notifica in-app
-        template_data: Dati per il template email (dict con variabili)
-        related_booking_id: ID prenotazione correlata (opzionale)
-        related_user_id: ID utente che ha generato la notifica (opzionale)
-        action_url: URL di azione (opzionale)
+    Invia una notifica a un solo destinatario (vedi notify_many).
     
     Returns:
-        bool: True se almeno una notifica è stata inviata con successo
+        bool: True se almeno una notifica è stata creata o accodata
     """
-    try:
-        with Session(engine) as session:
-            # Carica configurazione tipo notifica
-            notif_type = session.exec(
-                select(NotificationType).where(
-                    NotificationType.type_key == type_key,
-                    NotificationType.is_active == True
-                )
-            ).first()
-            
-            if not notif_type:
-                logger.warning(f"Tipo notifica '{type_key}' non configurato o disattivato")
-                return False
-            
-            # Carica dati utente destinatario
-            user = session.get(User, user_id)
-            if not user or not user.email:
-                logger.error(f"Utente {user_id} non trovato o senza email")
-                return False
-            
-            success = False
-            
-            # 1. Notifica in-app (nel database)
-            if notif_type.in_app:
-                notification = Notification(
-                    user_id=user_id,
-                    type=type_key,
-                    title=title,
-                    message=message,
-                    related_booking_id=related_booking_id,
-                    related_user_id=related_user_id,
-                    action_url=action_url,
-                    is_read=False
-                )
-                session.add(notification)
-                session.commit()
-                logger.info(f"✅ Notifica in-app creata per user {user_id}: {title}")
-                success = True
-            
-            # 2. Email (se configurata)
-            if notif_type.send_email and notif_type.email_subject and notif_type.email_template:
-                if not template_data:
-                    template_data = {}
-                
-                # Aggiungi dati base al template
-                if 'user_name' not in template_data:
-                    template_data['user_name'] = user.nome or user.email.split('@')[0]
-                if 'action_url' not in template_data and action_url:
-                    template_data['action_url'] = action_url
-                
-                email_sent = send_notification_email(
-                    to_email=user.email,
-                    to_name=user.nome or user.email.split('@')[0],
-                    subject=notif_type.email_subject,
-                    template_name=notif_type.email_template,
-                    template_data=template_data
-                )
-                
-                if email_sent:
-                    logger.info(f"✅ Email notifica inviata a {user.email}")
-                    success = True
-            
-            return success
-            
-    except Exception as e:
-        logger.error(f"❌ Errore nell'invio notifica: {e}")
-        return False
+    return notify_many(type_key, [NotificationItem(
+        user_id=user_id,
+        title=title,
+        message=message,
+        template_data=template_data,
+        related_booking_id=related_booking_id,
+        related_user_id=related_user_id,
+        action_url=action_url,
+        email_idempotency_key=email_idempotency_key
+    )]) > 0
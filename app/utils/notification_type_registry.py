@@ -0,0 +1,90 @@
+"""
+Registro dei tipi di notifica condiviso dal processo.
+
+notification_types è una tabella piccola che cambia quasi mai, ma veniva letta
+a ogni notifica (invio di un messaggio, raffiche di promemoria). Il registro
+la carica una volta sola e serve i tipi dalla memoria, per chiave.
+
+Come il registro delle categorie viene invalidato quando un NotificationType
+viene modificato tramite ORM e, per le modifiche fatte da altri worker o
+direttamente sul database, ricaricato dopo NOTIFICATION_TYPE_CACHE_TTL secondi
+oppure su richiesta di un amministratore (POST /api/notification-types/reload).
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import NotificationType
+from app.logger_config import logger
+
+# Dopo quanti secondi ricaricare comunque i tipi di notifica dal database
+NOTIFICATION_TYPE_CACHE_TTL = int(os.getenv("NOTIFICATION_TYPE_CACHE_TTL", "300"))
+
+
+class NotificationTypeRegistry:
+    """Cache thread-safe dei tipi di notifica (oggetti detached, sola lettura)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, NotificationType] = {}
+        self._loaded_at: Optional[float] = None
+
+    def load(self):
+        """(Ri)carica tutti i tipi di notifica, attivi e non"""
+        with Session(engine) as session:
+            notification_types = session.exec(select(NotificationType)).all()
+
+        with self._lock:
+            self._by_key = {notification_type.type_key: notification_type for notification_type in notification_types}
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"🔔 Notification type registry loaded: {len(notification_types)} types")
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > NOTIFICATION_TYPE_CACHE_TTL:
+            self.load()
+
+    def get(self, type_key: str) -> Optional[NotificationType]:
+        """Tipo di notifica per chiave (anche se disattivato: il chiamante controlla is_active)"""
+        self._ensure_loaded()
+        return self._by_key.get(type_key)
+
+    def all(self) -> List[NotificationType]:
+        """Tutti i tipi di notifica"""
+        self._ensure_loaded()
+        return list(self._by_key.values())
+
+    def invalidate(self):
+        """Forza il ricaricamento al prossimo accesso"""
+        with self._lock:
+            self._loaded_at = None
+
+
+# Istanza condivisa dal processo
+notification_type_registry = NotificationTypeRegistry()
+
+
+# ========== INVALIDAZIONE AUTOMATICA ==========
+
+def _mark_notification_types_changed(mapper, connection, target):
+    # Come per le categorie: invalida subito e di nuovo al commit
+    notification_type_registry.invalidate()
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['notification_types_changed'] = True
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(NotificationType, _event_name, _mark_notification_types_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('notification_types_changed', False):
+        notification_type_registry.invalidate()
@@ -0,0 +1,135 @@
+"""
+Chiamate verso servizi esterni (Stripe, SendGrid, Agora).
+
+Gli SDK di questi servizi sono bloccanti e una chiamata può durare centinaia
+di millisecondi (o restare appesa se il servizio non risponde). Tutte le
+integrazioni passano da qui:
+
+- un thread pool limitato (OUTBOUND_MAX_WORKERS) esegue le chiamate, così non
+  girano mai nell'event loop e non occupano all'infinito i thread delle route;
+- ogni provider ha un limite di chiamate contemporanee: un servizio lento non
+  si prende tutto il pool e non viene sommerso di richieste;
+- ogni provider ha un timeout: chi chiama riceve OutboundTimeoutError invece
+  di restare in attesa. Il thread non si può interrompere, per questo gli SDK
+  ricevono anche il proprio timeout di rete (vedi timeout()).
+
+Uso:
+    result = outbound.call("agora", requests.post, url, json=payload, timeout=outbound.timeout("agora"))
+    result = await outbound.call_async("stripe", stripe.checkout.Session.create, **params)
+
+Limiti configurabili da environment, per provider:
+    OUTBOUND_<PROVIDER>_CONCURRENCY, OUTBOUND_<PROVIDER>_TIMEOUT (secondi)
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict
+
+from app.logger_config import logger
+
+# Thread massimi per tutte le chiamate esterne del processo
+OUTBOUND_MAX_WORKERS = int(os.getenv("OUTBOUND_MAX_WORKERS", "16"))
+
+# Provider noti: (chiamate contemporanee, timeout in secondi)
+DEFAULT_PROVIDER_LIMITS = {
+    "stripe": (8, 20.0),
+    "sendgrid": (4, 10.0),
+    "agora": (4, 15.0),
+}
+
+
+class OutboundTimeoutError(TimeoutError):
+    """Il provider non ha risposto in tempo (o era saturo per tutto il timeout)"""
+
+
+class ProviderLimit:
+    """Limite di concorrenza e timeout di un provider"""
+
+    def __init__(self, name: str, concurrency: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, timeout: float) -> "ProviderLimit":
+        prefix = f"OUTBOUND_{name.upper()}_"
+        return cls(
+            name,
+            int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+            float(os.getenv(prefix + "TIMEOUT", str(timeout))),
+        )
+
+
+class OutboundExecutor:
+    """Thread pool limitato con semaforo e timeout per provider"""
+
+    def __init__(self, max_workers: int = OUTBOUND_MAX_WORKERS, limits: Dict[str, ProviderLimit] = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="outbound")
+        self._limits = limits if limits is not None else {
+            name: ProviderLimit.from_env(name, concurrency, timeout)
+            for name, (concurrency, timeout) in DEFAULT_PROVIDER_LIMITS.items()
+        }
+
+    def limit(self, provider: str) -> ProviderLimit:
+        try:
+            return self._limits[provider]
+        except KeyError:
+            raise ValueError(f"Provider esterno sconosciuto: {provider}")
+
+    def timeout(self, provider: str) -> float:
+        """Timeout del provider, da passare anche all'SDK come timeout di rete"""
+        return self.limit(provider).timeout
+
+    def call(self, provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Esegue func nel pool e ne attende il risultato (da codice sincrono)"""
+        limit = self.limit(provider)
+        started = time.monotonic()
+        if not limit.semaphore.acquire(timeout=limit.timeout):
+            raise self._timeout_error(limit, "saturo")
+        future = self._submit(limit, func, args, kwargs)
+        try:
+            return future.result(timeout=max(0.0, limit.timeout - (time.monotonic() - started)))
+        except FutureTimeoutError:
+            raise self._timeout_error(limit, "nessuna risposta")
+
+    async def call_async(self, provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Come call() ma attende senza bloccare l'event loop"""
+        limit = self.limit(provider)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + limit.timeout
+        # Attesa del posto libero senza occupare thread
+        while not limit.semaphore.acquire(blocking=False):
+            if loop.time() >= deadline:
+                raise self._timeout_error(limit, "saturo")
+            await asyncio.sleep(0.01)
+        future = self._submit(limit, func, args, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise self._timeout_error(limit, "nessuna risposta")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, limit: ProviderLimit, func, args, kwargs) -> Future:
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except BaseException:
+            limit.semaphore.release()
+            raise
+        # Il posto si libera quando la chiamata finisce davvero, non quando il chiamante smette di aspettare
+        future.add_done_callback(lambda _: limit.semaphore.release())
+        return future
+
+    @staticmethod
+    def _timeout_error(limit: ProviderLimit, reason: str) -> OutboundTimeoutError:
+        logger.warning(f"⏱️ Chiamata {limit.name} scaduta dopo {limit.timeout:.0f}s ({reason})")
+        return OutboundTimeoutError(f"{limit.name}: {reason} entro {limit.timeout}s")
+
+
+# Istanza condivisa dal processo
+outbound = OutboundExecutor()
@@ -0,0 +1,205 @@
+"""
+Broker pub/sub dietro al push hub.
+
+Con un solo worker basta consegnare gli eventi in processo (InMemoryBroker).
+Con più worker uvicorn o più istanze un utente connesso al worker A deve
+ricevere anche gli eventi pubblicati dal worker B: PostgresBroker li
+inoltra con LISTEN/NOTIFY sullo stesso DATABASE_URL, senza servizi in più.
+publish() non tocca il database: la NOTIFY parte da un thread dedicato, così
+le route async che pubblicano non bloccano l'event loop.
+
+Un broker riceve l'hub in start() e gli consegna gli eventi con
+hub.deliver(user_id, event); hub.deliver_all(event) serve per chiedere una
+risincronizzazione a tutti quando la connessione al broker è stata persa.
+"""
+import json
+import os
+import queue
+import select
+import threading
+import uuid
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.logger_config import logger
+
+# Canale NOTIFY condiviso da tutti i worker
+PUSH_CHANNEL = os.getenv("PUSH_CHANNEL", "helpy_push")
+
+# Limite di Postgres per il payload di NOTIFY (8000 byte, con margine)
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Ogni quanti secondi il listener controlla la richiesta di stop
+LISTEN_POLL_SECONDS = 1.0
+
+# Attesa massima tra due tentativi di riconnessione del listener
+MAX_RECONNECT_DELAY = 30
+
+# Eventi in attesa di NOTIFY oltre i quali i nuovi vengono scartati (database irraggiungibile)
+PUSH_PUBLISH_QUEUE_SIZE = int(os.getenv("PUSH_PUBLISH_QUEUE_SIZE", "10000"))
+
+# Eventi inviati al massimo in una transazione dal thread di pubblicazione
+PUBLISH_BATCH_SIZE = 100
+
+# Segnale di arresto per il thread di pubblicazione
+_STOP = object()
+
+
+class PushBroker:
+    """Interfaccia comune dei broker"""
+
+    name = "base"
+
+    def start(self, hub):
+        """Collega il broker all'hub locale e avvia eventuali listener"""
+        self.hub = hub
+
+    def publish(self, user_id: int, event: dict):
+        """Pubblica un evento per l'utente (su tutti i worker)"""
+        raise NotImplementedError
+
+    def stop(self):
+        """Ferma eventuali listener"""
+
+
+class InMemoryBroker(PushBroker):
+    """Un solo worker: consegna diretta alle connessioni di questo processo"""
+
+    name = "memory"
+
+    def publish(self, user_id: int, event: dict):
+        self.hub.deliver(user_id, event)
+
+
+class PostgresBroker(PushBroker):
+    """Più worker/istanze: consegna locale immediata + NOTIFY per gli altri processi"""
+
+    name = "postgres"
+
+    def __init__(self, engine, channel: str = PUSH_CHANNEL):
+        self._engine = engine
+        self._channel = channel
+        # Ogni processo ignora le proprie notifiche (già consegnate localmente)
+        self._origin = uuid.uuid4().hex
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Payload in attesa di NOTIFY, inviati dal thread di pubblicazione
+        self._outbox: queue.Queue = queue.Queue(maxsize=PUSH_PUBLISH_QUEUE_SIZE)
+        self._publisher: Optional[threading.Thread] = None
+
+    def start(self, hub):
+        super().start(hub)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._listen_loop, name="push-broker-listener", daemon=True)
+        self._thread.start()
+        self._publisher = threading.Thread(target=self._publish_loop, name="push-broker-publisher", daemon=True)
+        self._publisher.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._publisher is not None:
+            # Gli eventi già accodati partono prima dell'arresto
+            self._outbox.put(_STOP)
+            self._publisher.join(timeout=LISTEN_POLL_SECONDS * 2)
+            self._publisher = None
+        if self._thread is not None:
+            self._thread.join(timeout=LISTEN_POLL_SECONDS * 2)
+            self._thread = None
+
+    def publish(self, user_id: int, event: dict):
+        self.hub.deliver(user_id, event)
+
+        payload = json.dumps({"o": self._origin, "u": user_id, "e": event}, separators=(",", ":"))
+        if len(payload.encode("utf-8")) > MAX_NOTIFY_PAYLOAD:
+            # Gli eventi sono trigger: se troppo grandi basta chiedere di ricaricare
+            logger.warning(f"⚠️ Push event too large for NOTIFY ({event.get('type')}), sending resync")
+            payload = json.dumps({"o": self._origin, "u": user_id, "e": {"type": "resync"}})
+
+        try:
+            self._outbox.put_nowait(payload)
+        except queue.Full:
+            logger.warning(f"⚠️ Push publish queue full, event for user {user_id} not sent to other workers")
+
+    # ========== PUBBLICAZIONE ==========
+
+    def _publish_loop(self):
+        stopping = False
+        while not stopping:
+            # Attende il primo evento, poi prende anche quelli già accodati
+            payloads = [self._outbox.get()]
+            while len(payloads) < PUBLISH_BATCH_SIZE:
+                try:
+                    payloads.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in payloads:
+                stopping = True
+                payloads = [payload for payload in payloads if payload is not _STOP]
+            if payloads:
+                self._notify(payloads)
+
+    def _notify(self, payloads):
+        # pg_notify viene consegnato agli altri worker al commit, nell'ordine di invio
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    [{"channel": self._channel, "payload": payload} for payload in payloads]
+                )
+        except Exception as e:
+            logger.error(f"❌ Push broker NOTIFY failed, {len(payloads)} events not sent to other workers: {e}")
+
+    # ========== LISTENER ==========
+
+    def _connect(self):
+        # Connessione dedicata, sottratta al pool: resta in LISTEN per tutta la vita del worker
+        raw = self._engine.raw_connection()
+        raw.detach()
+        connection = raw.dbapi_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self._channel}"')
+        return connection
+
+    def _handle(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("⚠️ Invalid push notification payload")
+            return
+        if message.get("o") == self._origin:
+            return
+        self.hub.deliver(message["u"], message["e"])
+
+    def _listen_loop(self):
+        delay = 1
+        connected_before = False
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                delay = 1
+                if connected_before:
+                    # Durante la disconnessione possono essere andati persi degli eventi
+                    self.hub.deliver_all({"type": "resync"})
+                connected_before = True
+                logger.info(f"📡 Push broker listening on '{self._channel}'")
+
+                while not self._stop_event.is_set():
+                    readable, _, _ = select.select([connection], [], [], LISTEN_POLL_SECONDS)
+                    if not readable:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._handle(connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"❌ Push broker listener error, retrying in {delay}s: {e}")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,150 @@
+"""
+Hub pub/sub in processo per le notifiche push via WebSocket.
+
+Ogni connessione WebSocket (endpoint /ws) si iscrive con l'ID dell'utente e
+riceve gli eventi pubblicati per quell'utente: nuovi messaggi, notifiche,
+aggiornamenti delle prenotazioni. Gli eventi sono piccoli "trigger" JSON: il
+client ricarica solo la parte interessata con le API esistenti (since_id,
+contatori), invece di interrogarle a intervalli fissi.
+
+publish() può essere chiamata da qualsiasi thread (route async, route sync nel
+threadpool, job dello scheduler): la consegna alle code avviene sempre nel
+thread dell'event loop. La pubblicazione passa dal broker configurato (vedi
+app/utils/push_broker.py), che la porta anche agli altri worker.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Optional, Set
+
+from app.database import engine
+from app.logger_config import logger
+from app.utils.push_broker import PushBroker, InMemoryBroker, PostgresBroker
+
+# Broker degli eventi: auto (postgres se il database è PostgreSQL), memory, postgres
+PUSH_BROKER = os.getenv("PUSH_BROKER", "auto").lower()
+
+# Eventi in coda per connessione prima di chiedere al client una risincronizzazione
+MAX_QUEUED_EVENTS = 100
+
+
+class PushHub:
+    """Iscrizioni per utente (una coda per connessione WebSocket)"""
+
+    def __init__(self, broker: Optional[PushBroker] = None):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.broker: PushBroker = broker or InMemoryBroker()
+        self.broker.start(self)
+
+    def set_broker(self, broker: PushBroker):
+        """Sostituisce il broker (fermando il precedente) e lo avvia"""
+        self.broker.stop()
+        self.broker = broker
+        broker.start(self)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """Registra una nuova connessione (da chiamare nell'event loop)"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        """Rimuove una connessione chiusa"""
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def is_connected(self, user_id: int) -> bool:
+        """True se l'utente ha almeno una connessione aperta in questo processo"""
+        return user_id in self._subscribers
+
+    def publish(self, user_id: int, event: dict):
+        """Pubblica un evento per tutte le connessioni dell'utente, su tutti i worker"""
+        self.broker.publish(user_id, event)
+
+    def deliver(self, user_id: int, event: dict):
+        """Consegna alle connessioni di questo processo (chiamata dal broker, thread-safe)"""
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+            loop = self._loop
+        self._schedule(loop, queues, event)
+
+    def deliver_all(self, event: dict):
+        """Consegna a tutte le connessioni di questo processo (es. resync dopo una disconnessione)"""
+        with self._lock:
+            queues = [queue for user_queues in self._subscribers.values() for queue in user_queues]
+            loop = self._loop
+        self._schedule(loop, queues, event)
+
+    def _schedule(self, loop, queues, event: dict):
+        if not queues or loop is None or loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is loop:
+            self._deliver(queues, event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, queues, event)
+
+    @staticmethod
+    def _deliver(queues, event: dict):
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client troppo lento: svuota e chiedi di ricaricare tutto
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                logger.warning("⚠️ Push queue full, resync requested")
+
+
+# Istanza condivisa dal processo (in memoria finché setup_push_broker non sceglie il broker)
+push_hub = PushHub()
+
+
+def setup_push_broker():
+    """Sceglie e avvia il broker all'avvio; in caso di errore resta quello in memoria"""
+    dialect = engine.dialect.name
+    choice = PUSH_BROKER
+    if choice == "auto":
+        choice = "postgres" if dialect == "postgresql" else "memory"
+    if choice == "postgresql":
+        choice = "postgres"
+
+    if choice == "postgres" and dialect == "postgresql":
+        try:
+            push_hub.set_broker(PostgresBroker(engine))
+        except Exception as e:
+            logger.error(f"❌ Push broker setup failed, using in-memory broker: {e}")
+            push_hub.set_broker(InMemoryBroker())
+    elif choice == "postgres":
+        logger.warning("⚠️ PUSH_BROKER=postgres requires a PostgreSQL DATABASE_URL, using in-memory broker")
+
+    logger.info(f"📡 Push broker: {push_hub.broker.name}")
+
+
+def shutdown_push_broker():
+    """Ferma il listener del broker (chiamata allo shutdown)"""
+    push_hub.broker.stop()
+
+
+def publish_to_user(user_id: Optional[int], event_type: str, **payload):
+    """Scorciatoia: pubblica {"type": event_type, ...payload} senza mai sollevare eccezioni"""
+    if not user_id:
+        return
+    try:
+        push_hub.publish(user_id, {"type": event_type, **payload})
+    except Exception as e:
+        logger.error(f"❌ Push publish failed for user {user_id}: {e}")
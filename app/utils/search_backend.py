@@ -0,0 +1,370 @@
+"""
+Backend di ricerca full-text per consulenti e domande della community.
+
+Le ricerche con ilike('%kw%') non possono usare indici su nessuno dei due
+database, quindi la ricerca viene delegata al motore nativo:
+
+- PostgreSQL: colonna tsvector generata (STORED) con indice GIN, ranking con ts_rank
+- SQLite: tabella virtuale FTS5 sincronizzata tramite trigger, ranking con bm25
+- Memoria: fallback sull'indice invertito in processo (app/utils/search_index.py)
+
+Sinonimi e skill (SYNONYMS / SKILL_CATEGORIES) diventano termini in OR nella
+query full-text: non serve più un passaggio di scoring in Python.
+
+Il backend si sceglie con SEARCH_BACKEND (auto, postgres, sqlite, memory).
+Con 'auto' si usa il motore nativo del database configurato.
+"""
+import os
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import column, literal_column, table, text
+from sqlmodel import Session, select, func, or_
+
+from app.database import engine
+from app.models import User, CommunityQuestion
+from app.utils.search_index import search_index
+from app.logger_config import logger
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto").lower()
+
+# Configurazione text search di PostgreSQL (stemming italiano)
+PG_TS_CONFIG = "italian"
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Status filtrabili nella pagina community
+QUESTION_STATUSES = ['open', 'in_progress', 'closed']
+
+
+def _terms(keywords: List[str]) -> List[List[str]]:
+    """Spezza le keyword in token puliti (una keyword può essere una frase, es. 'after effects')"""
+    terms = []
+    for keyword in keywords:
+        words = TOKEN_RE.findall(keyword.lower())
+        if words and words not in terms:
+            terms.append(words)
+    return terms
+
+
+def _apply_user_filters(stmt, category, min_price, max_price):
+    if category:
+        stmt = stmt.where(User.category_id == category)
+    if min_price is not None:
+        stmt = stmt.where(User.prezzo_consulenza >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(User.prezzo_consulenza <= max_price)
+    return stmt
+
+
+def _apply_question_filters(stmt, category, status):
+    if category:
+        stmt = stmt.where(CommunityQuestion.category_id == category)
+    if status and status in QUESTION_STATUSES:
+        stmt = stmt.where(CommunityQuestion.status == status)
+    return stmt
+
+
+def _search_questions_ilike(keywords, category, status, offset, limit) -> Tuple[List[int], int]:
+    """Ricerca domande con ilike (fallback quando non ci sono termini full-text)"""
+    stmt = select(CommunityQuestion.id).order_by(CommunityQuestion.created_at.desc())
+    stmt = _apply_question_filters(stmt, category, status)
+    for keyword in keywords:
+        pattern = f"%{keyword}%"
+        stmt = stmt.where(
+            or_(
+                CommunityQuestion.title.ilike(pattern),
+                CommunityQuestion.description.ilike(pattern)
+            )
+        )
+    with Session(engine) as session:
+        return _paginate(session, stmt, offset, limit)
+
+
+def _paginate(session: Session, stmt, offset: int, limit: int) -> Tuple[List[int], int]:
+    """Esegue count e pagina direttamente in SQL su una select di ID"""
+    total = session.exec(select(func.count()).select_from(stmt.order_by(None).subquery())).one()
+    ids = list(session.exec(stmt.offset(offset).limit(limit)).all())
+    return ids, total
+
+
+class SearchBackend:
+    """Interfaccia comune dei backend di ricerca"""
+
+    name = "base"
+
+    def setup(self):
+        """Crea (se mancano) le strutture di indicizzazione nel database"""
+
+    def search_users(
+        self,
+        keywords: List[str],
+        expanded_keywords: List[str],
+        category: Optional[int] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 12
+    ) -> Tuple[List[int], int]:
+        """Restituisce (ID utenti della pagina ordinati per rilevanza, totale risultati)"""
+        raise NotImplementedError
+
+    def search_questions(
+        self,
+        keywords: List[str],
+        category: Optional[int] = None,
+        status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 10
+    ) -> Tuple[List[int], int]:
+        """Restituisce (ID domande della pagina, totale risultati)"""
+        raise NotImplementedError
+
+
+class MemorySearchBackend(SearchBackend):
+    """Indice invertito in processo per gli utenti, ilike per le domande"""
+
+    name = "memory"
+
+    def search_users(self, keywords, expanded_keywords, category=None, min_price=None,
+                     max_price=None, offset=0, limit=12):
+        return search_index.search(
+            keywords,
+            expanded_keywords,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            offset=offset,
+            limit=limit
+        )
+
+    def search_questions(self, keywords, category=None, status=None, offset=0, limit=10):
+        return _search_questions_ilike(keywords, category, status, offset, limit)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Colonne tsvector generate + indici GIN, ranking con ts_rank"""
+
+    name = "postgres"
+
+    SETUP_SQL = [
+        f"""
+        ALTER TABLE "user" ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(professione, '')), 'A') ||
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(nome, '') || ' ' || coalesce(cognome, '')), 'B') ||
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(aree_interesse, '')), 'B') ||
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(descrizione, '')), 'C')
+        ) STORED
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_user_search_vector ON "user" USING GIN (search_vector)',
+        f"""
+        ALTER TABLE community_questions ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(description, '')), 'C')
+        ) STORED
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_community_questions_search_vector ON community_questions USING GIN (search_vector)',
+    ]
+
+    def setup(self):
+        with engine.begin() as conn:
+            for statement in self.SETUP_SQL:
+                conn.execute(text(statement))
+        logger.info("🔎 PostgreSQL full-text search ready (tsvector + GIN)")
+
+    @staticmethod
+    def _tsquery(terms: List[List[str]], operator: str) -> str:
+        """Costruisce una tsquery: prefisso per le parole singole, <-> per le frasi"""
+        parts = []
+        for words in terms:
+            if len(words) == 1:
+                parts.append(f"{words[0]}:*")
+            else:
+                parts.append("(" + " <-> ".join(words) + ")")
+        return f" {operator} ".join(parts)
+
+    def search_users(self, keywords, expanded_keywords, category=None, min_price=None,
+                     max_price=None, offset=0, limit=12):
+        all_terms = _terms(expanded_keywords)
+        if not all_terms:
+            return [], 0
+
+        vector = literal_column('"user".search_vector')
+        query_all = func.to_tsquery(PG_TS_CONFIG, self._tsquery(all_terms, "|"))
+        query_original = func.to_tsquery(PG_TS_CONFIG, self._tsquery(_terms(keywords) or all_terms, "|"))
+
+        # Le keyword originali pesano il doppio di quelle espanse (come +10/+5 nello scoring)
+        rank = func.ts_rank(vector, query_original) * 2 + func.ts_rank(vector, query_all)
+
+        stmt = (
+            select(User.id)
+            .where(vector.op("@@")(query_all))
+            .order_by(rank.desc(), User.bollini.desc(), User.consulenze_vendute.desc(), User.id)
+        )
+        stmt = _apply_user_filters(stmt, category, min_price, max_price)
+
+        with Session(engine) as session:
+            return _paginate(session, stmt, offset, limit)
+
+    def search_questions(self, keywords, category=None, status=None, offset=0, limit=10):
+        terms = _terms(keywords)
+        if not terms:
+            return _search_questions_ilike(keywords, category, status, offset, limit)
+
+        vector = literal_column("community_questions.search_vector")
+        query = func.to_tsquery(PG_TS_CONFIG, self._tsquery(terms, "&"))
+
+        stmt = (
+            select(CommunityQuestion.id)
+            .where(vector.op("@@")(query))
+            .order_by(func.ts_rank(vector, query).desc(), CommunityQuestion.created_at.desc())
+        )
+        stmt = _apply_question_filters(stmt, category, status)
+
+        with Session(engine) as session:
+            return _paginate(session, stmt, offset, limit)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Tabelle FTS5 'ombra' sincronizzate con trigger, ranking con bm25"""
+
+    name = "sqlite"
+
+    USER_COLUMNS = ["nome", "cognome", "professione", "descrizione", "aree_interesse"]
+    QUESTION_COLUMNS = ["title", "description"]
+
+    # Pesi bm25 per colonna (stesso ordine di USER_COLUMNS / QUESTION_COLUMNS)
+    USER_WEIGHTS = [2.0, 2.0, 5.0, 1.0, 3.0]
+    QUESTION_WEIGHTS = [3.0, 1.0]
+
+    @staticmethod
+    def _fts_sql(fts_table: str, content_table: str, columns: List[str]) -> List[str]:
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        return [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {cols}, content='{content_table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON "{content_table}" BEGIN
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON "{content_table}" BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON "{content_table}" BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols});
+            END""",
+        ]
+
+    def setup(self):
+        tables = [
+            ("user_fts", "user", self.USER_COLUMNS),
+            ("community_questions_fts", "community_questions", self.QUESTION_COLUMNS),
+        ]
+        with engine.begin() as conn:
+            for fts_table, content_table, columns in tables:
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {"name": fts_table}
+                ).first()
+                for statement in self._fts_sql(fts_table, content_table, columns):
+                    conn.execute(text(statement))
+                if not exists:
+                    # Prima creazione: indicizza le righe già presenti
+                    conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        logger.info("🔎 SQLite full-text search ready (FTS5)")
+
+    @staticmethod
+    def _match(terms: List[List[str]], operator: str) -> str:
+        """Costruisce una query FTS5: prefisso sulle parole singole, frase per le keyword multiple"""
+        parts = []
+        for words in terms:
+            phrase = " ".join(words)
+            parts.append(f'"{phrase}"*' if len(words) == 1 else f'"{phrase}"')
+        return f" {operator} ".join(parts)
+
+    def _search(self, fts_table: str, weights: List[float], id_column, match: str, filters, order_by):
+        fts = literal_column(fts_table)
+        fts_rows = table(fts_table, column("rowid"))
+        rank = func.bm25(fts, *weights)
+        stmt = (
+            select(id_column)
+            .join(fts_rows, fts_rows.c.rowid == id_column)
+            .where(fts.op("MATCH")(match))
+            .order_by(rank, *order_by)
+        )
+        return filters(stmt)
+
+    def search_users(self, keywords, expanded_keywords, category=None, min_price=None,
+                     max_price=None, offset=0, limit=12):
+        terms = _terms(expanded_keywords)
+        if not terms:
+            return [], 0
+
+        stmt = self._search(
+            "user_fts",
+            self.USER_WEIGHTS,
+            User.id,
+            self._match(terms, "OR"),
+            lambda s: _apply_user_filters(s, category, min_price, max_price),
+            [User.bollini.desc(), User.consulenze_vendute.desc(), User.id]
+        )
+        with Session(engine) as session:
+            return _paginate(session, stmt, offset, limit)
+
+    def search_questions(self, keywords, category=None, status=None, offset=0, limit=10):
+        terms = _terms(keywords)
+        if not terms:
+            return _search_questions_ilike(keywords, category, status, offset, limit)
+
+        stmt = self._search(
+            "community_questions_fts",
+            self.QUESTION_WEIGHTS,
+            CommunityQuestion.id,
+            self._match(terms, "AND"),
+            lambda s: _apply_question_filters(s, category, status),
+            [CommunityQuestion.created_at.desc()]
+        )
+        with Session(engine) as session:
+            return _paginate(session, stmt, offset, limit)
+
+
+_backend: Optional[SearchBackend] = None
+
+
+def get_search_backend() -> SearchBackend:
+    """Restituisce il backend configurato (creato una sola volta per processo)"""
+    global _backend
+    if _backend is None:
+        dialect = engine.dialect.name
+        choice = SEARCH_BACKEND
+        if choice == "auto":
+            choice = dialect if dialect in ("postgresql", "sqlite") else "memory"
+        if choice == "postgresql":
+            choice = "postgres"
+
+        if choice == "postgres" and dialect == "postgresql":
+            _backend = PostgresSearchBackend()
+        elif choice == "sqlite" and dialect == "sqlite":
+            _backend = SQLiteSearchBackend()
+        else:
+            _backend = MemorySearchBackend()
+
+        logger.info(f"🔎 Search backend: {_backend.name}")
+    return _backend
+
+
+def setup_search_backend():
+    """Prepara il backend all'avvio; in caso di errore ripiega sull'indice in memoria"""
+    global _backend
+    backend = get_search_backend()
+    try:
+        backend.setup()
+    except Exception as e:
+        logger.error(f"❌ Full-text search setup failed ({backend.name}), using in-memory index: {e}")
+        _backend = MemorySearchBackend()
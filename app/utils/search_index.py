@@ -0,0 +1,219 @@
+"""
+Indice invertito in memoria per la ricerca consulenti.
+
+I campi testuali di ogni utente (nome, cognome, professione, descrizione,
+aree_interesse) vengono tokenizzati una sola volta e salvati in liste di
+posting token -> {user_id}. Una ricerca risolve le keyword sul vocabolario
+(molto più piccolo della tabella utenti), calcola lo score solo sui candidati
+e restituisce i soli ID della pagina richiesta.
+
+L'indice viene costruito alla prima ricerca e aggiornato in modo incrementale
+quando un profilo viene modificato (vedi update_user). Per coprire le scritture
+che non passano da qui (altri worker, registrazioni, bollini) viene comunque
+ricostruito dopo SEARCH_INDEX_TTL secondi.
+"""
+import heapq
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlmodel import Session, select
+
+from app.database import engine
+from app.models import User
+from app.logger_config import logger
+from app.utils.keyword_matcher import KeywordMatcher, user_text
+
+# Dopo quanti secondi ricostruire comunque l'indice dal database
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class IndexedUser:
+    """Snapshot dei campi di un utente necessari a ricerca, filtri e scoring"""
+
+    __slots__ = (
+        'id', 'nome', 'cognome', 'professione', 'descrizione', 'aree_interesse',
+        'bollini', 'consulenze_vendute', 'category_id', 'prezzo_consulenza', 'text', 'prof_span'
+    )
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.nome = user.nome
+        self.cognome = user.cognome
+        self.professione = user.professione
+        self.descrizione = user.descrizione
+        self.aree_interesse = user.aree_interesse
+        self.bollini = user.bollini or 0
+        self.consulenze_vendute = user.consulenze_vendute or 0
+        self.category_id = user.category_id
+        self.prezzo_consulenza = user.prezzo_consulenza
+        # Testo lowercase calcolato una sola volta e riusato da ogni ricerca
+        self.text, self.prof_span = user_text(user)
+
+
+class SearchIndex:
+    """Indice invertito thread-safe sugli utenti"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs: Dict[int, IndexedUser] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._keyword_cache: Dict[str, Set[int]] = {}
+        self._built_at: Optional[float] = None
+
+    # ========== COSTRUZIONE E AGGIORNAMENTI ==========
+
+    def build(self, users: Optional[List[User]] = None):
+        """(Ri)costruisce l'indice dagli utenti passati o leggendo tutto il database"""
+        if users is None:
+            with Session(engine) as session:
+                users = session.exec(select(User)).all()
+        docs = [IndexedUser(user) for user in users]
+
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._keyword_cache = {}
+            for doc in docs:
+                self._add(doc)
+            self._built_at = time.monotonic()
+
+        logger.info(f"🗂️ Search index built: {len(docs)} users, {len(self._postings)} tokens")
+
+    def ensure_built(self):
+        """Costruisce l'indice se mancante o più vecchio di SEARCH_INDEX_TTL"""
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at > SEARCH_INDEX_TTL:
+            self.build()
+
+    def update_user(self, user: User):
+        """Reindicizza un singolo utente (da chiamare dopo il commit)"""
+        with self._lock:
+            if self._built_at is None:
+                # Indice non ancora costruito: verrà letto tutto alla prima ricerca
+                return
+            self._remove(user.id)
+            self._add(IndexedUser(user))
+            self._keyword_cache = {}
+
+    def remove_user(self, user_id: int):
+        """Rimuove un utente dall'indice"""
+        with self._lock:
+            self._remove(user_id)
+            self._keyword_cache = {}
+
+    def invalidate(self):
+        """Forza la ricostruzione alla prossima ricerca"""
+        with self._lock:
+            self._built_at = None
+
+    def _add(self, doc: IndexedUser):
+        self._docs[doc.id] = doc
+        for token in set(TOKEN_RE.findall(doc.text)):
+            self._postings.setdefault(token, set()).add(doc.id)
+
+    def _remove(self, user_id: int):
+        doc = self._docs.pop(user_id, None)
+        if not doc:
+            return
+        for token in set(TOKEN_RE.findall(doc.text)):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(user_id)
+                if not postings:
+                    del self._postings[token]
+
+    # ========== RICERCA ==========
+
+    def _match_keyword(self, keyword: str) -> Set[int]:
+        """
+        Restituisce gli ID degli utenti il cui testo contiene la keyword.
+
+        Stessa semantica di ilike('%keyword%'): una keyword di soli caratteri
+        alfanumerici è sottostringa del testo solo se lo è di un token, quindi
+        basta scorrere il vocabolario. Le keyword con spazi (es. 'after effects')
+        vengono verificate sul testo completo dei candidati.
+        """
+        cached = self._keyword_cache.get(keyword)
+        if cached is not None:
+            return cached
+
+        words = TOKEN_RE.findall(keyword)
+        if not words:
+            return set()
+
+        matched: Set[int] = set()
+        for token, user_ids in self._postings.items():
+            if words[0] in token:
+                matched |= user_ids
+
+        if len(words) > 1 or words[0] != keyword:
+            matched = {user_id for user_id in matched if keyword in self._docs[user_id].text}
+
+        self._keyword_cache[keyword] = matched
+        return matched
+
+    def search(
+        self,
+        keywords: List[str],
+        expanded_keywords: List[str],
+        score_fn: Optional[Callable[[IndexedUser, List[str], List[str]], float]] = None,
+        category: Optional[int] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 12
+    ) -> Tuple[List[int], int]:
+        """
+        Cerca gli utenti che contengono almeno una delle keyword espanse.
+
+        Args:
+            keywords: Keyword originali della query
+            expanded_keywords: Keyword espanse con sinonimi e skill
+            score_fn: Funzione di rilevanza (stessa firma di calculate_relevance_score);
+                di default KeywordMatcher compilato per questa query
+            category: Filtro categoria (opzionale)
+            min_price / max_price: Filtri prezzo (opzionali)
+            offset / limit: Finestra della pagina richiesta
+
+        Returns:
+            (ID utenti della pagina ordinati per score, numero totale di risultati)
+        """
+        self.ensure_built()
+
+        with self._lock:
+            candidate_ids: Set[int] = set()
+            for keyword in expanded_keywords:
+                candidate_ids |= self._match_keyword(keyword)
+
+            candidates = []
+            for user_id in sorted(candidate_ids):
+                doc = self._docs[user_id]
+                if category and doc.category_id != category:
+                    continue
+                if min_price is not None and (doc.prezzo_consulenza is None or doc.prezzo_consulenza < min_price):
+                    continue
+                if max_price is not None and (doc.prezzo_consulenza is None or doc.prezzo_consulenza > max_price):
+                    continue
+                candidates.append(doc)
+
+        if score_fn is None:
+            matcher = KeywordMatcher(keywords, expanded_keywords)
+            score_fn = lambda doc, _keywords, _expanded: matcher.score(doc)
+
+        # Solo i primi offset+limit servono davvero: niente sort completo
+        top = heapq.nlargest(
+            offset + limit,
+            ((score_fn(doc, keywords, expanded_keywords), doc) for doc in candidates),
+            key=lambda item: item[0]
+        )
+
+        return [doc.id for _, doc in top[offset:offset + limit]], len(candidates)
+
+
+# Istanza condivisa dal processo
+search_index = SearchIndex()
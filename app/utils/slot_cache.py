@@ -0,0 +1,247 @@
+"""
+Cache degli slot disponibili per (consulente, giorno).
+
+I clienti che sfogliano il calendario di un consulente chiedono gli stessi
+giorni molte volte, ma gli slot cambiano solo quando cambiano i blocchi di
+disponibilità o le prenotazioni del consulente. Per ogni giorno la cache
+tiene i blocchi e le prenotazioni (righe leggere, non oggetti ORM) e gli
+slot già calcolati per tutte le durate: una richiesta in cache non fa query.
+
+L'unica dipendenza dall'ora è il limite di oggi (niente slot passati): gli
+slot in cache sono calcolati senza limite e, se il giorno è oggi, vengono
+ricalcolati in memoria dalle righe in cache con l'ora corrente.
+
+Invalidazione:
+- automatica quando un AvailabilityBlock o una Booking viene inserito,
+  modificato o eliminato tramite ORM (eventi SQLAlchemy), per il giorno e il
+  consulente della riga (anche quelli precedenti, se sono cambiati);
+- per AvailabilityRule tutti i giorni del consulente, per AvailabilityException
+  il giorno dell'eccezione;
+- esplicita (mark_days_changed, invalidate_consultant) per le scritture che
+  non passano dall'ORM;
+- dopo SLOT_CACHE_TTL secondi, per le modifiche fatte da altri worker.
+
+Un calcolo iniziato prima di un'invalidazione non viene salvato (versione),
+così una lettura lenta non rimette in cache dati già superati.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import event, inspect
+from sqlmodel import Session
+
+from app.models import AvailabilityBlock, AvailabilityException, AvailabilityRule, Booking
+from app.utils.date_filters import DayLike, parse_day
+from app.utils.slot_engine import SLOT_DURATIONS, available_slots_by_duration
+
+# Dopo quanti secondi ricalcolare comunque gli slot di un giorno
+SLOT_CACHE_TTL = int(os.getenv("SLOT_CACHE_TTL", "60"))
+
+# Giorni (consulente, data) tenuti in memoria al massimo (i meno usati escono per primi)
+SLOT_CACHE_MAX_DAYS = int(os.getenv("SLOT_CACHE_MAX_DAYS", "20000"))
+
+
+class BlockRow(NamedTuple):
+    """Campi di AvailabilityBlock usati dal motore degli slot"""
+    id: Optional[int]  # None per i blocchi delle regole ricorrenti
+    start_time: str
+    end_time: str
+
+
+class BookingRow(NamedTuple):
+    """Campi di Booking usati dal motore degli slot"""
+    availability_block_id: Optional[int]
+    booking_date: datetime
+    start_time: str
+    end_time: str
+    status: str
+
+
+class DayAvailability(NamedTuple):
+    """Blocchi, prenotazioni e slot (senza limite di oggi) di un consulente in un giorno"""
+    day: date
+    blocks: Tuple[BlockRow, ...]
+    bookings: Tuple[BookingRow, ...]
+    slots: Dict[int, List[Dict]]
+    loaded_at: float
+
+    def slots_for(self, durations: Iterable[int], now: datetime) -> Dict[int, List[Dict]]:
+        """Slot per durata; se il giorno è oggi (now nel fuso italiano) solo quelli non ancora iniziati"""
+        durations = tuple(durations)
+        if now.date() == self.day:
+            return available_slots_by_duration(
+                self.blocks, self.bookings, self.day.strftime('%Y-%m-%d'), durations, now=now
+            )
+        return {duration: list(self.slots[duration]) for duration in durations}
+
+
+SlotCacheKey = Tuple[int, date]
+
+
+class SlotCache:
+    """Cache thread-safe degli slot per (consulente, giorno)"""
+
+    def __init__(self, max_days: int = SLOT_CACHE_MAX_DAYS):
+        self._lock = threading.Lock()
+        self._days: "OrderedDict[SlotCacheKey, DayAvailability]" = OrderedDict()
+        self._max_days = max_days
+        self._version = 0
+
+    def version(self) -> int:
+        """Da leggere prima delle query: put() scarta il risultato se nel frattempo c'è stata un'invalidazione"""
+        return self._version
+
+    def get(self, consultant_id: int, day: DayLike) -> Optional[DayAvailability]:
+        """Giorno in cache (None se assente o scaduto)"""
+        key = (consultant_id, parse_day(day))
+        with self._lock:
+            entry = self._days.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded_at > SLOT_CACHE_TTL:
+                del self._days[key]
+                return None
+            self._days.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        consultant_id: int,
+        day: DayLike,
+        blocks: Sequence[AvailabilityBlock],
+        bookings: Sequence[Booking],
+        version: int
+    ) -> DayAvailability:
+        """
+        Calcola gli slot del giorno per tutte le durate e li mette in cache.
+
+        Args:
+            consultant_id: ID del consulente
+            day: Giorno
+            blocks: Blocchi disponibili del consulente nel giorno
+            bookings: Prenotazioni attive del consulente nel giorno
+            version: version() letta prima delle query
+        """
+        day = parse_day(day)
+        block_rows = tuple(BlockRow(block.id, block.start_time, block.end_time) for block in blocks)
+        booking_rows = tuple(
+            BookingRow(booking.availability_block_id, booking.booking_date, booking.start_time, booking.end_time, booking.status)
+            for booking in bookings
+        )
+        entry = DayAvailability(
+            day=day,
+            blocks=block_rows,
+            bookings=booking_rows,
+            slots=available_slots_by_duration(block_rows, booking_rows, day.strftime('%Y-%m-%d'), SLOT_DURATIONS),
+            loaded_at=time.monotonic()
+        )
+
+        with self._lock:
+            if version == self._version:
+                key = (consultant_id, day)
+                self._days[key] = entry
+                self._days.move_to_end(key)
+                while len(self._days) > self._max_days:
+                    self._days.popitem(last=False)
+        return entry
+
+    def invalidate(self, consultant_id: int, day: DayLike):
+        """Ricalcola il giorno del consulente alla prossima richiesta"""
+        with self._lock:
+            self._version += 1
+            self._days.pop((consultant_id, parse_day(day)), None)
+
+    def invalidate_consultant(self, consultant_id: int):
+        """Ricalcola tutti i giorni del consulente alla prossima richiesta"""
+        with self._lock:
+            self._version += 1
+            for key in [key for key in self._days if key[0] == consultant_id]:
+                del self._days[key]
+
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            self._version += 1
+            self._days.clear()
+
+
+# Istanza condivisa dal processo
+slot_cache = SlotCache()
+
+
+# ========== INVALIDAZIONE AUTOMATICA ==========
+
+# Colonne che identificano il giorno di una riga: (consulente, data)
+_DAY_COLUMNS = {
+    AvailabilityBlock: ("user_id", "date"),
+    AvailabilityException: ("user_id", "date"),
+    Booking: ("consultant_user_id", "booking_date"),
+}
+
+
+def _current_and_previous(target, column: str) -> set:
+    values = {getattr(target, column)}
+    values.update(inspect(target).attrs[column].history.deleted or ())
+    values.discard(None)
+    return values
+
+
+def _changed_days(target) -> List[SlotCacheKey]:
+    """Giorni toccati dalla riga: quello attuale e quelli precedenti se consulente o data sono cambiati"""
+    consultant_column, date_column = _DAY_COLUMNS[type(target)]
+    return [
+        (consultant_id, parse_day(day))
+        for consultant_id in _current_and_previous(target, consultant_column)
+        for day in _current_and_previous(target, date_column)
+    ]
+
+
+def mark_days_changed(session: Optional[Session], days: Iterable[SlotCacheKey]):
+    """
+    Invalida subito i giorni (consulente, data) e ricorda alla sessione di farlo
+    di nuovo al commit, così un calcolo avvenuto tra scrittura e commit non resta
+    in cache. Da chiamare anche dopo scritture Core (insert / delete in blocco).
+    """
+    days = [(consultant_id, parse_day(day)) for consultant_id, day in days]
+    for consultant_id, day in days:
+        slot_cache.invalidate(consultant_id, day)
+    if session is not None:
+        session.info.setdefault('slot_days_changed', set()).update(days)
+
+
+def _mark_slots_changed(mapper, connection, target):
+    mark_days_changed(Session.object_session(target), _changed_days(target))
+
+
+def _mark_rules_changed(mapper, connection, target):
+    # Una regola vale per tutti i giorni: si ricalcola l'intero consulente
+    consultants = _current_and_previous(target, "user_id")
+    for consultant_id in consultants:
+        slot_cache.invalidate_consultant(consultant_id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('slot_consultants_changed', set()).update(consultants)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    for _model in _DAY_COLUMNS:
+        event.listen(_model, _event_name, _mark_slots_changed)
+    event.listen(AvailabilityRule, _event_name, _mark_rules_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for consultant_id, day in session.info.pop('slot_days_changed', ()):
+        slot_cache.invalidate(consultant_id, day)
+    for consultant_id in session.info.pop('slot_consultants_changed', ()):
+        slot_cache.invalidate_consultant(consultant_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('slot_days_changed', None)
+    session.info.pop('slot_consultants_changed', None)
@@ -0,0 +1,219 @@
+"""
+Motore degli slot prenotabili di una giornata.
+
+Una giornata è una bitmap per minuto in un int Python (bit m = minuto m
+libero): niente dipendenze esterne e le operazioni su tutta la giornata
+(AND, shift) sono poche istruzioni su interi di 1440 bit.
+
+Per ogni blocco di disponibilità:
+- minuti liberi = intervallo del blocco meno le prenotazioni (parsate una
+  volta sola per giornata, non per ogni blocco);
+- inizi con una corsa libera di d minuti = AND della bitmap con sé stessa
+  shiftata; le durate 30/60/90/120 si ottengono una dall'altra
+  (R60 = R30 & R30 >> 30, ...), tutte insieme;
+- griglia degli inizi ogni SLOT_STEP_MINUTES minuti, che riparte dall'inizio
+  del blocco e dalla fine di ogni gruppo di prenotazioni (come gli slot
+  mostrati finora: dopo una prenotazione 9:00-9:45 il prossimo è alle 9:45).
+
+Gli slot restano dentro il blocco: prima una prenotazione successiva al blocco
+(es. nel secondo blocco della giornata) faceva proporre slot fuori orario.
+"""
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.models import AvailabilityBlock, Booking
+
+# Durate prenotabili (minuti)
+SLOT_DURATIONS = (30, 60, 90, 120)
+
+# Passo tra l'inizio di uno slot e il successivo
+SLOT_STEP_MINUTES = 30
+
+# Minuti di anticipo minimo per gli slot di oggi
+TODAY_BUFFER_MINUTES = 5
+
+# Prenotazioni che non occupano più il loro orario
+INACTIVE_BOOKING_STATUSES = ('cancelled', 'no_show')
+
+
+def parse_time_to_minutes(time_input: Union[str, time]) -> int:
+    """Converte una stringa HH:MM o un oggetto time in minuti dalla mezzanotte"""
+    if isinstance(time_input, time):
+        # Se è già un oggetto time, usa hour e minute
+        return time_input.hour * 60 + time_input.minute
+    # Se è una stringa, fai il parsing
+    hours, minutes = map(int, time_input.split(':'))
+    return hours * 60 + minutes
+
+
+def minutes_to_time(minutes: int) -> str:
+    """Converte minuti dalla mezzanotte in stringa HH:MM"""
+    hours = minutes // 60
+    mins = minutes % 60
+    return f"{hours:02d}:{mins:02d}"
+
+
+# Etichette HH:MM precalcolate (fino alle 48:00 per gli slot che finiscono a mezzanotte)
+_TIME_LABELS = tuple(minutes_to_time(minutes) for minutes in range(48 * 60 + 1))
+
+
+def _label(minutes: int) -> str:
+    return _TIME_LABELS[minutes] if 0 <= minutes < len(_TIME_LABELS) else minutes_to_time(minutes)
+
+
+def _range_mask(start: int, end: int) -> int:
+    """Bit [start, end) a 1"""
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+# Un bit ogni SLOT_STEP_MINUTES, per due giornate: la griglia di un tratto è uno shift
+_GRID_PATTERN = sum(1 << minute for minute in range(0, 48 * 60, SLOT_STEP_MINUTES))
+
+
+def _grid_mask(origin: int, end: int) -> int:
+    """Bit origin, origin + SLOT_STEP_MINUTES, ... minori di end"""
+    return (_GRID_PATTERN << origin) & _range_mask(origin, end)
+
+
+def free_run_starts(free: int, durations: Iterable[int]) -> Dict[int, int]:
+    """
+    Per ogni durata d, bitmap dei minuti t con [t, t + d) tutto libero.
+
+    R(a + b) = R(a) & (R(b) >> a): ogni durata riusa le più corte già calcolate
+    (con 30/60/90/120: R60 = R30 & R30 >> 30, R90 = R60 & R30 >> 60, R120 = R90 & R30 >> 90).
+    """
+    runs = {1: free}
+
+    def run(length: int) -> int:
+        if length in runs:
+            return runs[length]
+        # Il pezzo più lungo già calcolato (o la metà) + il resto
+        known = max((k for k in runs if k < length), default=1)
+        head = known if known * 2 >= length else length // 2
+        result = run(head) & (run(length - head) >> head)
+        runs[length] = result
+        return result
+
+    return {duration: run(duration) for duration in durations}
+
+
+def _iter_bits(mask: int):
+    """Posizioni dei bit a 1, in ordine crescente"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _merge_intervals(intervals: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Unisce gli intervalli sovrapposti o contigui (ordinati per inizio)"""
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def block_slot_starts(
+    block_start: int,
+    block_end: int,
+    occupied: Sequence[Tuple[int, int]],
+    durations: Iterable[int] = SLOT_DURATIONS
+) -> Dict[int, int]:
+    """
+    Bitmap degli inizi prenotabili di un blocco, per ogni durata.
+
+    Args:
+        block_start, block_end: Blocco in minuti dalla mezzanotte
+        occupied: Intervalli occupati [inizio, fine) in minuti
+        durations: Durate richieste
+    """
+    durations = tuple(durations)
+    if block_end <= block_start:
+        return {duration: 0 for duration in durations}
+
+    runs = _merge_intervals([(start, end) for start, end in occupied if start < end])
+
+    free = _range_mask(block_start, block_end)
+    for start, end in runs:
+        free &= ~_range_mask(start, end)
+
+    # Griglia: riparte dall'inizio del blocco e dalla fine di ogni gruppo di prenotazioni
+    origins = [block_start] + [end for _, end in runs if block_start < end < block_end]
+    grid = 0
+    for origin, next_origin in zip(origins, origins[1:] + [block_end]):
+        grid |= _grid_mask(origin, next_origin)
+
+    return {duration: grid & starts for duration, starts in free_run_starts(free, durations).items()}
+
+
+def _booking_interval(booking: Booking) -> Tuple[int, int]:
+    return parse_time_to_minutes(booking.start_time), parse_time_to_minutes(booking.end_time)
+
+
+def available_slots_by_duration(
+    availability_blocks: List[AvailabilityBlock],
+    existing_bookings: List[Booking],
+    date_str: str,
+    durations: Iterable[int] = SLOT_DURATIONS,
+    now: Optional[datetime] = None
+) -> Dict[int, List[Dict]]:
+    """
+    Slot disponibili di una giornata per più durate in un solo passaggio.
+
+    Args:
+        availability_blocks: Blocchi di disponibilità del consulente
+        existing_bookings: Prenotazioni già esistenti
+        date_str: Data in formato "YYYY-MM-DD"
+        durations: Durate richieste (default: tutte quelle prenotabili)
+        now: Ora corrente nel fuso italiano (se la data è oggi non mostra slot passati)
+
+    Returns:
+        Per ogni durata, lista di slot con start_time, end_time e availability_block_id
+    """
+    durations = tuple(durations)
+
+    # Se è oggi, lo slot deve iniziare almeno all'ora corrente + buffer
+    min_start_time = None
+    if now is not None and now.date() == datetime.strptime(date_str, '%Y-%m-%d').date():
+        min_start_time = now.hour * 60 + now.minute + TODAY_BUFFER_MINUTES
+
+    # Prenotazioni parsate una volta: quelle attive del giorno valgono per tutti i blocchi,
+    # le altre solo per il proprio blocco
+    day_occupied = []
+    block_occupied: Dict[int, List[Tuple[int, int]]] = {}
+    for booking in existing_bookings:
+        if booking.status not in INACTIVE_BOOKING_STATUSES and booking.booking_date.strftime('%Y-%m-%d') == date_str:
+            day_occupied.append(_booking_interval(booking))
+        elif booking.availability_block_id is not None:
+            block_occupied.setdefault(booking.availability_block_id, []).append(_booking_interval(booking))
+
+    slots: Dict[int, List[Dict]] = {duration: [] for duration in durations}
+    for block in availability_blocks:
+        block_start = parse_time_to_minutes(block.start_time)
+        block_end = parse_time_to_minutes(block.end_time)
+
+        if min_start_time is not None:
+            if block_end <= min_start_time:
+                # Tutto il blocco è nel passato, saltalo
+                continue
+            if block_start < min_start_time:
+                # Arrotonda al prossimo slot di 30 minuti
+                block_start = -(-min_start_time // SLOT_STEP_MINUTES) * SLOT_STEP_MINUTES
+
+        occupied = day_occupied + block_occupied.get(block.id, [])
+        for duration, starts in block_slot_starts(block_start, block_end, occupied, durations).items():
+            slots[duration].extend(
+                {
+                    'start_time': _label(start),
+                    'end_time': _label(start + duration),
+                    'availability_block_id': block.id
+                }
+                for start in _iter_bits(starts)
+            )
+
+    return slots
@@ -4,6 +4,8 @@ Stripe configuration and utility functions
 import os
 from dotenv import load_dotenv
 
+from app.utils.outbound import outbound
+
 # Force reload environment variables
 load_dotenv(override=True)
 
@@ -27,6 +29,8 @@ STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 if stripe and STRIPE_SECRET_KEY:
     print(f"🔑 Initializing Stripe with key: {STRIPE_SECRET_KEY[:20]}...")
     stripe.api_key = STRIPE_SECRET_KEY
+    # Timeout di rete allineato a quello dell'executor (default dell'SDK: 80 s)
+    stripe.default_http_client = stripe.RequestsClient(timeout=outbound.timeout("stripe"))
     print(f"✅ Stripe API key set successfully: {stripe.api_key[:20] if stripe.api_key else 'NONE'}")
     print(f"✅ Stripe module after init: {stripe}")
 elif not stripe:
@@ -66,7 +70,10 @@ def create_checkout_session(
         raise RuntimeError("Stripe is not configured. Missing STRIPE_SECRET_KEY.")
     
     try:
-        session = stripe.checkout.Session.create(
+        # Thread pool delle chiamate esterne: limite di concorrenza e timeout
+        session = outbound.call(
+            "stripe",
+            stripe.checkout.Session.create,
             payment_method_types=['card'],
             line_items=[{
                 'price_data': {
@@ -0,0 +1,120 @@
+"""
+Cache degli utenti autenticati per verify_token.
+
+Ogni richiesta autenticata (compresi i polling) caricava l'utente dal
+database. La cache tiene per pochi secondi i valori delle colonne degli utenti
+usati di recente (LRU limitata a USER_CACHE_SIZE voci) e a ogni chiamata
+restituisce una nuova istanza detached: le route possono modificarla o
+passarla a session.add() come prima, senza condividere oggetti tra richieste.
+
+Viene invalidata automaticamente quando un User viene modificato o eliminato
+tramite ORM (profilo, verifica email, anonimato, bollini...) e, per le
+modifiche fatte da altri worker, scade comunque dopo USER_CACHE_TTL secondi.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session
+
+from app.database import get_session
+from app.models import User
+
+# Per quanti secondi un utente resta in cache
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
+# Numero massimo di utenti in cache (i meno usati escono per primi)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+# Attributi colonna di User (stessi nomi dei campi del modello)
+_USER_COLUMNS = tuple(attr.key for attr in inspect(User).column_attrs)
+
+
+class UserCache:
+    """Cache LRU thread-safe con scadenza: user_id -> valori delle colonne"""
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[User]:
+        """Utente per ID (istanza detached nuova a ogni chiamata), None se non esiste"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return _build_user(entry[1])
+
+        # Nella richiesta HTTP riusa la sessione condivisa (nessuna connessione in più)
+        with get_session() as session:
+            already_loaded = session.identity_key(User, user_id) in session.identity_map
+            user = session.get(User, user_id)
+            if user is None:
+                return None
+            values = {key: getattr(user, key) for key in _USER_COLUMNS}
+            # Se l'ha caricato la cache lo toglie dalla sessione, così la route può
+            # fare session.add() dell'istanza restituita senza conflitti di identità
+            if not already_loaded:
+                session.expunge(user)
+
+        with self._lock:
+            self._entries[user_id] = (now, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return _build_user(values)
+
+    def invalidate(self, user_id: int):
+        """Rimuove un utente (il prossimo accesso lo ricarica dal database)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _build_user(values: Dict[str, Any]) -> User:
+    # Istanza equivalente a quella caricata da una sessione ormai chiusa
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+# Istanza condivisa dal processo
+user_cache = UserCache()
+
+
+def invalidate_user(user_id: Optional[int]):
+    """Da chiamare dopo modifiche a un utente fatte senza ORM (UPDATE diretti)"""
+    if user_id:
+        user_cache.invalidate(user_id)
+
+
+# ========== INVALIDAZIONE AUTOMATICA ==========
+
+def _mark_user_changed(mapper, connection, target):
+    # Invalida subito e di nuovo al commit, così un caricamento avvenuto tra
+    # flush e commit non resta in cache con i valori vecchi
+    user_cache.invalidate(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('users_changed', set()).add(target.id)
+
+
+for _event_name in ('after_update', 'after_delete'):
+    event.listen(User, _event_name, _mark_user_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users_after_commit(session):
+    for user_id in session.info.pop('users_changed', ()):
+        user_cache.invalidate(user_id)
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: generazione dell'HTML delle email di notifica.
+
+Confronta i template Jinja2 precompilati di app/templates/emails/ con il
+generate_email_html di un commit precedente (dizionario dei template
+ricostruito a ogni chiamata + sostituzione dei segnaposto), simulando un
+picco di promemoria: tante email dello stesso template con dati diversi.
+
+Uso:
+    python -m benchmarks.bench_email_render [--emails 5000] [--repeat 3] [--baseline-ref <commit>]
+"""
+import argparse
+import subprocess
+import time
+import types
+from pathlib import Path
+
+from app.utils import notification_email
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SAMPLE_DATA = {
+    "booking_confirmed.html": {
+        "client_name": "Mario Rossi", "consultant_name": "Giulia Bianchi", "date": "18/10/2026",
+        "time": "15:00", "duration": "30", "action_url": "http://localhost:8000/my-bookings",
+    },
+    "reminder_1h.html": {
+        "user_name": "Mario", "other_user_name": "Giulia Bianchi", "date": "18/10/2026",
+        "time": "15:00", "duration": "30", "action_url": "http://localhost:8000/my-bookings",
+    },
+    "reminder_10min.html": {
+        "user_name": "Mario", "other_user_name": "Giulia Bianchi", "time": "15:00",
+        "duration": "30", "action_url": "http://localhost:8000/videocall/1",
+    },
+    "community_contact.html": {
+        "author_name": "Mario", "contact_name": "Giulia Bianchi", "question_title": "Logo per il mio sito",
+        "contact_date": "18/10/2026 15:00", "action_url": "http://localhost:8000/community/1",
+    },
+    "profile_verification_request.html": {
+        "user_name": "Mario Rossi", "user_email": "mario@example.com", "user_id": "1",
+        "action_url": "http://localhost:8000/profile/1",
+    },
+}
+
+
+def load_baseline(ref: str):
+    """Carica notification_email.py di un altro commit come modulo separato"""
+    source = subprocess.run(
+        ["git", "show", f"{ref}:app/utils/notification_email.py"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    module = types.ModuleType("baseline_notification_email")
+    exec(compile(source, f"{ref}:notification_email.py", "exec"), module.__dict__)
+    return module
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def render_all(generate, template_name: str, batch: list):
+    for data in batch:
+        assert generate(template_name, data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=5000, help="email per template")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline-ref", help="commit con cui confrontare (default: solo il codice attuale)")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline_ref) if args.baseline_ref else None
+
+    print(f"{args.emails} email per template, best of {args.repeat}\n")
+    print(f"{'template':<36} {'baseline':>10} {'jinja2':>10} {'µs/email':>9} {'speedup':>7}")
+
+    for template_name, sample in SAMPLE_DATA.items():
+        # Dati diversi per ogni email, come in un picco di promemoria
+        batch = [dict(sample, user_name=f"Utente {i}", client_name=f"Utente {i}") for i in range(args.emails)]
+
+        current = timed(lambda: render_all(notification_email.generate_email_html, template_name, batch), args.repeat)
+        if baseline:
+            before = timed(lambda: render_all(baseline.generate_email_html, template_name, batch), args.repeat)
+            print(f"{template_name:<36} {before * 1000:>8.1f}ms {current * 1000:>8.1f}ms "
+                  f"{current / args.emails * 1e6:>9.1f} {before / current:>6.1f}x")
+        else:
+            print(f"{template_name:<36} {'-':>10} {current * 1000:>8.1f}ms {current / args.emails * 1e6:>9.1f} {'-':>7}")
+
+
+if __name__ == "__main__":
+    main()
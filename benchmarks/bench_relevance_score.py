@@ -0,0 +1,105 @@
+"""
+Micro-benchmark: calculate_relevance_score vs KeywordMatcher.
+
+Genera profili sintetici e confronta, per alcune query tipiche, lo scoring
+keyword-per-keyword attuale con il matcher precompilato (testo dell'utente
+già in cache come nell'indice di ricerca, oppure calcolato al volo).
+
+Uso:
+    python -m benchmarks.bench_relevance_score [--users 10000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+
+from app.models import User
+from app.routes.consultants import calculate_relevance_score, clean_search_query, expand_with_skills
+from app.utils.keyword_matcher import KeywordMatcher
+from app.utils.search_index import IndexedUser
+
+PROFESSIONI = [
+    "Graphic designer", "Sviluppatore web", "Video maker", "Commercialista", "Fotografo",
+    "Social media manager", "Consulente SEO", "Copywriter", "Avvocato", "UX designer",
+]
+PAROLE = (
+    "logo branding sito wordpress react photoshop illustrator montaggio after effects "
+    "fiscale partita iva instagram facebook contenuti articoli blog interfacce figma "
+    "ecommerce shopify video youtube fotografia ritratti matrimoni contratti privacy "
+    "marketing campagne google analytics python django app mobile"
+).split()
+
+QUERIES = [
+    "logo",
+    "sito wordpress",
+    "video montaggio youtube",
+    "social marketing instagram",
+    "commercialista partita iva",
+    "logo sito video social marketing",
+    "logo sito video social marketing fotografo avvocato seo python app",
+]
+
+
+def make_users(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    return [
+        User(
+            id=i,
+            email=f"user{i}@example.com",
+            password_md5="x",
+            nome=f"Nome{i}",
+            cognome=f"Cognome{i}",
+            professione=rng.choice(PROFESSIONI),
+            descrizione=" ".join(rng.choices(PAROLE, k=rng.randint(8, 30))).capitalize(),
+            aree_interesse=",".join(rng.sample(PAROLE, 3)),
+            bollini=rng.randint(0, 5),
+            consulenze_vendute=rng.randint(0, 20),
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def score_all(matcher: KeywordMatcher, users) -> list:
+    return [matcher.score(user) for user in users]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    indexed = [IndexedUser(user) for user in users]
+
+    print(f"{args.users} profili, best of {args.repeat}\n")
+    print(f"{'query':<70} {'keyword':>7} {'attuale':>9} {'matcher':>9} {'no cache':>9} {'speedup':>7}")
+
+    for search in QUERIES:
+        keywords = clean_search_query(search)
+        expanded = expand_with_skills(keywords)
+
+        expected = [calculate_relevance_score(user, keywords, expanded) for user in users]
+        assert score_all(KeywordMatcher(keywords, expanded), indexed) == expected, search
+        assert score_all(KeywordMatcher(keywords, expanded), users) == expected, search
+
+        # Il matcher viene compilato dentro la misura, come avviene a ogni ricerca
+        baseline = timed(lambda: [calculate_relevance_score(u, keywords, expanded) for u in users], args.repeat)
+        cached = timed(lambda: score_all(KeywordMatcher(keywords, expanded), indexed), args.repeat)
+        uncached = timed(lambda: score_all(KeywordMatcher(keywords, expanded), users), args.repeat)
+
+        distinct = len(set(keywords) | set(expanded))
+        print(f"{search:<70} {distinct:>7} {baseline * 1000:>7.1f}ms {cached * 1000:>7.1f}ms "
+              f"{uncached * 1000:>7.1f}ms {baseline / cached:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Load test degli endpoint di polling con due profili di engine.
+
+Avvia l'app con uvicorn su un database SQLite di prova (o su --database-url)
+e la interroga con N client concorrenti che fanno quello che fanno le pagine:
+badge dei messaggi e delle notifiche, lista conversazioni e polling
+incrementale della chat, con una piccola quota di invii di messaggi per
+avere scritture concorrenti.
+
+Profili:
+    before  configurazione precedente: echo SQL, journal DELETE, synchronous FULL,
+            niente busy_timeout/mmap, pool di default
+    after   configurazione attuale di app/database.py (default da environment)
+
+Uso:
+    python -m benchmarks.load_polling [--duration 15] [--concurrency 20] [--profiles before,after]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import itsdangerous
+from sqlmodel import SQLModel, Session, create_engine
+
+from app.models import User, Conversation, Message, Notification
+
+ROOT = Path(__file__).resolve().parent.parent
+SESSION_SECRET = "load-test-secret"
+
+PROFILES = {
+    "before": {
+        "DB_ECHO": "true",
+        "DB_POOL_SIZE": "5",
+        "DB_MAX_OVERFLOW": "10",
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_BUSY_TIMEOUT_MS": "0",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    "after": {},
+}
+
+
+def seed_database(url: str, users: int, messages_per_conversation: int):
+    """Utenti, conversazioni tra coppie vicine, messaggi e notifiche"""
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(1, users + 1):
+            session.add(User(id=i, email=f"load{i}@example.com", password_md5="x", nome=f"Load{i}", confirmed=1))
+        session.commit()
+
+        for i in range(1, users + 1, 2):
+            conversation = Conversation(user1_id=i, user2_id=i + 1, message_count=messages_per_conversation)
+            session.add(conversation)
+            session.flush()
+            for n in range(messages_per_conversation):
+                sender = i if n % 2 else i + 1
+                session.add(Message(conversation_id=conversation.id, sender_id=sender, content=f"messaggio {n}", is_read=True))
+            session.add(Notification(user_id=i, type="community_contact", title="Contatto", message="x", is_read=False))
+        session.commit()
+
+    # Riepiloghi delle conversazioni come dopo la migrazione
+    from app.utils.conversation_summary import backfill_conversation_summaries
+    with Session(engine) as session:
+        backfill_conversation_summaries(session)
+        session.commit()
+    engine.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def session_cookie(user_id: int) -> str:
+    signer = itsdangerous.TimestampSigner(SESSION_SECRET)
+    return signer.sign(base64.b64encode(json.dumps({"user_id": user_id}).encode())).decode()
+
+
+def start_server(database_url: str, profile: dict, port: int, log_path: Path, root: Path = ROOT):
+    env = dict(os.environ, DATABASE_URL=database_url, SESSION_SECRET=SESSION_SECRET, **profile)
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/static/push.js").status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not start, see {log_path}")
+
+
+async def client_loop(base_url: str, user_id: int, deadline: float, write_ratio: float, latencies: list, errors: list):
+    other_id = user_id + 1 if user_id % 2 else user_id - 1
+    last_id = 0
+    rng = random.Random(user_id)
+    async with httpx.AsyncClient(base_url=base_url, cookies={"session": session_cookie(user_id)}, timeout=30) as client:
+        while time.monotonic() < deadline:
+            for method, url in (
+                ("GET", "/api/unread-count"),
+                ("GET", "/api/notifications/unread/count"),
+                ("GET", "/api/conversations"),
+                ("GET", f"/api/messaggi/{other_id}?since_id={last_id}"),
+            ):
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+                    elif "since_id" in url:
+                        data = response.json()
+                        if data.get("messages"):
+                            last_id = data["messages"][-1]["id"]
+                except httpx.HTTPError as e:
+                    errors.append(type(e).__name__)
+                latencies.append(time.perf_counter() - started)
+
+            if rng.random() < write_ratio:
+                started = time.perf_counter()
+                response = await client.post(f"/api/messaggi/{other_id}", data={"content": "carico"})
+                # 400 = limite di messaggi della conversazione raggiunto: atteso nei test lunghi
+                if response.status_code > 400:
+                    errors.append(response.status_code)
+                latencies.append(time.perf_counter() - started)
+
+
+async def run_load(base_url: str, users: int, concurrency: int, duration: float, write_ratio: float):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*[
+        client_loop(base_url, (n % users) + 1, deadline, write_ratio, latencies, errors)
+        for n in range(concurrency)
+    ])
+    elapsed = time.monotonic() - started
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=20, help="messaggi per conversazione")
+    parser.add_argument("--write-ratio", type=float, default=0.05, help="probabilità di un invio per giro di polling")
+    parser.add_argument("--profiles", default="before,after")
+    parser.add_argument("--database-url", help="database già esistente e popolato (default: SQLite temporaneo)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="helpy-load-"))
+    template_db = workdir / "template.db"
+    if not args.database_url:
+        seed_database(f"sqlite:///{template_db}", args.users, args.messages)
+
+    try:
+        print(f"{'profile':<8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'requests':>9} {'errors':>7}")
+        for name in args.profiles.split(","):
+            if args.database_url:
+                database_url = args.database_url
+            else:
+                # Copia separata per profilo: il journal mode resta salvato nel file
+                db_path = workdir / f"{name}.db"
+                shutil.copy(template_db, db_path)
+                database_url = f"sqlite:///{db_path}"
+
+            port = free_port()
+            server = start_server(database_url, PROFILES[name], port, workdir / f"{name}.log")
+            try:
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(f"http://127.0.0.1:{port}", args.users, args.concurrency, args.duration, args.write_ratio)
+                )
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+            print(
+                f"{name:<8} {len(latencies) / elapsed:>9.1f} {statistics.median(latencies) * 1000:>8.1f} "
+                f"{p95 * 1000:>8.1f} {len(latencies):>9} {len(errors):>7}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
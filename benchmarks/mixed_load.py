@@ -0,0 +1,160 @@
+"""
+Latenza dei polling della chat sotto carico misto.
+
+Un solo worker uvicorn riceve insieme i polling della chat (badge, lista
+conversazioni, messaggi incrementali) e richieste lente sulle prenotazioni
+(lista completa di un consulente con molte prenotazioni). Con le query
+bloccanti dentro gli handler async ogni richiesta lenta ferma l'event loop e
+tutti i polling in coda aspettano; con il layer asincrono (e gli handler sync
+nel threadpool) i polling restano veloci. Riporta p50 / p99 separati per i due
+tipi di richiesta.
+
+Il confronto "before" gira su una copia del codice a un commit precedente
+(git worktree temporaneo), sullo stesso database di partenza:
+
+Uso:
+    python -m benchmarks.mixed_load --baseline-ref <commit> [--duration 15] [--pollers 20] [--bookers 2]
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+from sqlmodel import Session, create_engine
+
+from app.models import Booking, User
+from benchmarks.load_polling import ROOT, free_port, seed_database, session_cookie, start_server
+
+
+def seed_bookings(url: str, consultant_id: int, clients: int, bookings: int):
+    """Un consulente molto prenotato: la sua lista prenotazioni è la richiesta lenta"""
+    engine = create_engine(url)
+    start = datetime.now() - timedelta(days=bookings // 8)
+    with Session(engine) as session:
+        session.add(User(id=consultant_id, email="consultant@example.com", password_md5="x", nome="Consulente", confirmed=1))
+        for n in range(bookings):
+            when = start + timedelta(hours=3 * n)
+            session.add(Booking(
+                client_user_id=(n % clients) + 1,
+                consultant_user_id=consultant_id,
+                booking_date=when,
+                start_time=when.strftime("%H:%M"),
+                end_time=(when + timedelta(minutes=30)).strftime("%H:%M"),
+                duration_minutes=30,
+                status="confirmed",
+                payment_status="paid",
+            ))
+        session.commit()
+    engine.dispose()
+
+
+async def poller(base_url: str, user_id: int, deadline: float, latencies: list, errors: list):
+    other_id = user_id + 1 if user_id % 2 else user_id - 1
+    async with httpx.AsyncClient(base_url=base_url, cookies={"session": session_cookie(user_id)}, timeout=60) as client:
+        while time.monotonic() < deadline:
+            for url in (
+                "/api/unread-count",
+                "/api/notifications/unread/count",
+                "/api/conversations",
+                f"/api/messaggi/{other_id}?since_id=0",
+            ):
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+                except httpx.HTTPError as e:
+                    errors.append(type(e).__name__)
+                latencies.append(time.perf_counter() - started)
+            # Ritmo da pagina aperta, compresso: non è un test di throughput
+            await asyncio.sleep(random.uniform(0.05, 0.15))
+
+
+async def booker(base_url: str, consultant_id: int, deadline: float, latencies: list, errors: list):
+    async with httpx.AsyncClient(base_url=base_url, cookies={"session": session_cookie(consultant_id)}, timeout=60) as client:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get("/api/booking/my-bookings")
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+            latencies.append(time.perf_counter() - started)
+
+
+async def run_load(base_url: str, users: int, consultant_id: int, pollers: int, bookers: int, duration: float):
+    poll_latencies, booking_latencies, errors = [], [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *[poller(base_url, (n % users) + 1, deadline, poll_latencies, errors) for n in range(pollers)],
+        *[booker(base_url, consultant_id, deadline, booking_latencies, errors) for _ in range(bookers)],
+    )
+    return poll_latencies, booking_latencies, errors
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--pollers", type=int, default=20, help="client che fanno i polling della chat")
+    parser.add_argument("--bookers", type=int, default=2, help="client che chiedono la lista prenotazioni")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--bookings", type=int, default=3000, help="prenotazioni del consulente")
+    parser.add_argument("--baseline-ref", help="commit da misurare come 'before' (default: solo il codice attuale)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="helpy-mixed-"))
+    template_db = workdir / "template.db"
+    consultant_id = args.users + 1
+    seed_database(f"sqlite:///{template_db}", args.users, 20)
+    seed_bookings(f"sqlite:///{template_db}", consultant_id, args.users, args.bookings)
+
+    profiles = [("after", ROOT)]
+    if args.baseline_ref:
+        baseline_root = workdir / "baseline"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(baseline_root), args.baseline_ref],
+            cwd=ROOT, check=True, capture_output=True,
+        )
+        profiles.insert(0, ("before", baseline_root))
+
+    try:
+        print(f"{'profile':<8} {'poll p50':>9} {'poll p99':>9} {'polls':>7} {'book p50':>9} {'book p99':>9} {'books':>6} {'errors':>7}")
+        for name, root in profiles:
+            db_path = workdir / f"{name}.db"
+            shutil.copy(template_db, db_path)
+            port = free_port()
+            server = start_server(f"sqlite:///{db_path}", {}, port, workdir / f"{name}.log", root=root)
+            try:
+                polls, books, errors = asyncio.run(run_load(
+                    f"http://127.0.0.1:{port}", args.users, consultant_id, args.pollers, args.bookers, args.duration
+                ))
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+            print(
+                f"{name:<8} {percentile(polls, 0.5) * 1000:>9.1f} {percentile(polls, 0.99) * 1000:>9.1f} {len(polls):>7} "
+                f"{percentile(books, 0.5) * 1000:>9.1f} {percentile(books, 0.99) * 1000:>9.1f} {len(books):>6} {len(errors):>7}"
+            )
+    finally:
+        if args.baseline_ref:
+            subprocess.run(["git", "worktree", "remove", "--force", str(workdir / "baseline")], cwd=ROOT, capture_output=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
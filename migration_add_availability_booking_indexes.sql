@@ -0,0 +1,5 @@
+-- Migration: Indici compositi per slot disponibili e prenotazioni per giorno (filtri a intervallo su date)
+-- SQLite version
+
+CREATE INDEX IF NOT EXISTS idx_availability_block_user_date_active_status ON availability_block(user_id, date, is_active, status);
+CREATE INDEX IF NOT EXISTS idx_booking_consultant_date_status ON booking(consultant_user_id, booking_date, status);
@@ -0,0 +1,32 @@
+-- Migration: Disponibilità ricorrente (regole settimanali ed eccezioni), espansa negli slot al momento della richiesta
+-- SQLite version
+
+CREATE TABLE IF NOT EXISTS availability_rule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start_time VARCHAR NOT NULL,
+    end_time VARCHAR NOT NULL,
+    valid_from DATETIME,
+    valid_until DATETIME,
+    is_active BOOLEAN NOT NULL DEFAULT 1,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES user(id)
+);
+
+CREATE TABLE IF NOT EXISTS availability_exception (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date DATETIME NOT NULL,
+    reason VARCHAR,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES user(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_availability_rule_user_weekday ON availability_rule(user_id, weekday);
+CREATE INDEX IF NOT EXISTS idx_availability_exception_user_date ON availability_exception(user_id, date);
+
+-- weekday: 0 = lunedì ... 6 = domenica
+-- valid_from / valid_until: periodo di validità della regola (inclusi, NULL = senza limite)
+-- I blocchi salvati in availability_block per un giorno sostituiscono le regole di quel giorno
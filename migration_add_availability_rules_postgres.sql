@@ -0,0 +1,33 @@
+-- Migration: Disponibilità ricorrente (regole settimanali ed eccezioni), espansa negli slot al momento della richiesta
+-- PostgreSQL version
+
+CREATE TABLE IF NOT EXISTS availability_rule (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start_time VARCHAR NOT NULL,
+    end_time VARCHAR NOT NULL,
+    valid_from TIMESTAMP,
+    valid_until TIMESTAMP,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_availability_rule_user FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE,
+    CONSTRAINT chk_availability_rule_weekday CHECK (weekday BETWEEN 0 AND 6)
+);
+
+CREATE TABLE IF NOT EXISTS availability_exception (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    date TIMESTAMP NOT NULL,
+    reason VARCHAR,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_availability_exception_user FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_availability_rule_user_weekday ON availability_rule(user_id, weekday);
+CREATE INDEX IF NOT EXISTS idx_availability_exception_user_date ON availability_exception(user_id, date);
+
+COMMENT ON TABLE availability_rule IS 'Disponibilità ricorrente settimanale (espansa negli slot, senza righe per giorno)';
+COMMENT ON COLUMN availability_rule.weekday IS '0 = lunedì ... 6 = domenica';
+COMMENT ON TABLE availability_exception IS 'Giorni in cui le regole ricorrenti non valgono';
@@ -0,0 +1,41 @@
+-- Migration: Riepilogo denormalizzato sulle conversazioni
+-- SQLite version
+-- Ultimo messaggio, non letti per lato e numero messaggi (vedi app/utils/conversation_summary.py)
+
+ALTER TABLE conversations ADD COLUMN last_message_id INTEGER;
+ALTER TABLE conversations ADD COLUMN last_message_preview VARCHAR(200);
+ALTER TABLE conversations ADD COLUMN last_message_at TIMESTAMP;
+ALTER TABLE conversations ADD COLUMN last_message_sender_id INTEGER;
+ALTER TABLE conversations ADD COLUMN unread_for_user1 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversations ADD COLUMN unread_for_user2 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill dai messaggi esistenti
+UPDATE conversations SET
+    last_message_id = (
+        SELECT m.id FROM messages m WHERE m.conversation_id = conversations.id
+        ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ),
+    last_message_preview = (
+        SELECT substr(m.content, 1, 200) FROM messages m WHERE m.conversation_id = conversations.id
+        ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ),
+    last_message_at = (
+        SELECT m.created_at FROM messages m WHERE m.conversation_id = conversations.id
+        ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ),
+    last_message_sender_id = (
+        SELECT m.sender_id FROM messages m WHERE m.conversation_id = conversations.id
+        ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ),
+    unread_for_user1 = (
+        SELECT COUNT(*) FROM messages m
+        WHERE m.conversation_id = conversations.id AND m.sender_id = conversations.user2_id AND m.is_read = 0
+    ),
+    unread_for_user2 = (
+        SELECT COUNT(*) FROM messages m
+        WHERE m.conversation_id = conversations.id AND m.sender_id = conversations.user1_id AND m.is_read = 0
+    ),
+    message_count = (
+        SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id
+    );
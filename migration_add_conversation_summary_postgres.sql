@@ -0,0 +1,42 @@
+-- Migration: Riepilogo denormalizzato sulle conversazioni (PostgreSQL)
+-- Ultimo messaggio, non letti per lato e numero messaggi (vedi app/utils/conversation_summary.py)
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_id INTEGER;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_preview VARCHAR(200);
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS last_message_sender_id INTEGER;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS unread_for_user1 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS unread_for_user2 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill dai messaggi esistenti
+UPDATE conversations c SET
+    last_message_id = last.id,
+    last_message_preview = substr(last.content, 1, 200),
+    last_message_at = last.created_at,
+    last_message_sender_id = last.sender_id
+FROM (
+    SELECT DISTINCT ON (conversation_id) conversation_id, id, content, created_at, sender_id
+    FROM messages
+    ORDER BY conversation_id, created_at DESC, id DESC
+) last
+WHERE last.conversation_id = c.id;
+
+UPDATE conversations c SET
+    unread_for_user1 = COALESCE(counts.unread_for_user1, 0),
+    unread_for_user2 = COALESCE(counts.unread_for_user2, 0),
+    message_count = COALESCE(counts.message_count, 0)
+FROM (
+    SELECT
+        m.conversation_id,
+        COUNT(*) FILTER (WHERE m.sender_id = cv.user2_id AND NOT m.is_read) AS unread_for_user1,
+        COUNT(*) FILTER (WHERE m.sender_id = cv.user1_id AND NOT m.is_read) AS unread_for_user2,
+        COUNT(*) AS message_count
+    FROM messages m
+    JOIN conversations cv ON cv.id = m.conversation_id
+    GROUP BY m.conversation_id
+) counts
+WHERE counts.conversation_id = c.id;
+
+COMMENT ON COLUMN conversations.unread_for_user1 IS 'Messaggi di user2 non ancora letti da user1';
+COMMENT ON COLUMN conversations.unread_for_user2 IS 'Messaggi di user1 non ancora letti da user2';
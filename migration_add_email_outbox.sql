@@ -0,0 +1,24 @@
+-- Migration: Outbox delle email di notifica (invio in background con retry)
+-- SQLite version
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key VARCHAR NOT NULL UNIQUE,
+    to_email VARCHAR NOT NULL,
+    to_name VARCHAR,
+    subject VARCHAR NOT NULL,
+    template_name VARCHAR NOT NULL,
+    template_data TEXT NOT NULL DEFAULT '{}',
+    notification_id INTEGER,
+    status VARCHAR NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claim_token VARCHAR,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP,
+    FOREIGN KEY (notification_id) REFERENCES notifications(id) ON DELETE SET NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_outbox_status_next_attempt ON email_outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_email_outbox_claim_token ON email_outbox(claim_token);
@@ -0,0 +1,55 @@
+-- Migration: Ricerca full-text su profili utente e domande community
+-- SQLite version (FTS5)
+-- Le stesse istruzioni vengono eseguite all'avvio da app/utils/search_backend.py
+
+-- Tabella FTS5 per i profili utente
+CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+    nome, cognome, professione, descrizione, aree_interesse,
+    content='user', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON "user" BEGIN
+    INSERT INTO user_fts(rowid, nome, cognome, professione, descrizione, aree_interesse)
+    VALUES (new.id, new.nome, new.cognome, new.professione, new.descrizione, new.aree_interesse);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON "user" BEGIN
+    INSERT INTO user_fts(user_fts, rowid, nome, cognome, professione, descrizione, aree_interesse)
+    VALUES ('delete', old.id, old.nome, old.cognome, old.professione, old.descrizione, old.aree_interesse);
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF nome, cognome, professione, descrizione, aree_interesse ON "user" BEGIN
+    INSERT INTO user_fts(user_fts, rowid, nome, cognome, professione, descrizione, aree_interesse)
+    VALUES ('delete', old.id, old.nome, old.cognome, old.professione, old.descrizione, old.aree_interesse);
+    INSERT INTO user_fts(rowid, nome, cognome, professione, descrizione, aree_interesse)
+    VALUES (new.id, new.nome, new.cognome, new.professione, new.descrizione, new.aree_interesse);
+END;
+
+-- Tabella FTS5 per le domande community
+CREATE VIRTUAL TABLE IF NOT EXISTS community_questions_fts USING fts5(
+    title, description,
+    content='community_questions', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS community_questions_fts_ai AFTER INSERT ON community_questions BEGIN
+    INSERT INTO community_questions_fts(rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS community_questions_fts_ad AFTER DELETE ON community_questions BEGIN
+    INSERT INTO community_questions_fts(community_questions_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS community_questions_fts_au AFTER UPDATE OF title, description ON community_questions BEGIN
+    INSERT INTO community_questions_fts(community_questions_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+    INSERT INTO community_questions_fts(rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
+
+-- Indicizza le righe già presenti
+INSERT INTO user_fts(user_fts) VALUES ('rebuild');
+INSERT INTO community_questions_fts(community_questions_fts) VALUES ('rebuild');
@@ -0,0 +1,25 @@
+-- Migration: Ricerca full-text su profili utente e domande community
+-- PostgreSQL version (tsvector generato + indice GIN)
+-- Le stesse istruzioni vengono eseguite all'avvio da app/utils/search_backend.py
+
+ALTER TABLE "user" ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('italian', coalesce(professione, '')), 'A') ||
+    setweight(to_tsvector('italian', coalesce(nome, '') || ' ' || coalesce(cognome, '')), 'B') ||
+    setweight(to_tsvector('italian', coalesce(aree_interesse, '')), 'B') ||
+    setweight(to_tsvector('italian', coalesce(descrizione, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_user_search_vector ON "user" USING GIN (search_vector);
+
+ALTER TABLE community_questions ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('italian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('italian', coalesce(description, '')), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_community_questions_search_vector ON community_questions USING GIN (search_vector);
+
+-- Commenti
+COMMENT ON COLUMN "user".search_vector IS 'Vettore full-text (professione A, nome/aree B, descrizione C)';
+COMMENT ON COLUMN community_questions.search_vector IS 'Vettore full-text (titolo A, descrizione C)';
@@ -0,0 +1,4 @@
+-- Migration: Indice per la paginazione a cursore dei messaggi (since_id / before_id)
+-- PostgreSQL version
+
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_id ON messages(conversation_id, id);
@@ -0,0 +1,81 @@
+"""
+Fixture condivise dai test.
+
+engine: database SQLite temporaneo con tutte le tabelle, al posto di quello
+dell'app per get_session(), per get_async_session() (stesso file, driver
+aiosqlite) e per i moduli che importano direttamente engine. Le cache di
+processo vengono svuotate, così nessun test vede dati di un database precedente.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel, Session, create_engine
+
+from app import database, scheduler
+from app.main import app
+from app.models import User
+from app.routes import auth
+from app.utils import category_registry, notification_type_registry, search_backend, search_index
+from app.utils.slot_cache import slot_cache
+from app.utils.user_cache import user_cache
+
+# Moduli che fanno "from app.database import engine"
+ENGINE_MODULES = (database, scheduler, category_registry, notification_type_registry, search_backend, search_index)
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    """Engine SQLite usato da tutta l'app per la durata del test"""
+    path = tmp_path / "test.db"
+    test_engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(test_engine)
+    for module in ENGINE_MODULES:
+        monkeypatch.setattr(module, "engine", test_engine)
+    # Senza pool: nessuna connessione asincrona resta aperta tra un event loop e l'altro
+    monkeypatch.setattr(database, "async_engine", create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool))
+    slot_cache.clear()
+    user_cache.clear()
+    yield test_engine
+    slot_cache.clear()
+    user_cache.clear()
+    test_engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    """TestClient dell'app sul database del test"""
+    return TestClient(app)
+
+
+@pytest.fixture
+def add_users(engine):
+    """
+    Crea utenti di prova: add_users(1, 2) → u1@example.com / Nome1, u2@example.com / Nome2.
+    I campi passati per nome valgono per tutti gli utenti creati.
+    """
+    def add(*user_ids: int, **fields):
+        with Session(engine) as session:
+            users = [
+                User(id=user_id, email=f"u{user_id}@example.com", password_md5="x", nome=f"Nome{user_id}", **fields)
+                for user_id in user_ids
+            ]
+            session.add_all(users)
+            session.commit()
+            for user in users:
+                session.refresh(user)
+        return users
+
+    return add
+
+
+@pytest.fixture
+def login(monkeypatch):
+    """login(user): le richieste successive sono autenticate come user (None: non autenticate)"""
+    current = {"user": None}
+    monkeypatch.setattr(auth, "_authenticate", lambda request: current["user"])
+
+    def set_user(user):
+        current["user"] = user
+
+    return set_user
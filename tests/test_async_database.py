@@ -0,0 +1,14 @@
+from app.database import _async_database_url
+
+
+def test_async_url_uses_async_drivers():
+    url, connect_args = _async_database_url("sqlite:///./helpy.db")
+    assert url.drivername == "sqlite+aiosqlite"
+    assert url.database == "./helpy.db"
+    assert connect_args == {}
+
+    url, connect_args = _async_database_url("postgresql://user:pw@db.example.com/helpy?sslmode=require")
+    assert url.drivername == "postgresql+asyncpg"
+    # asyncpg non accetta sslmode nell'URL: diventa l'argomento ssl
+    assert "sslmode" not in url.query
+    assert connect_args == {"ssl": "require"}
@@ -0,0 +1,100 @@
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models import AvailabilityBlock, AvailabilityRule
+from app.routes import availability
+from app.utils.availability_rules import rule_blocks_by_day
+
+
+@pytest.fixture
+def consultant(monkeypatch, add_users):
+    """Consulente 1 autenticato sulle route di disponibilità"""
+    user, = add_users(1)
+    monkeypatch.setattr(availability, "verify_token", lambda request: user)
+    return user
+
+
+def _starts(client, day: date):
+    response = client.get(f"/api/booking/available-slots/1?date={day:%Y-%m-%d}&duration=60")
+    assert response.status_code == 200
+    return [(slot["start_time"], slot["availability_block_id"]) for slot in response.json()["slots"]]
+
+
+def test_rule_blocks_by_day():
+    monday = date(2030, 1, 7)
+    rules = [
+        AvailabilityRule(id=1, user_id=1, weekday=0, start_time="14:00", end_time="16:00"),
+        AvailabilityRule(id=2, user_id=1, weekday=0, start_time="09:00", end_time="11:00", valid_until=datetime(2030, 1, 14)),
+        AvailabilityRule(id=3, user_id=1, weekday=2, start_time="09:00", end_time="10:00", valid_from=datetime(2030, 1, 16)),
+    ]
+    days = [monday + timedelta(days=offset) for offset in range(21)]
+    blocks = rule_blocks_by_day(rules, {monday + timedelta(days=7)}, days)
+
+    assert [(block.id, block.start_time) for block in blocks[monday]] == [(None, "09:00"), (None, "14:00")]
+    assert monday + timedelta(days=7) not in blocks  # eccezione
+    assert [block.start_time for block in blocks[monday + timedelta(days=14)]] == ["14:00"]  # fuori validità
+    assert monday + timedelta(days=2) not in blocks and monday + timedelta(days=9) in blocks
+    assert len(blocks) == 4
+
+
+def test_copy_availability_uses_one_delete_and_one_insert(engine, client, consultant):
+    source = datetime(2030, 1, 7)
+    targets = [source + timedelta(days=offset) for offset in range(7, 91, 7)]
+    with Session(engine) as session:
+        session.add(AvailabilityBlock(user_id=1, date=source, start_time="09:00", end_time="12:00", total_minutes=180))
+        session.add(AvailabilityBlock(user_id=1, date=source, start_time="15:00", end_time="17:00", total_minutes=120))
+        session.add(AvailabilityBlock(user_id=1, date=targets[0], start_time="08:00", end_time="09:00", total_minutes=60))
+        session.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement.split()[0]))
+    response = client.post("/api/availability/copy", data={
+        "source_date": "2030-01-07",
+        "target_dates": json.dumps([target.strftime('%Y-%m-%d') for target in targets])
+    })
+    assert response.json()["success"] is True
+    assert statements.count("DELETE") == 1
+    assert statements.count("INSERT") == 1
+
+    with Session(engine) as session:
+        blocks = session.exec(select(AvailabilityBlock).where(AvailabilityBlock.date > source)).all()
+    assert len(blocks) == 2 * len(targets)
+    assert sorted({block.start_time for block in blocks}) == ["09:00", "15:00"]
+
+
+def test_rules_expand_at_query_time(engine, client, consultant):
+    day = date.today() + timedelta(days=14)
+    next_week = day + timedelta(days=7)
+
+    response = client.post("/api/availability/rules", data={"weekday": day.weekday(), "start_time": "09:00", "end_time": "11:00"})
+    assert response.status_code == 200
+    assert client.post("/api/availability/rules", data={"weekday": 7, "start_time": "09:00", "end_time": "11:00"}).status_code == 400
+    assert client.post("/api/availability/rules", data={"weekday": 1, "start_time": "11:00", "end_time": "09:00"}).status_code == 400
+
+    # Nessuna riga per giorno: gli slot vengono dalla regola
+    with Session(engine) as session:
+        assert session.exec(select(AvailabilityBlock)).all() == []
+    assert _starts(client, day) == [("09:00", None), ("09:30", None), ("10:00", None)]
+    assert _starts(client, next_week) == [("09:00", None), ("09:30", None), ("10:00", None)]
+
+    # Eccezione: il giorno non è disponibile
+    exception_id = client.post("/api/availability/exceptions", data={"date": f"{day:%Y-%m-%d}", "reason": "Ferie"}).json()["exception"]["id"]
+    assert _starts(client, day) == []
+    assert _starts(client, next_week) != []
+
+    # I blocchi salvati per il giorno sostituiscono la regola
+    client.post("/api/availability/save", data={"date": f"{next_week:%Y-%m-%d}", "blocks": json.dumps([{"start_time": "15:00", "end_time": "16:00"}])})
+    assert [start for start, _ in _starts(client, next_week)] == ["15:00"]
+
+    listed = client.get("/api/availability/rules").json()
+    assert [rule["start_time"] for rule in listed["rules"]] == ["09:00"]
+    assert [exception["reason"] for exception in listed["exceptions"]] == ["Ferie"]
+
+    assert client.delete(f"/api/availability/exceptions/{exception_id}").status_code == 200
+    assert [start for start, _ in _starts(client, day)] == ["09:00", "09:30", "10:00"]
+    assert client.delete(f"/api/availability/rules/{listed['rules'][0]['id']}").status_code == 200
+    assert _starts(client, day) == []
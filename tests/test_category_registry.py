@@ -0,0 +1,84 @@
+import asyncio
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.models import Category
+from app import main
+from app.utils import category_registry as registry_module
+from app.utils import template_helpers
+from app.utils.category_registry import CategoryRegistry
+
+
+def test_registry_serves_from_memory_and_invalidates_on_change(monkeypatch, engine):
+
+    registry = CategoryRegistry()
+    monkeypatch.setattr(registry_module, "category_registry", registry)
+
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Sviluppo", slug="sviluppo"))
+        session.add(Category(id=2, name="Design", slug="design"))
+        session.commit()
+
+    assert [category.name for category in registry.all()] == ["Design", "Sviluppo"]
+    assert registry.get(1).slug == "sviluppo"
+    assert registry.get(None) is None
+    assert registry.get(99) is None
+
+    # Nessuna query finché il registro è valido
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    registry.get(2)
+    registry.all()
+    assert queries == []
+
+    # Una modifica via ORM invalida il registro
+    with Session(engine) as session:
+        category = session.get(Category, 2)
+        category.name = "Grafica"
+        session.add(category)
+        session.commit()
+
+    queries.clear()
+    assert registry.get(2).name == "Grafica"
+    assert len(queries) == 1
+
+
+def test_middleware_reloads_expired_registry_off_the_event_loop(monkeypatch, engine):
+    registry = CategoryRegistry()
+    monkeypatch.setattr(main, "category_registry", registry)
+    monkeypatch.setattr(template_helpers, "category_registry", registry)
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Sviluppo", slug="sviluppo"))
+        session.commit()
+
+    loads = []
+    original_load = registry.load
+
+    def load():
+        try:
+            asyncio.get_running_loop()
+            loads.append("event loop")
+        except RuntimeError:
+            loads.append("threadpool")
+        original_load()
+
+    monkeypatch.setattr(registry, "load", load)
+
+    async def page(scope, receive, send):
+        scope["seen"] = [category.name for category in scope["state"]["categories"]]
+
+    middleware = main.CategoriesMiddleware(page)
+
+    def request():
+        scope = {"type": "http", "path": "/consulenti"}
+        asyncio.run(middleware(scope, None, None))
+        return scope["seen"]
+
+    # Registro scaduto: ricaricato nel threadpool
+    assert request() == ["Sviluppo"]
+    # Registro valido: solo memoria
+    assert request() == ["Sviluppo"]
+    registry.invalidate()
+    assert request() == ["Sviluppo"]
+    assert loads == ["threadpool", "threadpool"]
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from sqlmodel import Session
+
+from app.models import CommunityQuestion
+from app.routes import auth
+
+
+@pytest.fixture
+def logged_in(monkeypatch, add_users):
+    """Utente 2 autenticato; l'autenticazione deve girare fuori dall'event loop"""
+    author, user = add_users(1, 2)
+    threads = []
+
+    def authenticate(request):
+        try:
+            asyncio.get_running_loop()
+            threads.append("event loop")
+        except RuntimeError:
+            threads.append("threadpool")
+        return user
+
+    monkeypatch.setattr(auth, "_authenticate", authenticate)
+    return threads
+
+
+def _question(engine):
+    with Session(engine) as session:
+        session.add(CommunityQuestion(id=1, user_id=1, title="Sito lento", description="WordPress molto lento"))
+        session.commit()
+
+
+def test_like_and_contact_authenticate_off_the_event_loop(engine, client, logged_in):
+    _question(engine)
+
+    liked = client.post("/api/community/1/like").json()
+    assert (liked["action"], liked["upvotes"]) == ("added", 1)
+    assert client.post("/api/community/1/like").json()["action"] == "removed"
+
+    assert client.post("/api/community/1/contact").json() == {"success": True, "action": "tracked", "contacts": 1}
+    assert client.post("/api/community/1/contact").json()["action"] == "already_tracked"
+    assert client.post("/api/community/99/like").status_code == 404
+
+    assert logged_in and set(logged_in) == {"threadpool"}
+
+
+def test_like_requires_login(engine, client, login):
+    _question(engine)
+    assert client.post("/api/community/1/like").status_code == 401
+    assert client.post("/api/community/1/contact").status_code == 401
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlmodel import Session
+
+from app.models import ConsultationOffer
+from app.utils import stripe_config
+
+
+@pytest.fixture
+def offer(engine, add_users, login):
+    """Offerta in attesa del consulente 1 per il cliente 2, autenticato"""
+    consultant, client_user = add_users(1, 2)
+    login(client_user)
+    with Session(engine) as session:
+        session.add(ConsultationOffer(id=1, consultant_user_id=1, client_user_id=2, price=49.5, duration_minutes=30,
+                                      expires_at=datetime.utcnow() + timedelta(days=1)))
+        session.commit()
+
+
+def test_confirm_booking_creates_checkout_off_the_event_loop(monkeypatch, client, offer):
+    calls = []
+
+    def create_checkout_session(amount, currency, success_url, cancel_url, metadata=None):
+        try:
+            asyncio.get_running_loop()
+            on_event_loop = True
+        except RuntimeError:
+            on_event_loop = False
+        calls.append((amount, metadata["selected_date"], on_event_loop))
+        return SimpleNamespace(url="https://checkout.example/cs_1", id="cs_1")
+
+    monkeypatch.setattr(stripe_config, "create_checkout_session", create_checkout_session)
+
+    slot = {"date": "2030-01-07", "start_time": "10:00", "end_time": "10:30", "availability_block_id": 3}
+    response = client.post("/consulenza/prenota/1/confirm", json=slot)
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "checkout_url": "https://checkout.example/cs_1", "session_id": "cs_1"}
+    # La chiamata a Stripe (fino a 20 secondi) non occupa l'event loop
+    assert calls == [(4950, "2030-01-07", False)]
+
+
+def test_confirm_booking_requires_slot_data(client, offer):
+    response = client.post("/consulenza/prenota/1/confirm", json={"date": "2030-01-07"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Dati slot mancanti"
+    assert client.post("/consulenza/prenota/99/confirm", json={
+        "date": "2030-01-07", "start_time": "10:00", "end_time": "10:30"
+    }).status_code == 404
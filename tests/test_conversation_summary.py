@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.models import Conversation, Message
+from app.utils.conversation_summary import (
+    PREVIEW_LENGTH,
+    backfill_conversation_summaries,
+    mark_conversation_read,
+    rebuild_conversation_summary,
+    record_new_message,
+    unread_for,
+)
+
+SUMMARY = ("last_message_id", "last_message_preview", "last_message_at", "last_message_sender_id",
+           "unread_for_user1", "unread_for_user2", "message_count")
+
+
+def _summary(engine, conversation_id: int) -> tuple:
+    with Session(engine) as session:
+        conversation = session.get(Conversation, conversation_id)
+        return tuple(getattr(conversation, field) for field in SUMMARY)
+
+
+def _assert_matches_rebuild(engine, conversation_id: int):
+    """Il riepilogo aggiornato incrementalmente è quello ricalcolato dai messaggi"""
+    incremental = _summary(engine, conversation_id)
+    with Session(engine) as session:
+        assert backfill_conversation_summaries(session) == 1
+        session.commit()
+    assert _summary(engine, conversation_id) == incremental
+
+
+def _send(engine, conversation_id: int, sender_id: int, content: str, minutes: int) -> int:
+    with Session(engine) as session:
+        conversation = session.get(Conversation, conversation_id)
+        message = Message(conversation_id=conversation_id, sender_id=sender_id, content=content, is_read=False,
+                          created_at=datetime(2030, 1, 7, 9, 0) + timedelta(minutes=minutes))
+        session.add(message)
+        record_new_message(session, conversation, message)
+        session.commit()
+        return message.id
+
+
+def _mark_read(session, conversation_id: int, sender_id: int) -> int:
+    """Update di is_read come in get_messages; restituisce il rowcount"""
+    return session.execute(
+        update(Message)
+        .where(Message.conversation_id == conversation_id, Message.sender_id == sender_id, Message.is_read == False)
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def test_summary_follows_send_read_and_delete(engine, add_users):
+    add_users(1, 2)
+    with Session(engine) as session:
+        session.add(Conversation(id=1, user1_id=1, user2_id=2))
+        session.commit()
+
+    # Invio: ultimo messaggio, non letti del destinatario, contatore
+    first = _send(engine, 1, 1, "Ciao", 0)
+    second = _send(engine, 1, 1, "x" * (PREVIEW_LENGTH + 50), 1)
+    reply = _send(engine, 1, 2, "Risposta", 2)
+    last_id, preview, last_at, sender_id, unread1, unread2, count = _summary(engine, 1)
+    assert (last_id, preview, sender_id, unread1, unread2, count) == (reply, "Risposta", 2, 1, 2, 3)
+    assert last_at == datetime(2030, 1, 7, 9, 2)
+    _assert_matches_rebuild(engine, 1)
+
+    # Lettura: si azzerano solo i non letti del lettore
+    with Session(engine) as session:
+        conversation = session.get(Conversation, 1)
+        marked = _mark_read(session, 1, 1)
+        mark_conversation_read(session, conversation, 2, marked)
+        session.commit()
+        assert (unread_for(conversation, 1), unread_for(conversation, 2)) == (1, 0)
+    _assert_matches_rebuild(engine, 1)
+
+    # Eliminazione dell'ultimo messaggio: l'anteprima torna al precedente, troncata
+    with Session(engine) as session:
+        conversation = session.get(Conversation, 1)
+        session.delete(session.get(Message, reply))
+        rebuild_conversation_summary(session, conversation)
+        session.commit()
+    last_id, preview, _, sender_id, unread1, unread2, count = _summary(engine, 1)
+    assert (last_id, preview, sender_id, unread1, unread2, count) == (second, "x" * PREVIEW_LENGTH, 1, 0, 0, 2)
+    _assert_matches_rebuild(engine, 1)
+
+    # Eliminati tutti: riepilogo vuoto
+    with Session(engine) as session:
+        conversation = session.get(Conversation, 1)
+        for message_id in (first, second):
+            session.delete(session.get(Message, message_id))
+        rebuild_conversation_summary(session, conversation)
+        session.commit()
+    assert _summary(engine, 1) == (None, None, None, None, 0, 0, 0)
+
+
+def test_backfill_fills_summaries_of_existing_conversations(engine, add_users):
+    add_users(1, 2, 3)
+    with Session(engine) as session:
+        session.add(Conversation(id=1, user1_id=1, user2_id=2))
+        session.add(Conversation(id=2, user1_id=1, user2_id=3))
+        session.commit()
+        # Messaggi inseriti senza riepilogo, come prima della migrazione
+        session.add(Message(conversation_id=1, sender_id=2, content="Primo", is_read=True, created_at=datetime(2030, 1, 7, 9, 0)))
+        session.add(Message(conversation_id=1, sender_id=1, content="Secondo", is_read=False, created_at=datetime(2030, 1, 7, 9, 5)))
+        session.add(Message(conversation_id=1, sender_id=1, content="Terzo", is_read=False, created_at=datetime(2030, 1, 7, 9, 6)))
+        session.commit()
+
+        assert backfill_conversation_summaries(session) == 2
+        session.commit()
+
+    _, preview, last_at, sender_id, unread1, unread2, count = _summary(engine, 1)
+    assert (preview, last_at, sender_id, unread1, unread2, count) == ("Terzo", datetime(2030, 1, 7, 9, 6), 1, 0, 2, 3)
+    assert _summary(engine, 2) == (None, None, None, None, 0, 0, 0)
+
+
+def test_message_sent_while_reading_stays_unread(engine, add_users):
+    add_users(1, 2)
+    with Session(engine) as session:
+        session.add(Conversation(id=1, user1_id=1, user2_id=2))
+        session.commit()
+    _send(engine, 1, 1, "Uno", 0)
+    _send(engine, 1, 1, "Due", 1)
+
+    with Session(engine) as session:
+        marked = _mark_read(session, 1, 1)
+        session.commit()
+    # Invio concorrente tra l'update di is_read e quello del contatore
+    _send(engine, 1, 1, "Tre", 2)
+    with Session(engine) as session:
+        conversation = session.get(Conversation, 1)
+        mark_conversation_read(session, conversation, 2, marked)
+        session.commit()
+        assert (marked, unread_for(conversation, 2)) == (2, 1)
+    _assert_matches_rebuild(engine, 1)
@@ -0,0 +1,127 @@
+"""
+Le query per giorno degli slot usano gli indici compositi (EXPLAIN).
+
+Il test PostgreSQL parte solo con un database di prova:
+    INDEX_TEST_DATABASE_URL=postgresql://postgres@localhost/helpy_test pytest tests/test_date_range_indexes.py
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, select, text
+from sqlmodel import SQLModel, Session, create_engine
+
+from app import database
+from app.models import AvailabilityBlock, Booking, User
+from app.utils.date_filters import between_days, on_day
+from app.utils.slot_cache import slot_cache
+
+INDEX_TEST_DATABASE_URL = os.getenv("INDEX_TEST_DATABASE_URL")
+
+BLOCK_INDEX = "idx_availability_block_user_date_active_status"
+BOOKING_INDEX = "idx_booking_consultant_date_status"
+
+
+def _seed(engine, day: datetime):
+    with Session(engine) as session:
+        session.add(User(id=1, email="c@example.com", password_md5="x", nome="Consulente"))
+        session.add(User(id=2, email="u@example.com", password_md5="x", nome="Cliente"))
+        session.commit()
+        session.add(AvailabilityBlock(user_id=1, date=day, start_time="09:00", end_time="12:00", total_minutes=180))
+        session.add(Booking(client_user_id=2, consultant_user_id=1, booking_date=day + timedelta(hours=10),
+                            start_time="10:00", end_time="10:30", duration_minutes=30, status="confirmed"))
+        session.commit()
+
+
+def _slot_queries(client, engine, day: datetime):
+    """Query su availability_block e booking eseguite dagli endpoint degli slot, con i parametri"""
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM availability_block" in statement or "FROM booking" in statement:
+            queries.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    date_str = day.strftime('%Y-%m-%d')
+    # Senza cache: ogni endpoint interroga il database
+    slot_cache.clear()
+    assert client.get(f"/api/booking/available-slots/1?date={date_str}&duration=30").status_code == 200
+    slot_cache.clear()
+    assert client.get(f"/api/booking/available-slots/1/range?start={date_str}&end={date_str}").status_code == 200
+    event.remove(engine, "before_cursor_execute", capture)
+    return queries
+
+
+def _expected_index(statement: str) -> str:
+    return BLOCK_INDEX if "FROM availability_block" in statement else BOOKING_INDEX
+
+
+def test_on_day_matches_date_only_and_datetime_rows(engine):
+    with Session(engine) as session:
+        session.add(AvailabilityBlock(user_id=1, date=datetime(2030, 1, 7, 0, 0), start_time="09:00", end_time="10:00", total_minutes=60))
+        session.add(AvailabilityBlock(user_id=1, date=datetime(2030, 1, 8, 0, 0), start_time="09:00", end_time="10:00", total_minutes=60))
+        session.commit()
+        # Come le righe degli script SQL: data senza ora
+        session.execute(text(
+            "INSERT INTO availability_block (user_id, date, start_time, end_time, total_minutes, booked_minutes, status, is_active, created_at, updated_at) "
+            "VALUES (1, '2030-01-07', '14:00', '15:00', 60, 0, 'available', 1, '2030-01-01', '2030-01-01')"
+        ))
+        session.commit()
+
+        def count(condition):
+            return len(session.execute(select(AvailabilityBlock.id).where(condition)).all())
+
+        assert count(on_day(AvailabilityBlock.date, "2030-01-07")) == 2
+        assert count(on_day(AvailabilityBlock.date, "2030-01-08")) == 1
+        assert count(between_days(AvailabilityBlock.date, "2030-01-06", "2030-01-08")) == 3
+
+
+def test_sqlite_slot_queries_use_composite_indexes(engine, client):
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
+    _seed(engine, day)
+
+    queries = _slot_queries(client, engine, day)
+    assert len(queries) == 4
+
+    with engine.connect() as conn:
+        for statement, parameters in queries:
+            plan = " ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            assert f"USING INDEX {_expected_index(statement)}" in plan, plan
+            # La data è un termine di ricerca dell'indice, non un filtro riga per riga
+            assert "date>? AND" in plan, plan
+
+
+@pytest.mark.skipif(not INDEX_TEST_DATABASE_URL, reason="INDEX_TEST_DATABASE_URL non impostato")
+def test_postgres_slot_queries_use_composite_indexes(monkeypatch, client):
+    engine = create_engine(INDEX_TEST_DATABASE_URL)
+    monkeypatch.setattr(database, "engine", engine)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    try:
+        day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
+        _seed(engine, day)
+        # Altri consulenti e altri giorni: con statistiche realistiche l'indice composito
+        # è più selettivo di quelli su una sola colonna
+        with Session(engine) as session:
+            session.add_all(User(id=user_id, email=f"c{user_id}@example.com", password_md5="x") for user_id in range(3, 43))
+            session.commit()
+            for user_id in range(1, 43):
+                for offset in range(-10, 20):
+                    session.add(AvailabilityBlock(user_id=user_id, date=day + timedelta(days=offset), start_time="09:00", end_time="12:00", total_minutes=180))
+                    session.add(Booking(client_user_id=2, consultant_user_id=user_id, booking_date=day + timedelta(days=offset, hours=9),
+                                        start_time="09:00", end_time="09:30", duration_minutes=30, status="completed"))
+            session.commit()
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE availability_block")
+            conn.exec_driver_sql("ANALYZE booking")
+
+        queries = _slot_queries(client, engine, day)
+        assert len(queries) == 4
+
+        with engine.connect() as conn:
+            for statement, parameters in queries:
+                plan = " ".join(row[0] for row in conn.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+                assert _expected_index(statement) in plan, plan
+                assert "date >=" in plan.split("Index Cond:")[1], plan
+    finally:
+        SQLModel.metadata.drop_all(engine)
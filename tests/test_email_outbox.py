@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models import EmailOutbox
+from app.routes import user_profile
+from app.utils import email_outbox
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _setup(monkeypatch, responses):
+    monkeypatch.setenv("SENDGRID_API_KEY", "test-key")
+
+    sent = []
+
+    def fake_send(api_key, message):
+        outcome = responses.pop(0) if responses else None
+        if outcome:
+            raise FakeHTTPError(outcome)
+        sent.append(message.get())
+
+    monkeypatch.setattr(email_outbox, "send_with_sendgrid", fake_send)
+    return sent
+
+
+def _enqueue(session, key, template="reminder_1h.html"):
+    return email_outbox.enqueue_email(
+        session, "dest@example.com", "Dest", "Promemoria", template,
+        {"user_name": "Dest", "time": "10:00"}, idempotency_key=key
+    )
+
+
+def test_outbox_sends_retries_and_deduplicates(monkeypatch, engine):
+    # Primo invio ok, poi un 503 (temporaneo) e un 400 (definitivo)
+    sent = _setup(monkeypatch, [None, 503, 400])
+
+    # Template diversi: un invio singolo per email (i lotti sono in test_sendgrid_batch.py)
+    with Session(engine) as session:
+        assert _enqueue(session, "reminder:1:1:60") is not None
+        assert _enqueue(session, "reminder:1:2:60", "reminder_10min.html") is not None
+        assert _enqueue(session, "reminder:1:3:60", "booking_confirmed.html") is not None
+        session.commit()
+        # Stessa chiave: non viene accodata di nuovo
+        assert _enqueue(session, "reminder:1:1:60") is None
+
+    assert email_outbox.drain_email_outbox(batch_size=2) == 1
+    assert len(sent) == 1
+    assert sent[0]["custom_args"] == {"outbox_key": "reminder:1:1:60"}
+
+    with Session(engine) as session:
+        rows = {row.idempotency_key: row for row in session.exec(select(EmailOutbox)).all()}
+    assert rows["reminder:1:1:60"].status == "sent"
+    retry = rows["reminder:1:2:60"]
+    assert retry.status == "pending" and retry.attempts == 1
+    assert retry.next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+    assert rows["reminder:1:3:60"].status == "failed"
+    assert rows["reminder:1:3:60"].claim_token is None
+
+    # Il retry parte quando è scaduto il backoff
+    retry_id = retry.id
+    with Session(engine) as session:
+        retry = session.get(EmailOutbox, retry_id)
+        retry.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        session.add(retry)
+        session.commit()
+    assert email_outbox.drain_email_outbox() == 1
+    with Session(engine) as session:
+        assert session.get(EmailOutbox, retry_id).status == "sent"
+
+
+def test_claims_do_not_overlap_and_expired_claims_return(monkeypatch, engine):
+    _setup(monkeypatch, [])
+    with Session(engine) as session:
+        for n in range(5):
+            _enqueue(session, f"k{n}")
+        session.commit()
+
+    first, _ = email_outbox.claim_emails(3)
+    second, _ = email_outbox.claim_emails(3)
+    assert len(first) == 3 and len(second) == 2
+    assert not {e.id for e in first} & {e.id for e in second}
+    assert email_outbox.claim_emails(3)[0] == []
+
+    # Worker morto durante l'invio: dopo la scadenza del claim l'email torna disponibile
+    with Session(engine) as session:
+        stuck = session.get(EmailOutbox, first[0].id)
+        stuck.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        session.add(stuck)
+        session.commit()
+    reclaimed, _ = email_outbox.claim_emails(3)
+    assert [e.id for e in reclaimed] == [first[0].id]
+    assert reclaimed[0].attempts == 2
+
+
+def test_profile_verification_request_queues_all_verifiers_at_once(monkeypatch, engine, client, add_users):
+    user, = add_users(1)
+    add_users(2, 3, user_type_id=2)
+    add_users(4, user_type_id=3)
+    monkeypatch.setattr(user_profile, "verify_token", lambda request: user)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    response = client.post("/api/profile/update", data={
+        "professione": "Sviluppatore", "category_id": 1, "aree_interesse": "Web", "descrizione": "x" * 200
+    })
+    assert response.status_code == 200
+    # Una sola query sulle chiavi già presenti per tutti i verifier
+    assert len([sql for sql in statements if sql.startswith("SELECT") and "FROM email_outbox" in sql]) == 1
+
+    with Session(engine) as session:
+        rows = session.exec(select(EmailOutbox).order_by(EmailOutbox.id)).all()
+    assert [row.to_email for row in rows] == ["u2@example.com", "u3@example.com", "u4@example.com"]
+    assert {row.template_name for row in rows} == {"profile_verification_request.html"}
@@ -0,0 +1,32 @@
+from app.utils.notification_email import (
+    EMAIL_TEMPLATE_VARIABLES, EMAIL_TEMPLATES, generate_email_html, generate_email_placeholders_html
+)
+
+
+def test_email_templates_render_and_escape():
+    assert set(EMAIL_TEMPLATES) >= {
+        "booking_confirmed.html", "reminder_1h.html", "reminder_10min.html",
+        "community_contact.html", "profile_verification_request.html",
+    }
+
+    html = generate_email_html("community_contact.html", {
+        "author_name": "Mario",
+        "contact_name": "<b>Giulia</b>",
+        "question_title": "Logo",
+        "contact_date": "18/10/2026",
+        "action_url": "http://localhost:8000/community/1?a=1&b=2",
+    })
+    assert "&lt;b&gt;Giulia&lt;/b&gt;" in html
+    assert "a=1&amp;b=2" in html
+    # Le graffe del CSS non sono più raddoppiate
+    assert "{{" not in html and "}}" not in html
+
+    assert generate_email_html("inesistente.html", {}) is None
+
+
+def test_email_placeholders_for_batch_substitutions():
+    for name, variables in EMAIL_TEMPLATE_VARIABLES.items():
+        html = generate_email_placeholders_html(name)
+        for variable in variables:
+            assert f"{{{variable}}}" in html
+    assert generate_email_placeholders_html("inesistente.html") is None
@@ -0,0 +1,157 @@
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, delete
+
+from app.models import Conversation, User
+
+
+@pytest.fixture
+def chat(client, add_users, login):
+    """Utenti 1 e 2; send(sender, testo) invia un messaggio dall'utente indicato all'altro"""
+    users = {user.id: user for user in add_users(1, 2)}
+
+    def send(sender_id: int, content: str) -> int:
+        login(users[sender_id])
+        response = client.post(f"/api/messaggi/{3 - sender_id}", data={"content": content})
+        assert response.status_code == 201
+        return response.json()["message"]["id"]
+
+    def as_user(user_id: int):
+        login(users[user_id])
+
+    return send, as_user
+
+
+def _ids(response):
+    assert response.status_code == 200
+    return [message["id"] for message in response.json()["messages"]]
+
+
+def test_since_id_returns_only_new_messages_and_304_when_unchanged(client, chat):
+    send, as_user = chat
+    ids = [send(1, f"messaggio {n}") for n in range(3)]
+
+    as_user(1)
+    first = client.get(f"/api/messaggi/2?since_id={ids[0]}")
+    assert _ids(first) == ids[1:]
+    assert first.json()["total"] == 3
+    etag = first.headers["ETag"]
+
+    # Nulla è cambiato: 304 senza corpo
+    unchanged = client.get(f"/api/messaggi/2?since_id={ids[0]}", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == etag
+
+    # Nuovo messaggio: ETag diverso, solo il nuovo dopo l'ultimo visto
+    new_id = send(2, "risposta")
+    as_user(1)
+    polled = client.get(f"/api/messaggi/2?since_id={ids[-1]}", headers={"If-None-Match": etag})
+    assert _ids(polled) == [new_id]
+    assert polled.headers["ETag"] != etag
+
+    # Conversazione inesistente: nessuna creazione durante il polling
+    assert client.get("/api/messaggi/99?since_id=0").json()["messages"] == []
+
+
+def test_before_id_pages_backwards(client, chat):
+    send, as_user = chat
+    ids = [send(1, f"messaggio {n}") for n in range(5)]
+
+    as_user(2)
+    latest = client.get("/api/messaggi/1?limit=2")
+    assert _ids(latest) == ids[3:]
+    assert latest.json()["has_more"] is True
+
+    older = client.get(f"/api/messaggi/1?limit=2&before_id={ids[3]}")
+    assert _ids(older) == ids[1:3]
+    assert older.json()["has_more"] is True
+
+    oldest = client.get(f"/api/messaggi/1?limit=2&before_id={ids[1]}")
+    assert _ids(oldest) == ids[:1]
+    assert oldest.json()["has_more"] is False
+
+
+def test_reading_updates_last_read_id_and_etag(client, chat):
+    send, as_user = chat
+    ids = [send(1, "uno"), send(1, "due")]
+
+    as_user(1)
+    before = client.get("/api/messaggi/2")
+    assert before.json()["last_read_id"] is None
+    etag = before.headers["ETag"]
+
+    # Il destinatario apre la chat: i messaggi diventano letti
+    as_user(2)
+    assert [message["is_read"] for message in client.get("/api/messaggi/1").json()["messages"]] == [True, True]
+
+    # Il mittente vede le spunte di lettura: la sua vecchia risposta non è più valida
+    as_user(1)
+    after = client.get("/api/messaggi/2", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.json()["last_read_id"] == ids[-1]
+    assert after.headers["ETag"] != etag
+
+
+def test_deleted_message_lowers_total_for_pollers(client, chat):
+    # chat.html ricarica tutta la conversazione quando data.total < messageCount
+    send, as_user = chat
+    ids = [send(1, "uno"), send(1, "due"), send(1, "tre")]
+
+    as_user(2)
+    loaded = client.get("/api/messaggi/1")
+    assert loaded.json()["total"] == 3
+    etag = client.get(f"/api/messaggi/1?since_id={ids[-1]}").headers["ETag"]
+
+    as_user(1)
+    assert client.delete(f"/api/messaggi/{ids[1]}").json() == {"success": True}
+    assert client.delete(f"/api/messaggi/{ids[0]}").status_code == 200
+
+    as_user(2)
+    polled = client.get(f"/api/messaggi/1?since_id={ids[-1]}", headers={"If-None-Match": etag})
+    assert polled.status_code == 200
+    assert polled.json()["total"] == 1
+    assert _ids(client.get("/api/messaggi/1")) == [ids[2]]
+
+
+def test_conversation_list_in_one_payload(engine, client, add_users, login):
+    users = {user.id: user for user in add_users(1, 2, 4, 5) + add_users(3, cognome="Rossi", professione="Sviluppatore")}
+
+    def send(sender_id: int, receiver_id: int, content: str) -> int:
+        login(users[sender_id])
+        response = client.post(f"/api/messaggi/{receiver_id}", data={"content": content})
+        assert response.status_code == 201
+        return response.json()["message"]["id"]
+
+    send(2, 1, "Ciao")
+    mine = send(1, 2, "Ciao a te")
+    send(4, 1, "Messaggio di un utente che verrà eliminato")
+    send(2, 3, "Conversazione di altri")
+    send(3, 1, "Prima domanda")
+    question = send(3, 1, "Seconda domanda")
+    with Session(engine) as session:
+        session.add(Conversation(user1_id=5, user2_id=1, updated_at=datetime(2000, 1, 1)))
+        session.exec(delete(User).where(User.id == 4))
+        session.commit()
+
+    login(users[1])
+    response = client.get("/api/conversations")
+    assert response.status_code == 200
+    conversations = response.json()["conversations"]
+
+    # Più recente prima; la conversazione con l'utente eliminato e quelle altrui non compaiono
+    assert [c["other_user"]["id"] for c in conversations] == [3, 2, 5]
+    latest, replied, empty = conversations
+    assert latest["other_user"] == {"id": 3, "nome": "Nome3", "cognome": "Rossi", "profile_picture": None,
+                                    "professione": "Sviluppatore"}
+    assert latest["last_message"] == {"id": question, "content": "Seconda domanda",
+                                      "created_at": latest["last_message"]["created_at"],
+                                      "is_mine": False, "is_sender": False}
+    assert latest["unread_count"] == 2
+    assert replied["last_message"]["id"] == mine
+    assert (replied["last_message"]["is_mine"], replied["unread_count"]) == (True, 1)
+    assert empty["other_user"] == {"id": 5, "nome": "Nome5", "cognome": "", "profile_picture": None, "professione": ""}
+    assert (empty["last_message"], empty["unread_count"]) == (None, 0)
+
+    login(None)
+    assert client.get("/api/conversations").status_code == 401
@@ -0,0 +1,39 @@
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.models import NotificationType
+from app.utils import notification_type_registry as registry_module
+from app.utils import notification_service
+from app.utils.notification_type_registry import NotificationTypeRegistry
+
+
+def test_send_notification_reads_type_from_registry(monkeypatch, engine, add_users):
+
+    registry = NotificationTypeRegistry()
+    monkeypatch.setattr(registry_module, "notification_type_registry", registry)
+    monkeypatch.setattr(notification_service, "notification_type_registry", registry)
+
+    add_users(1)
+    with Session(engine) as session:
+        session.add(NotificationType(type_key="new_message", name="Nuovo messaggio", in_app=True))
+        session.commit()
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    assert notification_service.send_notification(1, "new_message", "Titolo", "Testo")
+    queries.clear()
+    assert notification_service.send_notification(1, "new_message", "Titolo", "Testo")
+    assert not any("notification_types" in sql for sql in queries)
+
+    # Tipo sconosciuto: nessuna notifica
+    assert not notification_service.send_notification(1, "inesistente", "Titolo", "Testo")
+
+    # Disattivato via ORM: il registro si invalida al commit
+    with Session(engine) as session:
+        notification_type = session.get(NotificationType, 1)
+        notification_type.is_active = False
+        session.add(notification_type)
+        session.commit()
+    assert registry.get("new_message").is_active is False
+    assert not notification_service.send_notification(1, "new_message", "Titolo", "Testo")
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app import scheduler
+from app.models import Booking, EmailOutbox, Notification, NotificationType
+from app.utils import notification_service
+from app.utils.notification_service import NotificationItem, notify_many
+from app.utils.notification_type_registry import NotificationTypeRegistry
+
+
+def _setup(monkeypatch, engine, add_users):
+    registry = NotificationTypeRegistry()
+    monkeypatch.setattr(registry, "load", lambda: None)
+    monkeypatch.setattr(notification_service, "notification_type_registry", registry)
+    registry._loaded_at = float("inf")
+
+    pushed = []
+    monkeypatch.setattr(notification_service, "publish_to_user", lambda user_id, *args, **kwargs: pushed.append(user_id))
+
+    add_users(*range(1, 7))
+    with Session(engine) as session:
+        for key, template in (("reminder_1h", "reminder_1h.html"), ("reminder_10min", "reminder_10min.html")):
+            notification_type = NotificationType(
+                type_key=key, name="Promemoria", in_app=True, send_email=True, email_template=template
+            )
+            session.add(notification_type)
+            registry._by_key[key] = notification_type
+        session.commit()
+        for notification_type in registry._by_key.values():
+            session.refresh(notification_type)
+            session.expunge(notification_type)
+    return pushed
+
+
+def test_notify_many_uses_one_transaction(monkeypatch, engine, add_users):
+    pushed = _setup(monkeypatch, engine, add_users)
+
+    statements, commits = [], []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    event.listen(engine, "commit", lambda *args: commits.append(1))
+
+    items = [
+        NotificationItem(user_id=user_id, message=f"Messaggio {user_id}", email_idempotency_key=f"k{user_id}")
+        for user_id in (1, 2, 3, 99)
+    ]
+    assert notify_many("reminder_1h", items) == 3
+    assert len(commits) == 1
+    assert len([sql for sql in statements if sql.startswith("INSERT INTO notifications")]) == 1
+    assert pushed == [1, 2, 3]
+
+    with Session(engine) as session:
+        notifications = session.exec(select(Notification).order_by(Notification.id)).all()
+        assert [(n.user_id, n.title, n.message) for n in notifications] == [
+            (1, "Promemoria", "Messaggio 1"), (2, "Promemoria", "Messaggio 2"), (3, "Promemoria", "Messaggio 3")
+        ]
+        emails = session.exec(select(EmailOutbox).order_by(EmailOutbox.id)).all()
+        assert [(e.idempotency_key, e.to_email, e.notification_id) for e in emails] == [
+            ("k1", "u1@example.com", notifications[0].id),
+            ("k2", "u2@example.com", notifications[1].id),
+            ("k3", "u3@example.com", notifications[2].id),
+        ]
+
+    # Stesse chiavi: nessuna email nuova, le notifiche in-app sì
+    assert notify_many("reminder_1h", items) == 3
+    with Session(engine) as session:
+        assert len(session.exec(select(EmailOutbox)).all()) == 3
+
+    assert notify_many("inesistente", items) == 0
+    assert notify_many("reminder_1h", []) == 0
+
+
+def test_slot_reminders_notify_every_participant_at_once(monkeypatch, engine, add_users):
+    pushed = _setup(monkeypatch, engine, add_users)
+    starts_at = datetime(2026, 10, 18, 15, 0)
+
+    with Session(engine) as session:
+        for client_id, consultant_id, status in ((1, 2, "confirmed"), (3, 4, "pending"), (5, 6, "cancelled")):
+            session.add(Booking(
+                client_user_id=client_id, consultant_user_id=consultant_id, booking_date=starts_at,
+                start_time="15:00", end_time="15:30", duration_minutes=30, status=status
+            ))
+        session.commit()
+
+    commits = []
+    event.listen(engine, "commit", lambda *args: commits.append(1))
+    scheduler.send_booking_reminders(starts_at, 10)
+
+    assert len(commits) == 1
+    assert sorted(pushed) == [1, 2, 3, 4]
+    with Session(engine) as session:
+        keys = sorted(email.idempotency_key for email in session.exec(select(EmailOutbox)).all())
+        assert keys == ["reminder:1:1:10", "reminder:1:2:10", "reminder:2:3:10", "reminder:2:4:10"]
+        notification = session.exec(select(Notification).where(Notification.user_id == 2)).one()
+        assert notification.type == "reminder_10min"
+        assert "Nome1" in notification.message
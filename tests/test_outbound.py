@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils import agora_recording
+from app.utils.outbound import OutboundExecutor, OutboundTimeoutError, ProviderLimit
+
+
+def _executor(concurrency=2, timeout=0.5):
+    return OutboundExecutor(max_workers=8, limits={"slow": ProviderLimit("slow", concurrency, timeout)})
+
+
+def test_call_limits_concurrency_per_provider():
+    executor = _executor(concurrency=2, timeout=2)
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return "ok"
+
+    callers = [threading.Thread(target=executor.call, args=("slow", work)) for _ in range(6)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+
+    assert peak == 2
+    executor.shutdown()
+
+
+def test_call_times_out_and_frees_slot_when_call_ends():
+    executor = _executor(concurrency=1, timeout=0.1)
+    release = threading.Event()
+
+    with pytest.raises(OutboundTimeoutError):
+        executor.call("slow", release.wait)
+    # La chiamata appesa occupa ancora l'unico posto del provider
+    with pytest.raises(OutboundTimeoutError):
+        executor.call("slow", lambda: None)
+
+    release.set()
+    time.sleep(0.05)
+    assert executor.call("slow", lambda: 42) == 42
+    executor.shutdown()
+
+
+def test_call_async_does_not_block_event_loop():
+    executor = _executor(concurrency=1, timeout=1)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        result = await executor.call_async("slow", lambda: time.sleep(0.2) or "done")
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == "done"
+    assert ticks >= 10
+    executor.shutdown()
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        _executor().call("nope", lambda: None)
+
+
+def test_presigned_url_is_signed_locally_without_the_pool(monkeypatch):
+    def saturated(*args, **kwargs):
+        raise OutboundTimeoutError("pool saturo")
+
+    monkeypatch.setattr(agora_recording.outbound, "call", saturated)
+    monkeypatch.setattr(agora_recording, "AWS_S3_BUCKET_NAME", "helpy-recordings")
+    monkeypatch.setattr(agora_recording, "AWS_S3_REGION", "eu-south-1")
+    monkeypatch.setattr(agora_recording, "AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setattr(agora_recording, "AWS_SECRET_ACCESS_KEY", "secret")
+    agora_recording.get_s3_client.cache_clear()
+    try:
+        url = agora_recording.get_recording_url("recordings/call.mp4")
+    finally:
+        agora_recording.get_s3_client.cache_clear()
+
+    assert "helpy-recordings" in url and "recordings/call.mp4" in url
+    assert "Signature=" in url or "X-Amz-Signature=" in url
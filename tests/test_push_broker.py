@@ -0,0 +1,190 @@
+"""
+Consegna degli eventi push tra due istanze dell'app.
+
+Il test avvia due processi uvicorn sullo stesso PostgreSQL locale, apre il
+WebSocket del destinatario sull'istanza A, invia messaggi dall'istanza B e
+misura la latenza di consegna. Serve un database di prova:
+
+    PUSH_TEST_DATABASE_URL=postgresql://postgres@localhost/helpy_test pytest -s tests/test_push_broker.py
+"""
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+from app.utils.push_broker import InMemoryBroker, PostgresBroker
+from app.utils.push_hub import PushHub
+
+PUSH_TEST_DATABASE_URL = os.getenv("PUSH_TEST_DATABASE_URL")
+SESSION_SECRET = "push-broker-test-secret"
+ROOT = Path(__file__).resolve().parent.parent
+
+# Latenza massima accettata per un evento tra due istanze
+MAX_LATENCY_SECONDS = 1.0
+
+
+def test_in_memory_broker_delivers_to_local_hub():
+    hub = PushHub(InMemoryBroker())
+    delivered = []
+    hub.deliver = lambda user_id, event: delivered.append((user_id, event))
+
+    hub.publish(3, {"type": "notification"})
+
+    assert delivered == [(3, {"type": "notification"})]
+
+
+class SlowEngine:
+    """Engine finto: registra il thread di ogni transazione e resta bloccato finché non viene sbloccato"""
+
+    def __init__(self):
+        self.threads = []
+        self.payloads = []
+        self.release = threading.Event()
+        self.sent = threading.Event()
+
+    @contextmanager
+    def begin(self):
+        self.threads.append(threading.get_ident())
+        self.release.wait(5)
+        yield self
+
+    def execute(self, statement, parameters):
+        self.payloads.extend(json.loads(row["payload"]) for row in parameters)
+        self.sent.set()
+
+
+def test_postgres_broker_publishes_off_the_calling_thread():
+    engine = SlowEngine()
+    broker = PostgresBroker(engine)
+    broker._listen_loop = lambda: None
+    hub = PushHub(broker)
+    delivered = []
+    hub.deliver = lambda user_id, event: delivered.append((user_id, event))
+    try:
+        started = time.monotonic()
+        hub.publish(3, {"type": "notification"})
+        hub.publish(4, {"type": "message"})
+        # Consegna locale subito, nessuna attesa del database
+        assert time.monotonic() - started < 0.5
+        assert delivered == [(3, {"type": "notification"}), (4, {"type": "message"})]
+
+        engine.release.set()
+        assert engine.sent.wait(5)
+        broker.stop()
+        assert threading.get_ident() not in engine.threads
+        assert [(payload["u"], payload["e"]["type"]) for payload in engine.payloads] == [(3, "notification"), (4, "message")]
+    finally:
+        engine.release.set()
+        broker.stop()
+
+
+# ========== DUE ISTANZE SU POSTGRESQL ==========
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _session_cookie(user_id: int) -> str:
+    itsdangerous = pytest.importorskip("itsdangerous")
+    signer = itsdangerous.TimestampSigner(SESSION_SECRET)
+    return signer.sign(base64.b64encode(json.dumps({"user_id": user_id}).encode())).decode()
+
+
+def _start_instance(port: int):
+    env = dict(
+        os.environ,
+        DATABASE_URL=PUSH_TEST_DATABASE_URL,
+        PUSH_BROKER="postgres",
+        SESSION_SECRET=SESSION_SECRET,
+        LOG_LEVEL="WARNING",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def _wait_ready(httpx, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/static/push.js").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Instance on port {port} did not start")
+
+
+def _create_users(count: int):
+    from sqlmodel import SQLModel, Session, create_engine
+    from app.models import User
+
+    engine = create_engine(PUSH_TEST_DATABASE_URL)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        users = [
+            User(email=f"push-{uuid.uuid4().hex}@example.com", password_md5="x", nome=f"Push{i}", confirmed=1)
+            for i in range(count)
+        ]
+        session.add_all(users)
+        session.commit()
+        ids = [user.id for user in users]
+    engine.dispose()
+    return ids
+
+
+@pytest.mark.skipif(not PUSH_TEST_DATABASE_URL, reason="PUSH_TEST_DATABASE_URL non impostato")
+def test_events_cross_instances_via_postgres():
+    httpx = pytest.importorskip("httpx")
+    ws_client = pytest.importorskip("websockets.sync.client")
+
+    sender_id, recipient_id = _create_users(2)
+    port_a, port_b = _free_port(), _free_port()
+    instances = []
+    try:
+        # Una alla volta: all'avvio entrambe creano tabelle e indici
+        for port in (port_a, port_b):
+            instances.append(_start_instance(port))
+            _wait_ready(httpx, port)
+
+        sender = httpx.Client(base_url=f"http://127.0.0.1:{port_b}", cookies={"session": _session_cookie(sender_id)})
+        latencies = []
+        with ws_client.connect(
+            f"ws://127.0.0.1:{port_a}/ws",
+            additional_headers={"Cookie": f"session={_session_cookie(recipient_id)}"},
+        ) as websocket:
+            for i in range(20):
+                # Latenza misurata dall'invio della POST: include anche la richiesta HTTP
+                sent_at = time.monotonic()
+                response = sender.post(f"/api/messaggi/{recipient_id}", data={"content": f"ping {i}"})
+                assert response.status_code == 201
+                message_id = response.json()["message"]["id"]
+
+                while True:
+                    event = json.loads(websocket.recv(timeout=MAX_LATENCY_SECONDS * 5))
+                    if event["type"] == "message" and event["message_id"] == message_id:
+                        break
+                latencies.append(time.monotonic() - sent_at)
+                assert event["from_user_id"] == sender_id
+
+        p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+        print(f"\ncross-instance push latency: median {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+        assert p95 < MAX_LATENCY_SECONDS
+    finally:
+        for process in instances:
+            process.terminate()
+        for process in instances:
+            process.wait(timeout=10)
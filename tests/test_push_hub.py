@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from fastapi import WebSocketDisconnect
+
+from app.routes import push as push_route
+from app.utils import push_hub as push_module
+from app.utils.push_hub import PushHub
+
+
+def test_hub_delivers_from_loop_and_threads_and_resyncs_slow_clients(monkeypatch):
+    monkeypatch.setattr(push_module, "MAX_QUEUED_EVENTS", 3)
+    hub = PushHub()
+
+    async def scenario():
+        queue = hub.subscribe(7)
+        other = hub.subscribe(8)
+        assert hub.is_connected(7)
+
+        # Dal thread dell'event loop (route async)
+        hub.publish(7, {"type": "message", "message_id": 1})
+        assert queue.get_nowait() == {"type": "message", "message_id": 1}
+        assert other.empty()
+
+        # Da un altro thread (route sync, scheduler)
+        worker = threading.Thread(target=hub.publish, args=(7, {"type": "notification"}))
+        worker.start()
+        worker.join()
+        assert await asyncio.wait_for(queue.get(), timeout=1) == {"type": "notification"}
+
+        # Coda piena: il client riceve solo la richiesta di risincronizzazione
+        for message_id in range(4):
+            hub.publish(7, {"type": "message", "message_id": message_id})
+        assert queue.get_nowait() == {"type": "resync"}
+        assert queue.empty()
+
+        hub.unsubscribe(7, queue)
+        assert not hub.is_connected(7)
+        hub.publish(7, {"type": "message"})  # Nessun iscritto: ignorato
+
+    asyncio.run(scenario())
+
+
+class FakeSocket:
+    """WebSocket finto: il primo messaggio del client arriva quando il test lo decide, poi la chiusura"""
+
+    def __init__(self):
+        self.sent = []
+        self.client_message = asyncio.Event()
+        self.client_closed = asyncio.Event()
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code):
+        self.sent.append({"closed": code})
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def receive_text(self):
+        self.received += 1
+        if self.received == 1:
+            await self.client_message.wait()
+            return "hello"
+        await self.client_closed.wait()
+        raise WebSocketDisconnect()
+
+
+def test_socket_authenticates_off_the_loop_and_keeps_events_arriving_with_client_messages(monkeypatch):
+    threads = []
+
+    def verify_token(websocket):
+        try:
+            asyncio.get_running_loop()
+            threads.append("event loop")
+        except RuntimeError:
+            threads.append("threadpool")
+        return SimpleNamespace(id=7)
+
+    monkeypatch.setattr(push_route, "verify_token", verify_token)
+
+    async def scenario():
+        websocket = FakeSocket()
+        task = asyncio.create_task(push_route.push_socket(websocket))
+        while not push_module.push_hub.is_connected(7):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+
+        # Evento e messaggio del client completano nello stesso giro di asyncio.wait
+        push_module.push_hub.publish(7, {"type": "message", "message_id": 1})
+        websocket.client_message.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert websocket.sent == [{"type": "message", "message_id": 1}]
+
+        websocket.client_closed.set()
+        await asyncio.wait_for(task, timeout=1)
+        assert not push_module.push_hub.is_connected(7)
+
+    asyncio.run(scenario())
+    assert threads == ["threadpool"]
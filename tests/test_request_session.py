@@ -0,0 +1,122 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.database import RequestSessionMiddleware, get_session
+from app.models import Category
+
+app = FastAPI()
+app.add_middleware(RequestSessionMiddleware)
+
+
+def _add(session, name: str):
+    session.add(Category(name=name, slug=name))
+
+
+def _helper(name: str, commit: bool = True, fail: bool = False):
+    """Come notify_many: apre la propria get_session() e fa commit"""
+    with get_session() as session:
+        _add(session, name)
+        if commit:
+            session.commit()
+        if fail:
+            raise ValueError("helper fallito")
+
+
+@app.post("/helper-error")
+def helper_error():
+    with get_session() as session:
+        _add(session, "route")
+        try:
+            _helper("helper", commit=False, fail=True)
+        except ValueError:
+            pass
+        session.commit()
+    return {}
+
+
+@app.post("/route-error-after-helper-commit")
+def route_error_after_helper_commit():
+    with get_session() as session:
+        _add(session, "route")
+        _helper("helper")
+        raise HTTPException(status_code=400, detail="errore dopo l'helper")
+
+
+@app.post("/helper-commit-only")
+def helper_commit_only():
+    with get_session() as session:
+        session.exec(select(Category)).all()
+        _helper("helper")
+        _helper("discarded", commit=False)
+    return {}
+
+
+@app.post("/route-without-commit")
+def route_without_commit():
+    with get_session() as session:
+        _add(session, "route")
+        _helper("helper")
+    return {}
+
+
+@app.post("/sees-pending")
+def sees_pending():
+    with get_session() as session:
+        _add(session, "route")
+        with get_session() as nested:
+            names = [category.name for category in nested.exec(select(Category)).all()]
+        session.commit()
+    return {"names": names}
+
+
+@pytest.fixture
+def request_client(engine):
+    return TestClient(app)
+
+
+def _names(engine):
+    with Session(engine) as session:
+        return sorted(category.name for category in session.exec(select(Category)).all())
+
+
+def test_helper_error_keeps_route_writes(engine, request_client):
+    assert request_client.post("/helper-error").status_code == 200
+    assert _names(engine) == ["route"]
+
+
+def test_helper_commit_does_not_commit_failed_route(engine, request_client):
+    assert request_client.post("/route-error-after-helper-commit").status_code == 400
+    assert _names(engine) == []
+
+
+def test_helper_commit_is_kept_when_route_does_not_commit(engine, request_client):
+    assert request_client.post("/helper-commit-only").status_code == 200
+    assert _names(engine) == ["helper"]
+
+
+def test_route_without_commit_is_not_persisted_by_helper_commit(engine, request_client):
+    # Senza commit la route scarta il proprio lavoro; l'helper è nella stessa transazione
+    assert request_client.post("/route-without-commit").status_code == 200
+    assert _names(engine) == []
+
+
+def test_nested_blocks_share_one_connection(engine, request_client):
+    checkouts = []
+    event.listen(engine, "checkout", lambda *args: checkouts.append(1))
+
+    response = request_client.post("/sees-pending")
+    assert response.json() == {"names": ["route"]}
+    assert len(checkouts) == 1
+
+
+def test_sessions_outside_requests_are_independent(engine):
+    with get_session() as outer:
+        _add(outer, "outer")
+        with get_session() as inner:
+            assert inner is not outer
+            _add(inner, "inner")
+            inner.commit()
+    assert _names(engine) == ["inner"]
@@ -0,0 +1,34 @@
+from sqlmodel import Session
+
+from app.models import User, CommunityQuestion
+from app.utils.search_backend import SQLiteSearchBackend
+
+
+def test_sqlite_fts_backend(engine):
+
+    with Session(engine) as session:
+        session.add(User(id=1, email="a@x.it", password_md5="x", nome="Anna", professione="Graphic designer",
+                         descrizione="Loghi e branding", category_id=1, bollini=1))
+        session.add(User(id=2, email="b@x.it", password_md5="x", nome="Bruno", professione="Sviluppatore web",
+                         descrizione="Siti WordPress", category_id=2, prezzo_consulenza=50))
+        session.add(CommunityQuestion(id=1, user_id=1, title="Sito lento", description="WordPress molto lento"))
+        session.commit()
+
+    backend = SQLiteSearchBackend()
+    backend.setup()
+
+    # Prefisso + OR sulle keyword espanse, ranking bm25
+    assert backend.search_users(["design"], ["design", "wordpress"]) == ([1, 2], 2)
+    assert backend.search_users(["design"], ["design", "wordpress"], category=2) == ([2], 1)
+
+    # I trigger mantengono la tabella FTS allineata
+    with Session(engine) as session:
+        user = session.get(User, 2)
+        user.descrizione = "App mobile"
+        session.add(user)
+        session.commit()
+    assert backend.search_users(["wordpress"], ["wordpress"]) == ([], 0)
+
+    # Domande: AND tra le keyword
+    assert backend.search_questions(["sito", "wordpress"]) == ([1], 1)
+    assert backend.search_questions(["sito", "react"]) == ([], 0)
@@ -0,0 +1,74 @@
+from app.models import User
+from app.routes.consultants import calculate_relevance_score, clean_search_query, expand_with_skills
+from app.utils.keyword_matcher import KeywordMatcher
+from app.utils.search_index import IndexedUser, SearchIndex
+
+
+def make_users():
+    return [
+        User(id=1, email="a@x.it", password_md5="x", nome="Anna", professione="Graphic designer",
+             descrizione="Loghi e branding con Illustrator", bollini=2),
+        User(id=2, email="b@x.it", password_md5="x", nome="Bruno", professione="Sviluppatore web",
+             descrizione="Siti in WordPress e React", aree_interesse="sito,web", prezzo_consulenza=50),
+        User(id=3, email="c@x.it", password_md5="x", nome="Carla", professione="Video maker",
+             descrizione="Montaggio con After Effects", consulenze_vendute=4),
+        User(id=4, email="d@x.it", password_md5="x", nome="Dario", professione="Commercialista"),
+    ]
+
+
+def brute_force(users, search):
+    keywords = clean_search_query(search)
+    expanded = expand_with_skills(keywords)
+    matches = [u for u in users if any(k in calculate_relevance_text(u) for k in expanded)]
+    matches.sort(key=lambda u: calculate_relevance_score(u, keywords, expanded), reverse=True)
+    return [u.id for u in matches]
+
+
+def calculate_relevance_text(user):
+    return ' '.join(filter(None, [user.nome, user.cognome, user.professione, user.descrizione, user.aree_interesse])).lower()
+
+
+def test_search_matches_brute_force_scoring():
+    users = make_users()
+    index = SearchIndex()
+    index.build(users=users)
+
+    for search in ["logo", "sito web", "video", "design", "commercialista", "nessunmatch"]:
+        keywords = clean_search_query(search)
+        expanded = expand_with_skills(keywords)
+        ids, total = index.search(keywords, expanded, score_fn=calculate_relevance_score, limit=12)
+        expected = brute_force(users, search)
+        assert ids == expected
+        assert total == len(expected)
+
+
+def test_search_filters_and_incremental_update():
+    users = make_users()
+    index = SearchIndex()
+    index.build(users=users)
+    keywords = clean_search_query("sito")
+    expanded = expand_with_skills(keywords)
+
+    ids, _ = index.search(keywords, expanded, score_fn=calculate_relevance_score, min_price=40)
+    assert ids == [2]
+
+    users[3].descrizione = "Aiuto con il sito della tua attività"
+    index.update_user(users[3])
+    ids, total = index.search(keywords, expanded, score_fn=calculate_relevance_score)
+    assert set(ids) == {2, 4}
+    assert total == 2
+
+    ids, total = index.search(keywords, expanded, score_fn=calculate_relevance_score, offset=1, limit=1)
+    assert len(ids) == 1 and total == 2
+
+
+def test_keyword_matcher_matches_relevance_score():
+    users = make_users()
+    indexed = [IndexedUser(user) for user in users]
+    for search in ["logo", "sito web", "after effects montaggio", "designer", "commercialista fisco"]:
+        keywords = clean_search_query(search)
+        expanded = expand_with_skills(keywords)
+        matcher = KeywordMatcher(keywords, expanded)
+        expected = [calculate_relevance_score(user, keywords, expanded) for user in users]
+        assert [matcher.score(doc) for doc in indexed] == expected
+        assert [matcher.score(user) for user in users] == expected
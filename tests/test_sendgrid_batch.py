@@ -0,0 +1,122 @@
+"""
+Invii a lotti verso un server SendGrid finto (HTTP locale): conta le richieste,
+le connessioni e controlla le personalizations.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlmodel import Session, select
+
+from app.models import EmailOutbox
+from app.utils import email as email_module
+from app.utils import email_outbox, notification_email
+from app.utils.notification_email import EmailRecipient, send_batch_emails
+
+
+class StandInSendGrid(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.requests = []
+        self.connections = set()
+        self.statuses = []  # Risposte programmate, poi 202
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, come l'API vera
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append({"path": self.path, "auth": self.headers["Authorization"], "body": body})
+        self.server.connections.add(self.client_address)
+        status = self.server.statuses.pop(0) if self.server.statuses else 202
+        payload = b"" if status == 202 else b'{"errors": [{"message": "bad request"}]}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sendgrid_server(monkeypatch):
+    server = StandInSendGrid()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    email_module.close_sendgrid_client()
+    monkeypatch.setattr(email_module, "SENDGRID_API_HOST", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("SENDGRID_API_KEY", "test-key")
+    yield server
+    email_module.close_sendgrid_client()
+    server.shutdown()
+    server.server_close()
+
+
+def _recipient(n):
+    return EmailRecipient(f"u{n}@example.com", f"Utente {n}", "Promemoria", {"user_name": f"Utente {n}", "time": "10:00"})
+
+
+def test_batch_groups_recipients_up_to_provider_limit(sendgrid_server, monkeypatch):
+    monkeypatch.setattr(notification_email, "SENDGRID_MAX_PERSONALIZATIONS", 2)
+
+    requests_made = send_batch_emails("test-key", "reminder_1h.html", [_recipient(n) for n in range(5)])
+
+    assert requests_made == 3
+    assert [len(r["body"]["personalizations"]) for r in sendgrid_server.requests] == [2, 2, 1]
+    # Un solo client HTTP per processo: le richieste riusano la stessa connessione
+    assert len(sendgrid_server.connections) == 1
+
+    first = sendgrid_server.requests[0]
+    assert first["path"] == "/v3/mail/send"
+    assert first["auth"] == "Bearer test-key"
+    assert first["body"]["personalizations"][1]["substitutions"]["{user_name}"] == "Utente 1"
+    # Il contenuto è condiviso: i segnaposto restano da sostituire per ogni destinatario
+    assert "{user_name}" in first["body"]["content"][0]["value"]
+
+
+def test_batch_fills_missing_variables_with_empty_strings(sendgrid_server):
+    partial = EmailRecipient("u@example.com", None, "Promemoria", {"user_name": "Mario"})
+
+    send_batch_emails("test-key", "reminder_1h.html", [partial])
+
+    request = sendgrid_server.requests[0]["body"]
+    substitutions = request["personalizations"][0]["substitutions"]
+    placeholders = {f"{{{name}}}" for name in notification_email.EMAIL_TEMPLATE_VARIABLES["reminder_1h.html"]}
+    # Nessun {variabile} letterale nell'email consegnata, come nel rendering singolo
+    assert set(substitutions) == placeholders
+    assert substitutions["{user_name}"] == "Mario"
+    assert {value for key, value in substitutions.items() if key != "{user_name}"} == {""}
+    delivered = request["content"][0]["value"]
+    for placeholder, value in substitutions.items():
+        delivered = delivered.replace(placeholder, value)
+    assert delivered == notification_email.generate_email_html("reminder_1h.html", {"user_name": "Mario"})
+
+
+def test_outbox_drain_sends_one_request_per_template(sendgrid_server, engine):
+    with Session(engine) as session:
+        for n in range(4):
+            email_outbox.enqueue_email(session, f"u{n}@example.com", None, "Promemoria", "reminder_1h.html", {"time": "10:00"})
+        email_outbox.enqueue_email(session, "a@example.com", None, "Contatto", "community_contact.html", {"contact_name": "Mario"})
+        session.commit()
+
+    assert email_outbox.drain_email_outbox() == 5
+    assert sorted(len(r["body"]["personalizations"]) for r in sendgrid_server.requests) == [1, 4]
+
+    # Lotto rifiutato (es. un indirizzo non valido): si riprova uno per uno
+    with Session(engine) as session:
+        for n in range(3):
+            email_outbox.enqueue_email(session, f"v{n}@example.com", None, "Promemoria", "reminder_10min.html", {}, idempotency_key=f"v{n}")
+        session.commit()
+    sendgrid_server.requests.clear()
+    sendgrid_server.statuses[:] = [400, 202, 400, 202]
+
+    assert email_outbox.drain_email_outbox() == 2
+    assert len(sendgrid_server.requests) == 4
+    with Session(engine) as session:
+        status = {row.idempotency_key: row.status for row in session.exec(select(EmailOutbox)).all()}
+    assert [status["v0"], status["v1"], status["v2"]] == ["sent", "failed", "sent"]
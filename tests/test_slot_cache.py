@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.models import AvailabilityBlock, Booking
+from app.utils.slot_cache import SlotCache
+
+
+def _starts(client, date_str: str, duration: int = 60):
+    response = client.get(f"/api/booking/available-slots/1?date={date_str}&duration={duration}")
+    assert response.status_code == 200
+    return [slot["start_time"] for slot in response.json()["slots"]]
+
+
+def test_cached_slots_follow_block_and_booking_writes(engine, client, add_users):
+    add_users(1, 2)
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=10)
+    date_str = day.strftime('%Y-%m-%d')
+    with Session(engine) as session:
+        block = AvailabilityBlock(user_id=1, date=day, start_time="09:00", end_time="11:00", total_minutes=120)
+        session.add(block)
+        session.commit()
+        block_id = block.id
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    assert _starts(client, date_str) == ["09:00", "09:30", "10:00"]
+    cold = len(queries)
+    # In cache: solo la query del consulente
+    assert _starts(client, date_str) == ["09:00", "09:30", "10:00"]
+    assert len(queries) == cold + 1
+
+    # Nuova prenotazione: il giorno viene ricalcolato
+    with Session(engine) as session:
+        session.add(Booking(client_user_id=2, consultant_user_id=1, booking_date=day + timedelta(hours=9),
+                            start_time="09:00", end_time="09:30", duration_minutes=30, status="confirmed"))
+        session.commit()
+    assert _starts(client, date_str) == ["09:30", "10:00"]
+
+    # Cancellazione
+    with Session(engine) as session:
+        booking = session.query(Booking).one()
+        booking.status = "cancelled"
+        session.add(booking)
+        session.commit()
+    assert _starts(client, date_str) == ["09:00", "09:30", "10:00"]
+
+    # Blocco spostato a un altro giorno: cambiano sia il vecchio sia il nuovo
+    other_str = (day + timedelta(days=1)).strftime('%Y-%m-%d')
+    assert _starts(client, other_str) == []
+    with Session(engine) as session:
+        block = session.get(AvailabilityBlock, block_id)
+        block.date = day + timedelta(days=1)
+        session.add(block)
+        session.commit()
+    assert _starts(client, date_str) == []
+    assert _starts(client, other_str) == ["09:00", "09:30", "10:00"]
+
+    # Eliminazione
+    with Session(engine) as session:
+        session.delete(session.get(AvailabilityBlock, block_id))
+        session.commit()
+    assert _starts(client, other_str) == []
+
+
+def test_today_cutoff_applied_at_read_time():
+    cache = SlotCache()
+    day = datetime(2030, 1, 7)
+    block = AvailabilityBlock(id=1, user_id=1, date=day, start_time="09:00", end_time="12:00", total_minutes=180)
+    entry = cache.put(1, day, [block], [], cache.version())
+
+    assert [slot["start_time"] for slot in entry.slots_for((60,), datetime(2030, 1, 6, 23, 0))[60]] == [
+        "09:00", "09:30", "10:00", "10:30", "11:00"
+    ]
+    # Stesso giorno alle 10:07: dalle 10:30 in poi
+    assert [slot["start_time"] for slot in entry.slots_for((60,), datetime(2030, 1, 7, 10, 7))[60]] == ["10:30", "11:00"]
+    # La cache non è stata toccata
+    assert cache.get(1, "2030-01-07").slots[60][0]["start_time"] == "09:00"
+
+
+def test_put_after_invalidation_is_not_cached():
+    cache = SlotCache()
+    version = cache.version()
+    cache.invalidate(1, "2030-01-07")
+    cache.put(1, "2030-01-07", [], [], version)
+    assert cache.get(1, "2030-01-07") is None
+
+    cache.put(1, "2030-01-07", [], [], cache.version())
+    cache.put(2, "2030-01-07", [], [], cache.version())
+    cache.invalidate_consultant(1)
+    assert cache.get(1, "2030-01-07") is None
+    assert cache.get(2, "2030-01-07") is not None
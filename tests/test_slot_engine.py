@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+from hypothesis import given, settings, strategies as st
+
+from app.models import AvailabilityBlock, Booking
+from app.utils.slot_engine import (
+    SLOT_DURATIONS, available_slots_by_duration, minutes_to_time, parse_time_to_minutes
+)
+
+DATE = datetime(2026, 11, 2)
+DATE_STR = DATE.strftime('%Y-%m-%d')
+
+
+def legacy_available_slots(availability_blocks, existing_bookings, duration_minutes, date_str, now):
+    """calculate_available_slots prima del motore a bitmap (riferimento per i test)"""
+    available_slots = []
+    today = now.date()
+    target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    current_time_minutes = None
+    if target_date == today:
+        current_time_minutes = now.hour * 60 + now.minute
+
+    for block in availability_blocks:
+        block_start = parse_time_to_minutes(block.start_time)
+        block_end = parse_time_to_minutes(block.end_time)
+        if current_time_minutes is not None:
+            min_start_time = current_time_minutes + 5
+            if block_end <= min_start_time:
+                continue
+            if block_start < min_start_time:
+                block_start = ((min_start_time + 29) // 30) * 30
+
+        occupied_intervals = []
+        for booking in existing_bookings:
+            if booking.availability_block_id == block.id or (
+                booking.booking_date.strftime('%Y-%m-%d') == date_str and
+                booking.status not in ['cancelled', 'no_show']
+            ):
+                occupied_intervals.append((parse_time_to_minutes(booking.start_time), parse_time_to_minutes(booking.end_time)))
+        occupied_intervals.sort()
+
+        current_time = block_start
+        for occupied_start, occupied_end in occupied_intervals:
+            while current_time + duration_minutes <= occupied_start:
+                available_slots.append({
+                    'start_time': minutes_to_time(current_time),
+                    'end_time': minutes_to_time(current_time + duration_minutes),
+                    'availability_block_id': block.id
+                })
+                current_time += 30
+            current_time = max(current_time, occupied_end)
+
+        while current_time + duration_minutes <= block_end:
+            available_slots.append({
+                'start_time': minutes_to_time(current_time),
+                'end_time': minutes_to_time(current_time + duration_minutes),
+                'availability_block_id': block.id
+            })
+            current_time += 30
+
+    return available_slots
+
+
+def inside_block(slots, blocks):
+    """Il riferimento propone anche slot oltre la fine del blocco se c'è una prenotazione dopo"""
+    ends = {block.id: parse_time_to_minutes(block.end_time) for block in blocks}
+    return [slot for slot in slots if parse_time_to_minutes(slot['end_time']) <= ends[slot['availability_block_id']]]
+
+
+# Orari al minuto, o su una griglia di 15 minuti come quelli reali
+minutes = st.one_of(st.integers(0, 24 * 60), st.integers(0, 24 * 4).map(lambda quarter: quarter * 15))
+
+
+@st.composite
+def intervals(draw):
+    start, end = sorted(draw(st.tuples(minutes, minutes).filter(lambda pair: pair[0] != pair[1])))
+    return minutes_to_time(start), minutes_to_time(end)
+
+
+@st.composite
+def day_schedule(draw):
+    blocks = [
+        AvailabilityBlock(id=block_id, user_id=1, date=DATE, start_time=start, end_time=end)
+        for block_id, (start, end) in enumerate(draw(st.lists(intervals(), min_size=1, max_size=3)), start=1)
+    ]
+    bookings = [
+        Booking(
+            client_user_id=2,
+            consultant_user_id=1,
+            booking_date=draw(st.sampled_from([DATE, DATE + timedelta(days=1)])) + timedelta(hours=draw(st.integers(0, 23))),
+            start_time=start,
+            end_time=end,
+            status=draw(st.sampled_from(['pending', 'confirmed', 'cancelled', 'no_show'])),
+            availability_block_id=draw(st.sampled_from([None] + [block.id for block in blocks]))
+        )
+        for start, end in draw(st.lists(intervals(), max_size=6))
+    ]
+    return blocks, bookings
+
+
+# Giorno precedente (nessun filtro sull'ora) o lo stesso giorno a un minuto qualsiasi
+nows = st.one_of(st.just(DATE - timedelta(days=1)), st.integers(0, 24 * 60 - 1).map(lambda m: DATE + timedelta(minutes=m)))
+
+
+@settings(max_examples=500, deadline=None)
+@given(day_schedule(), nows)
+def test_matches_legacy_slots_for_every_duration(schedule, now):
+    blocks, bookings = schedule
+    by_duration = available_slots_by_duration(blocks, bookings, DATE_STR, now=now)
+    for duration in SLOT_DURATIONS:
+        expected = inside_block(legacy_available_slots(blocks, bookings, duration, DATE_STR, now), blocks)
+        assert by_duration[duration] == expected
+        assert available_slots_by_duration(blocks, bookings, DATE_STR, durations=(duration,), now=now)[duration] == expected
+
+
+def test_slots_stay_inside_their_block():
+    blocks = [
+        AvailabilityBlock(id=1, user_id=1, date=DATE, start_time="09:00", end_time="10:00"),
+        AvailabilityBlock(id=2, user_id=1, date=DATE, start_time="15:00", end_time="17:00"),
+    ]
+    bookings = [Booking(client_user_id=2, consultant_user_id=1, booking_date=DATE, start_time="15:00",
+                        end_time="15:45", status="confirmed", availability_block_id=2)]
+
+    slots = available_slots_by_duration(blocks, bookings, DATE_STR, durations=(60,), now=DATE - timedelta(days=1))[60]
+    assert [(slot['start_time'], slot['availability_block_id']) for slot in slots] == [
+        ("09:00", 1), ("15:45", 2)
+    ]
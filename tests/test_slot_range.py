@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.models import AvailabilityBlock, Booking
+from app.utils.slot_cache import slot_cache
+
+
+def test_range_matches_single_day_endpoint(engine, client, add_users):
+    add_users(1, 2)
+
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=30)
+    with Session(engine) as session:
+        for day in (0, 2, 3):
+            session.add(AvailabilityBlock(user_id=1, date=start + timedelta(days=day), start_time="09:00", end_time="12:00", total_minutes=180))
+        session.add(AvailabilityBlock(user_id=1, date=start + timedelta(days=3), start_time="14:00", end_time="16:00", total_minutes=120))
+        session.add(Booking(client_user_id=2, consultant_user_id=1, booking_date=start + timedelta(days=3, hours=10),
+                            start_time="10:00", end_time="10:45", duration_minutes=45, status="confirmed"))
+        session.commit()
+
+    slot_cache.clear()
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+    first, last = start.strftime('%Y-%m-%d'), (start + timedelta(days=6)).strftime('%Y-%m-%d')
+    response = client.get(f"/api/booking/available-slots/1/range?start={first}&end={last}")
+    assert response.status_code == 200
+    # Consulente + blocchi + regole ricorrenti + prenotazioni del periodo
+    assert len(queries) == 4
+
+    days = response.json()["days"]
+    assert len(days) == 7
+    # Anche l'endpoint del singolo giorno ricalcola dal database
+    slot_cache.clear()
+    for date_str, by_duration in days.items():
+        for duration in (30, 60, 90, 120):
+            single = client.get(f"/api/booking/available-slots/1?date={date_str}&duration={duration}").json()
+            assert by_duration[str(duration)] == single.get("slots", [])
+    assert [slot["start_time"] for slot in days[(start + timedelta(days=3)).strftime('%Y-%m-%d')]["60"]] == [
+        "09:00", "10:45", "14:00", "14:30", "15:00"
+    ]
+
+    assert client.get(f"/api/booking/available-slots/1/range?start={last}&end={first}").status_code == 400
+    assert client.get("/api/booking/available-slots/99/range?start=2030-01-01&end=2030-01-02").status_code == 404
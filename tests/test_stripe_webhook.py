@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.models import Booking, ConsultationOffer
+from app.routes import stripe_webhook
+
+
+@pytest.fixture
+def webhook(monkeypatch, engine, add_users):
+    """Eventi Stripe finti; notifiche e promemoria registrano se girano nell'event loop"""
+    add_users(1, 2)
+    calls = []
+
+    def on_event_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    monkeypatch.setattr(stripe_webhook, "notify_many", lambda type_key, items: calls.append(("notify", on_event_loop(), items[0].related_booking_id)))
+    monkeypatch.setattr(stripe_webhook, "schedule_booking_reminders", lambda **kwargs: calls.append(("reminders", on_event_loop(), kwargs["booking_id"])))
+
+    def send(client, session_id: str, metadata: dict):
+        checkout = {"id": session_id, "payment_intent": f"pi_{session_id}", "metadata": metadata}
+        monkeypatch.setattr(stripe_webhook, "construct_webhook_event", lambda payload, signature: {
+            "type": "checkout.session.completed", "data": {"object": checkout}
+        })
+        return client.post("/webhook/stripe", content=b"{}", headers={"stripe-signature": "t=1,v1=x"})
+
+    return send, calls
+
+
+def _metadata(**fields):
+    return {"client_user_id": "2", "consultant_user_id": "1", "start_time": "10:00", "end_time": "10:30",
+            "duration_minutes": "30", **fields}
+
+
+DAY = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
+
+
+def test_direct_booking_runs_off_the_event_loop(engine, client, webhook):
+    send, calls = webhook
+    metadata = _metadata(booking_type="direct", booking_date=DAY)
+
+    assert send(client, "cs_direct", metadata).status_code == 200
+    # Stesso evento ripetuto da Stripe: nessuna seconda prenotazione
+    assert send(client, "cs_direct", metadata).status_code == 200
+
+    with Session(engine) as session:
+        booking = session.exec(select(Booking)).one()
+    assert (booking.status, booking.payment_status, booking.stripe_payment_intent_id) == ("confirmed", "paid", "pi_cs_direct")
+    assert calls == [("notify", False, booking.id), ("reminders", False, booking.id)]
+
+
+def test_offer_booking_commits_booking_and_offer_together(engine, client, webhook):
+    send, calls = webhook
+    with Session(engine) as session:
+        session.add(ConsultationOffer(id=1, consultant_user_id=1, client_user_id=2, price=40, duration_minutes=30,
+                                      expires_at=datetime.utcnow() + timedelta(days=1)))
+        session.commit()
+
+    commits = []
+    event.listen(engine, "commit", lambda *args: commits.append(1))
+    assert send(client, "cs_offer", _metadata(offer_id="1", selected_date=DAY)).status_code == 200
+
+    with Session(engine) as session:
+        booking = session.exec(select(Booking)).one()
+        offer = session.get(ConsultationOffer, 1)
+    assert (offer.status, offer.booking_id, booking.price) == ("accepted", booking.id, 40)
+    assert len(commits) == 1
+    assert [(name, on_loop) for name, on_loop, _ in calls] == [("notify", False), ("reminders", False)]
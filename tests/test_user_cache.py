@@ -0,0 +1,50 @@
+from sqlalchemy import event, inspect
+from sqlmodel import Session
+
+from app.models import User
+from app.utils import user_cache as cache_module
+from app.utils.user_cache import UserCache
+
+
+def test_user_cache_hits_memory_and_invalidates_on_change(monkeypatch, engine, add_users):
+
+    cache = UserCache(ttl=60, max_size=2)
+    monkeypatch.setattr(cache_module, "user_cache", cache)
+
+    add_users(1, 2, 3)
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+    first = cache.get(1)
+    second = cache.get(1)
+    assert len(queries) == 1
+    assert first.nome == second.nome == "Nome1"
+    # Istanze distinte e detached: le route possono modificarle senza toccare la cache
+    assert first is not second
+    assert inspect(first).detached
+    first.nome = "Modificato"
+    assert cache.get(1).nome == "Nome1"
+    assert cache.get(99) is None
+
+    # Modifica tramite ORM (es. profilo, anonimato): il prossimo accesso rilegge
+    with Session(engine) as session:
+        user = session.get(User, 1)
+        user.is_anonymous = True
+        session.add(user)
+        session.commit()
+    assert cache.get(1).is_anonymous is True
+
+    # Un'istanza della cache può tornare in sessione come un utente caricato
+    cached = cache.get(2)
+    cached.nome = "Aggiornato"
+    with Session(engine) as session:
+        session.add(cached)
+        session.commit()
+    assert cache.get(2).nome == "Aggiornato"
+
+    # Dimensione limitata: l'utente usato meno di recente esce per primo
+    cache.get(3)
+    queries.clear()
+    cache.get(1)
+    assert len(queries) == 1